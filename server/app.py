@@ -1,59 +1,204 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, request, jsonify, current_app, stream_with_context
 from flask_cors import CORS
-# Temporarily remove Flask-Migrate to avoid SQLAlchemy compatibility issues
-# from flask_migrate import Migrate
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from models import db, User, Task, Project, ProjectCollaborator, bcrypt
+from flask_migrate import Migrate
+from flask_jwt_extended import JWTManager, jwt_required
+from sqlalchemy import delete, select
+from models import db, User, Task, Project, ProjectCollaborator, Job, include_object
+from passwords import hasher, HasherBusy
+from serializers import serialize, serialize_many
+from queries import get_or_404, reload, visible_query, filter_tasks
+from permissions import (authorize, authorize_changes, current_user_id, AccessDenied, UnwritableField,
+                         METHOD_ACTIONS, READ, WRITE, MANAGE)
+from pagination import paginate, page_size, InvalidQueryParameter
+from etags import (collection_etag, item_etag, not_modified, check_if_match, finish,
+                   PreconditionFailed)
+from cache import (response_cache, entity_tags, tasks_of, projects_of, project_audience,
+                   invalidate_task, invalidate_tasks, invalidate_project, invalidate_collaborator,
+                   invalidate_user)
+import bulk
+import search
+import stats
+import streaming
+import sync
+import identity
+import events
+import jobs
 from config import Config
+import json_provider
+import database
+from profiling import request_profiler
+from metrics import (request_metrics, pool_collector, cache_collector, scrape_access,
+                     CONTENT_TYPE as METRICS_CONTENT_TYPE)
 import os
-from datetime import datetime, timedelta
-
-app = Flask(__name__)
-app.config.from_object(Config)
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
-app.json.compact = False
-
-# Handle PostgreSQL URL format for Render
-database_url = app.config['SQLALCHEMY_DATABASE_URI']
-if database_url and database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-
-db.init_app(app)
-bcrypt.init_app(app)
-jwt = JWTManager(app)
-# Temporarily remove migrate
-# migrate = Migrate(app, db)
-CORS(app, origins=app.config['CORS_ORIGINS'])
-
-# Initialize database tables for serverless deployment
-def init_db():
-    with app.app_context():
-        try:
-            db.create_all()
-            print("Database tables created successfully")
-            return True
-        except Exception as e:
-            print(f"Database initialization error: {e}")
-            return False
+from datetime import datetime
+
+# Schema changes go through Alembic: `flask --app app db upgrade` (or init_db.py)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+api = Blueprint('api', __name__)
+jwt = JWTManager()
+migrate = Migrate()
+
+def create_app(config=Config):
+    """Build the application from a config object.
+
+    Only wires up configuration, extensions and routes: no connection is
+    opened and no DDL runs until a request or a migration needs it.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    json_provider.init_app(app)
+    
+    # Handle PostgreSQL URL format for Render
+    database_url = app.config['SQLALCHEMY_DATABASE_URI']
+    if database_url and database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    
+    database.init_app(app, db)
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR, include_object=include_object)
+    hasher.init_app(app)
+    response_cache.init_app(app)
+    jwt.init_app(app)
+    identity.user_versions.init_app(app)
+    events.broker.init_app(app)
+    jobs.job_queue.init_app(app)
+    request_profiler.init_app(app)
+    request_metrics.init_app(app, collectors=[pool_collector(lambda: db.engine),
+                                              cache_collector(response_cache)])
+    CORS(app, origins=app.config['CORS_ORIGINS'], expose_headers=['X-Next-Cursor', 'ETag', 'Server-Timing'])
+    app.register_blueprint(api)
+    app.cli.add_command(sync.prune_changes_command)
+    app.cli.add_command(jobs.run_jobs_command)
+    app.cli.add_command(jobs.prune_jobs_command)
+    return app
+
+@api.app_errorhandler(InvalidQueryParameter)
+def invalid_query_parameter(error):
+    return jsonify({'error': str(error)}), 400
+
+@api.app_errorhandler(UnwritableField)
+def unwritable_field(error):
+    return jsonify({'error': str(error)}), 400
+
+@api.app_errorhandler(AccessDenied)
+def access_denied(error):
+    return jsonify({'error': 'Access denied'}), 403
+
+@api.app_errorhandler(HasherBusy)
+def hasher_busy(error):
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@api.app_errorhandler(PreconditionFailed)
+def precondition_failed(error):
+    return jsonify({'error': str(error)}), 412
+
+def paginated_response(model, query, shape, cache_tag=None):
+    """Serialize one page of a collection; the next page's cursor goes in X-Next-Cursor.
+
+    With ``cache_tag`` (the user's list tag) the response goes through the
+    response cache, tagged with the list and every row it embeds. Streamed
+    responses (NDJSON or ``stream=true``) bypass the cache and ETags.
+    """
+    if streaming.requested():
+        return streaming.stream_response(model, query, shape)
+    if cache_tag:
+        cache_key = response_cache.key_for_request(current_user_id())
+        cached = response_cache.get_response(cache_key)
+        if cached:
+            return cached
+        generation = response_cache.generation()
+    etag = collection_etag(model, shape, query, current_user_id())
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    rows, next_cursor = paginate(query, model, request.args)
+    response = jsonify(serialize_many(model, rows, shape))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    finish(response, etag)
+    if cache_tag:
+        response_cache.store(cache_key, response, entity_tags(model, shape, rows) | {cache_tag},
+                             generation)
+    return response
+
+def conditional(model, id, shape):
+    """Evaluate If-None-Match / If-Match for a single resource before loading it.
+
+    Returns ``(etag, response)``: a 304 response when the client's copy is
+    current, otherwise None. Raises PreconditionFailed for a stale If-Match.
+    """
+    if request.method == 'GET':
+        etag = item_etag(model, shape, id, current_user_id())
+        return etag, not_modified(etag)
+    if request.method == 'PATCH' and request.if_match:
+        check_if_match(item_etag(model, shape, id, current_user_id()))
+    return None, None
 
-# Initialize database for serverless deployment
-try:
-    init_db()
-except Exception as e:
-    print(f"Database initialization failed: {e}")
+def item_response(obj, shape, etag=None):
+    """Serialize a single resource with its ETag (recomputed after a write)"""
+    if etag is None:
+        etag = item_etag(type(obj), shape, obj.id, current_user_id())
+    return finish(jsonify(serialize(obj, shape)), etag)
 
 # Health check routes
-@app.route('/', methods=['GET'])
+@api.route('/', methods=['GET'])
 def health_check():
     return jsonify({'message': 'PlanWise Backend API is running!', 'status': 'healthy'}), 200
 
-@app.route('/health', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy'}), 200
+    """Readiness: the database answers a round trip within HEALTH_DB_TIMEOUT_MS"""
+    try:
+        latency_ms = database.ping(db.engine, current_app.config['HEALTH_DB_TIMEOUT_MS'] / 1000)
+    except database.DatabaseUnavailable as e:
+        return jsonify({'status': 'unavailable', 'database': {'ok': False, 'error': str(e)}}), 503
+    return jsonify({'status': 'healthy', 'database': {'ok': True, 'latency_ms': latency_ms}}), 200
+
+@api.route('/metrics', methods=['GET'])
+@scrape_access
+def metrics():
+    return request_metrics.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+
+@api.route('/metrics/password-hashing', methods=['GET'])
+@scrape_access
+def password_hashing_metrics():
+    return jsonify(hasher.stats()), 200
+
+@api.route('/metrics/db-pool', methods=['GET'])
+@scrape_access
+def db_pool_metrics():
+    return jsonify(database.stats(db.engine)), 200
+
+@api.route('/metrics/profiling', methods=['GET'])
+@scrape_access
+def profiling_metrics():
+    return jsonify(request_profiler.stats()), 200
+
+@api.route('/metrics/response-cache', methods=['GET'])
+@scrape_access
+def response_cache_metrics():
+    return jsonify(response_cache.stats()), 200
+
+@api.route('/metrics/user-cache', methods=['GET'])
+@scrape_access
+def user_cache_metrics():
+    return jsonify(identity.user_versions.stats()), 200
+
+@api.route('/metrics/events', methods=['GET'])
+@scrape_access
+def events_metrics():
+    return jsonify(events.broker.stats()), 200
+
+@api.route('/metrics/jobs', methods=['GET'])
+@scrape_access
+def jobs_metrics():
+    return jsonify(jobs.job_queue.stats()), 200
 
 # Authentication routes
-@app.route('/auth/signup', methods=['POST'])
+@api.route('/auth/signup', methods=['POST'])
 def signup():
     data = request.get_json()
     
@@ -79,19 +224,19 @@ def signup():
         db.session.add(user)
         db.session.commit()
         
-        # Create access token
-        access_token = create_access_token(identity=str(user.id))
-        
         return jsonify({
             'message': 'User created successfully',
-            'access_token': access_token,
-            'user': user.to_dict()
+            'access_token': identity.access_token(user),
+            'refresh_token': identity.refresh_token(user),
+            'user': serialize(user)
         }), 201
         
+    except HasherBusy:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
-@app.route('/auth/login', methods=['POST'])
+@api.route('/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
     
@@ -106,136 +251,201 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
     
-    # Create access token
-    access_token = create_access_token(identity=str(user.id))
+    # Upgrade the stored hash when the configured work factor has changed
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.commit()
     
     return jsonify({
         'message': 'Login successful',
-        'access_token': access_token,
-        'user': user.to_dict()
+        'access_token': identity.access_token(user),
+        'refresh_token': identity.refresh_token(user),
+        'user': serialize(user)
     }), 200
 
-@app.route('/auth/me', methods=['GET'])
+@api.route('/auth/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    """A new access token, with current claims, for a refresh token"""
+    user = db.session.get(User, current_user_id())
+    if not user:
+        return jsonify({'error': 'User not found'}), 401
+    return jsonify({'access_token': identity.access_token(user)}), 200
+
+@api.route('/auth/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    current_user_id = int(get_jwt_identity())
-    user = User.query.get(current_user_id)
+    # From the token's claims while they are current; see identity.py
+    user = identity.current_user()
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    return jsonify({'user': user.to_dict()}), 200
+    return jsonify({'user': user}), 200
 
 # User routes
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
 @jwt_required()
 def users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    return paginated_response(User, visible_query(User), 'detail')
 
-@app.route('/users/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
+@api.route('/users/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
 @jwt_required()
 def user_by_id(id):
-    user = User.query.get_or_404(id)
+    authorize(METHOD_ACTIONS[request.method], User, id)
+    if request.method == 'DELETE':
+        # Everything the user owns goes too, which can take minutes: a job does
+        # it, and asking again returns the same job. Ids can be reused, so the
+        # key names this row, not whichever user holds the id later.
+        created_at = db.session.scalar(select(User.created_at).where(User.id == id))
+        job = jobs.job_queue.enqueue('delete-user', {'user_id': id}, key=f'delete-user:{id}:{created_at}',
+                                     created_by=current_user_id())
+        return jobs.accepted(job)
+    etag, cached = conditional(User, id, 'with-relations')
+    if cached:
+        return cached
+    user = get_or_404(User, id, 'with-relations')
     
     if request.method == 'GET':
-        return jsonify(user.to_dict())
+        return item_response(user, 'with-relations', etag)
     
     elif request.method == 'PATCH':
         data = request.get_json()
+        authorize_changes(User, id, data)
         try:
             for key, value in data.items():
-                if hasattr(user, key):
-                    setattr(user, key, value)
+                setattr(user, key, value)
             user.updated_at = datetime.utcnow()
+            # Tokens issued before this edit carry stale claims
+            user.version = User.version + 1
             db.session.commit()
-            return jsonify(user.to_dict())
+            invalidate_user(id)
+            user = reload(User, id, 'with-relations')
+            identity.user_versions.put(id, user.version)
+            return item_response(user, 'with-relations')
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
-    
-    elif request.method == 'DELETE':
-        db.session.delete(user)
-        db.session.commit()
-        return '', 204
 
 # Task routes
-@app.route('/tasks', methods=['GET', 'POST'])
+@api.route('/tasks', methods=['GET', 'POST'])
 @jwt_required()
 def tasks():
-    current_user_id = int(get_jwt_identity())
-    
     if request.method == 'GET':
         # Get tasks assigned to current user
-        tasks = Task.query.filter_by(user_id=current_user_id).all()
-        return jsonify([task.to_dict() for task in tasks])
+        query = filter_tasks(visible_query(Task, 'with-relations'), request.args)
+        return paginated_response(Task, query, 'with-relations', tasks_of(current_user_id()))
     
     elif request.method == 'POST':
         data = request.get_json()
+        if data.get('project_id') is not None:
+            authorize(WRITE, Project, data['project_id'])
         try:
             task = Task(
                 title=data['title'],
                 description=data.get('description', ''),
                 status=data.get('status', 'pending'),
                 priority=data.get('priority', 'medium'),
-                user_id=current_user_id,  # Assign to current user
+                user_id=current_user_id(),  # Assign to current user
                 project_id=data.get('project_id'),
                 due_date=datetime.fromisoformat(data['due_date']) if data.get('due_date') else None
             )
             db.session.add(task)
             db.session.commit()
-            return jsonify(task.to_dict()), 201
+            invalidate_task(task.id, task.user_id, task.project_id)
+            events.broker.publish('task', 'created', task.id, (task.project_id,), (task.user_id,),
+                                  project_id=task.project_id)
+            return jsonify(serialize(reload(Task, task.id, 'with-relations'), 'with-relations')), 201
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
 
-@app.route('/tasks/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
+@api.route('/tasks/bulk', methods=['POST'])
+@jwt_required()
+def tasks_bulk():
+    data = request.get_json()
+    try:
+        # A body that isn't an object has no operations list, and is rejected with it
+        operations = data.get('operations') if isinstance(data, dict) else None
+        planned = bulk.validate(operations, current_user_id(),
+                                current_app.config['BULK_MAX_OPERATIONS'])
+    except bulk.BulkValidationError as e:
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    try:
+        results = bulk.apply(planned, current_user_id())
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    invalidate_tasks([result['id'] for result in results], current_user_id(),
+                     {values.get('project_id') for _, _, _, values, _ in planned if values})
+    # As the single-task routes do, one message per task
+    for result, (_, op, _, values, current) in zip(results, planned):
+        if op == bulk.CREATE:
+            project_id = values.get('project_id')
+            events.broker.publish('task', 'created', result['id'], (project_id,), (current_user_id(),),
+                                  project_id=project_id)
+            continue
+        assignee_id, old_project_id = current
+        if op == bulk.UPDATE:
+            project_id = values.get('project_id', old_project_id)
+            events.broker.publish('task', 'updated', result['id'], (old_project_id, project_id), (assignee_id,),
+                                  project_id=project_id)
+        else:
+            events.broker.publish('task', 'deleted', result['id'], (old_project_id,), (assignee_id,),
+                                  project_id=old_project_id)
+    return jsonify({'results': results}), 200
+
+@api.route('/tasks/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
 @jwt_required()
 def task_by_id(id):
-    current_user_id = int(get_jwt_identity())
-    task = Task.query.get_or_404(id)
-    
-    # Check if user owns this task
-    if task.user_id != current_user_id:
-        return jsonify({'error': 'Access denied'}), 403
+    authorize(METHOD_ACTIONS[request.method], Task, id)
+    etag, cached = conditional(Task, id, 'with-relations')
+    if cached:
+        return cached
+    task = get_or_404(Task, id, 'with-relations')
     
     if request.method == 'GET':
-        return jsonify(task.to_dict())
+        return item_response(task, 'with-relations', etag)
     
     elif request.method == 'PATCH':
         data = request.get_json()
+        authorize_changes(Task, id, data)
+        if data.get('project_id') is not None:
+            authorize(WRITE, Project, data['project_id'])
+        old_user_id, old_project_id = task.user_id, task.project_id
         try:
             for key, value in data.items():
                 if key == 'due_date' and value:
                     setattr(task, key, datetime.fromisoformat(value))
-                elif hasattr(task, key):
+                else:
                     setattr(task, key, value)
             task.updated_at = datetime.utcnow()
             db.session.commit()
-            return jsonify(task.to_dict())
+            invalidate_task(id, task.user_id, task.project_id)
+            # Moved or reassigned tasks also reach whoever saw them before
+            events.broker.publish('task', 'updated', id, (old_project_id, task.project_id),
+                                  (old_user_id, task.user_id), project_id=task.project_id)
+            return item_response(reload(Task, id, 'with-relations'), 'with-relations')
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
     
     elif request.method == 'DELETE':
+        assignee_id, project_id = task.user_id, task.project_id
         db.session.delete(task)
         db.session.commit()
+        invalidate_task(id, assignee_id, project_id)
+        events.broker.publish('task', 'deleted', id, (project_id,), (assignee_id,), project_id=project_id)
         return '', 204
 
 # Project routes
-@app.route('/projects', methods=['GET', 'POST'])
+@api.route('/projects', methods=['GET', 'POST'])
 @jwt_required()
 def projects():
-    current_user_id = int(get_jwt_identity())
-    
     if request.method == 'GET':
         # Get projects owned by current user or where they are a collaborator
-        owned_projects = Project.query.filter_by(owner_id=current_user_id).all()
-        collaborated_projects = Project.query.join(ProjectCollaborator).filter_by(user_id=current_user_id).all()
-        
-        # Combine and remove duplicates
-        all_projects = list(set(owned_projects + collaborated_projects))
-        return jsonify([project.to_dict() for project in all_projects])
+        return paginated_response(Project, visible_query(Project, 'with-relations'), 'with-relations',
+                                  projects_of(current_user_id()))
     
     elif request.method == 'POST':
         data = request.get_json()
@@ -243,59 +453,141 @@ def projects():
             project = Project(
                 title=data['title'],
                 description=data.get('description', ''),
-                owner_id=current_user_id  # Use current user as owner
+                owner_id=current_user_id()  # Use current user as owner
             )
             db.session.add(project)
             db.session.commit()
-            return jsonify(project.to_dict()), 201
+            invalidate_project(project.id, {project.owner_id})
+            events.broker.publish('project', 'created', project.id, users=(project.owner_id,))
+            return jsonify(serialize(reload(Project, project.id, 'with-relations'), 'with-relations')), 201
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
 
-@app.route('/projects/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
+@api.route('/projects/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
 @jwt_required()
 def project_by_id(id):
-    current_user_id = int(get_jwt_identity())
-    project = Project.query.get_or_404(id)
-    
-    # Check if user has access to this project (owner or collaborator)
-    is_owner = project.owner_id == current_user_id
-    is_collaborator = ProjectCollaborator.query.filter_by(user_id=current_user_id, project_id=id).first() is not None
-    
-    if not (is_owner or is_collaborator):
-        return jsonify({'error': 'Access denied'}), 403
+    # Owner or collaborator, with the action allowed by their role
+    authorize(METHOD_ACTIONS[request.method], Project, id)
+    if request.method == 'DELETE':
+        audience = project_audience(id)
+        # A statement per table, without loading the rows: a project's tasks
+        # are unbounded. Children first, as the ORM cascade went, so the
+        # change log triggers still find the project and log the same rows.
+        db.session.execute(delete(Task).where(Task.project_id == id))
+        db.session.execute(delete(ProjectCollaborator).where(ProjectCollaborator.project_id == id))
+        db.session.execute(delete(Project).where(Project.id == id))
+        db.session.commit()
+        # Its tasks are deleted with it and carry the project's tag
+        invalidate_project(id, audience)
+        # One message covers the tasks deleted with it
+        events.broker.publish('project', 'deleted', id, (id,))
+        return '', 204
+    etag, cached = conditional(Project, id, 'with-relations')
+    if cached:
+        return cached
+    project = get_or_404(Project, id, 'with-relations')
     
     if request.method == 'GET':
-        return jsonify(project.to_dict())
+        return item_response(project, 'with-relations', etag)
     
     elif request.method == 'PATCH':
         data = request.get_json()
+        authorize_changes(Project, id, data)
+        audience = project_audience(id)
+        old_owner_id = project.owner_id
         try:
             for key, value in data.items():
-                if hasattr(project, key):
-                    setattr(project, key, value)
+                setattr(project, key, value)
             project.updated_at = datetime.utcnow()
             db.session.commit()
-            return jsonify(project.to_dict())
+            # The owner may have changed, so both old and new audiences
+            invalidate_project(id, audience | {project.owner_id})
+            # A new owner starts hearing about the project, the old one may stop
+            owners = (old_owner_id, project.owner_id) if project.owner_id != old_owner_id else ()
+            events.broker.publish('project', 'updated', id, (id,), owners)
+            return item_response(reload(Project, id, 'with-relations'), 'with-relations')
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
-    
-    elif request.method == 'DELETE':
-        db.session.delete(project)
-        db.session.commit()
-        return '', 204
+
+@api.route('/search', methods=['GET'])
+@jwt_required()
+def search_route():
+    """Ranked full-text search over the tasks and projects the user can read"""
+    results, next_cursor = search.search(
+        request.args.get('q'), current_user_id(), page_size(request.args),
+        types=search.parse_types(request.args.get('type')), cursor=request.args.get('cursor'),
+    )
+    response = jsonify([search.result(*row) for row in results])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+@api.route('/sync', methods=['GET'])
+@jwt_required()
+def sync_route():
+    """Tasks, projects and collaborators changed since the ``since`` token, and the next token"""
+    since = request.args.get('since')
+    if not since:
+        return jsonify({'token': sync.head()}), 200
+    try:
+        return jsonify(sync.changes_since(since, current_user_id(), page_size(request.args))), 200
+    except sync.TokenExpired as e:
+        return jsonify({'error': str(e)}), 410
+
+@api.route('/events', methods=['GET'])
+@jwt_required()
+def events_route():
+    """Server-Sent Events: a message for each change to the caller's tasks and projects"""
+    user_id = current_user_id()
+
+    def load_projects():
+        projects = db.session.scalars(events.projects_query(user_id)).all()
+        # Give the connection back: the stream may stay open for hours
+        db.session.close()
+        return projects
+
+    subscriber = events.broker.subscribe(user_id, load_projects()) if events.broker.enabled else None
+    if subscriber is None:
+        return events.unavailable()
+    response = events.stream_response(stream_with_context(events.stream(subscriber, load_projects)))
+    # The stream's own cleanup doesn't run if it never starts
+    response.call_on_close(lambda: events.broker.unsubscribe(subscriber))
+    return response
+
+@api.route('/jobs/<int:id>', methods=['GET'])
+@jwt_required()
+def job_by_id(id):
+    """Status, progress and result of a job the caller started"""
+    job = db.session.get(Job, id)
+    if not job or job.created_by != current_user_id():
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job': jobs.describe(jobs.job_queue.resume(job))}), 200
+
+@api.route('/stats', methods=['GET'])
+@jwt_required()
+def dashboard_stats():
+    # Counts for the dashboard, so clients don't download every task to add them up
+    return jsonify(stats.user_stats(current_user_id(), page_size(request.args))), 200
+
+@api.route('/projects/<int:id>/stats', methods=['GET'])
+@jwt_required()
+def project_stats(id):
+    authorize(READ, Project, id)
+    return jsonify(stats.project_stats(id)), 200
 
 # Project collaborator routes
-@app.route('/project-collaborators', methods=['GET', 'POST'])
+@api.route('/project-collaborators', methods=['GET', 'POST'])
 @jwt_required()
 def project_collaborators():
     if request.method == 'GET':
-        collaborators = ProjectCollaborator.query.all()
-        return jsonify([collab.to_dict() for collab in collaborators])
+        return paginated_response(ProjectCollaborator, visible_query(ProjectCollaborator, 'with-relations'), 'with-relations')
     
     elif request.method == 'POST':
         data = request.get_json()
+        if data.get('project_id') is not None:
+            authorize(MANAGE, Project, data['project_id'])
         try:
             collaborator = ProjectCollaborator(
                 user_id=data['user_id'],
@@ -304,38 +596,61 @@ def project_collaborators():
             )
             db.session.add(collaborator)
             db.session.commit()
-            return jsonify(collaborator.to_dict()), 201
+            invalidate_collaborator(collaborator.user_id, collaborator.project_id)
+            events.broker.publish('collaborator', 'created', collaborator.id, (collaborator.project_id,),
+                                  (collaborator.user_id,), project_id=collaborator.project_id,
+                                  user_id=collaborator.user_id)
+            return jsonify(serialize(reload(ProjectCollaborator, collaborator.id, 'with-relations'), 'with-relations')), 201
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
 
-@app.route('/project-collaborators/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
+@api.route('/project-collaborators/<int:id>', methods=['GET', 'PATCH', 'DELETE'])
 @jwt_required()
 def project_collaborator_by_id(id):
-    collaborator = ProjectCollaborator.query.get_or_404(id)
+    authorize(METHOD_ACTIONS[request.method], ProjectCollaborator, id)
+    etag, cached = conditional(ProjectCollaborator, id, 'with-relations')
+    if cached:
+        return cached
+    collaborator = get_or_404(ProjectCollaborator, id, 'with-relations')
     
     if request.method == 'GET':
-        return jsonify(collaborator.to_dict())
+        return item_response(collaborator, 'with-relations', etag)
     
     elif request.method == 'PATCH':
         data = request.get_json()
+        authorize_changes(ProjectCollaborator, id, data)
+        if data.get('project_id') is not None:
+            authorize(MANAGE, Project, data['project_id'])
+        old_user_id, old_project_id = collaborator.user_id, collaborator.project_id
         try:
             for key, value in data.items():
-                if hasattr(collaborator, key):
-                    setattr(collaborator, key, value)
+                setattr(collaborator, key, value)
             collaborator.updated_at = datetime.utcnow()
             db.session.commit()
-            return jsonify(collaborator.to_dict())
+            invalidate_collaborator(old_user_id, old_project_id)
+            invalidate_collaborator(collaborator.user_id, collaborator.project_id)
+            events.broker.publish('collaborator', 'updated', id, (old_project_id, collaborator.project_id),
+                                  (old_user_id, collaborator.user_id), project_id=collaborator.project_id,
+                                  user_id=collaborator.user_id)
+            return item_response(reload(ProjectCollaborator, id, 'with-relations'), 'with-relations')
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
     
     elif request.method == 'DELETE':
+        user_id, project_id = collaborator.user_id, collaborator.project_id
         db.session.delete(collaborator)
         db.session.commit()
+        invalidate_collaborator(user_id, project_id)
+        events.broker.publish('collaborator', 'deleted', id, (project_id,), (user_id,),
+                              project_id=project_id, user_id=user_id)
         return '', 204
 
 
+# WSGI entry point for gunicorn (app:app) and Vercel
+app = create_app()
+
 # For local development
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5555))
@@ -1,15 +1,18 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-from models import db, User, Task, Project, ProjectCollaborator, bcrypt
+from models import db, User, Task, Project, ProjectCollaborator
+from passwords import hasher
 from config import Config
+import json_provider
+import database
 import os
 from datetime import datetime, timedelta
 
 app = Flask(__name__)
 app.config.from_object(Config)
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
-app.json.compact = False
+json_provider.init_app(app)
 
 # Handle PostgreSQL URL format for Render
 database_url = app.config['SQLALCHEMY_DATABASE_URI']
@@ -17,19 +20,12 @@ if database_url and database_url.startswith('postgres://'):
     database_url = database_url.replace('postgres://', 'postgresql://', 1)
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 
-db.init_app(app)
-bcrypt.init_app(app)
+database.init_app(app, db)
+hasher.init_app(app)
 jwt = JWTManager(app)
 CORS(app, origins=app.config['CORS_ORIGINS'])
 
-# Create tables (only if tables don't exist)
-with app.app_context():
-    try:
-        db.create_all()
-        print("Database tables created successfully")
-    except Exception as e:
-        print(f"Database initialization error: {e}")
-        # Don't fail if tables already exist
+# Tables come from the Alembic migrations (init_db.py), not from import time
 
 @app.route('/', methods=['GET'])
 def health_check():
@@ -0,0 +1,223 @@
+"""
+ASGI entry point: the same API, with the read-heavy routes served by coroutines.
+
+    uvicorn asgi:app
+    GUNICORN_WORKER_CLASS=uvicorn gunicorn -c gunicorn.conf.py asgi:app
+
+``GET /tasks``, ``GET /projects`` and ``GET /auth/me`` run on the event loop
+with async SQLAlchemy (asyncpg on PostgreSQL, aiosqlite on SQLite; see
+``database.async_url()``), so one worker keeps serving other requests while
+these wait on the database. They build the same statements as the Flask
+routes (``queries``, ``pagination``, ``etags``) and answer with the same
+bodies, cursors, ETags and errors.
+
+Each one runs inside a Flask request context with the app's own request
+hooks and error handlers, so authentication, CORS, /metrics and
+Server-Timing behave as they do in Flask. A sampled profile of an async
+request also includes whatever else the event loop ran meanwhile.
+
+``GET /events`` streams from the event loop as well (events.py): an idle
+stream costs a coroutine, not one of the Flask threads, so a worker can
+hold many of them.
+
+Everything else goes to the Flask app, on ``ASGI_FLASK_THREADS`` threads
+per worker: writes, other routes, ``HEAD``, and streamed collections. The
+async routes skip the response cache, whose Redis backend would block the
+event loop; ``If-None-Match`` still answers with 304 after one aggregate
+statement.
+"""
+
+import asyncio
+import inspect
+import io
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import database
+import events
+import streaming
+from app import app as flask_app
+from etags import finish, not_modified, request_etag, watermark_query
+from identity import UNKNOWN, claimed_user, user_versions, version_query
+from models import User, Task, Project
+from pagination import order, page_size, split_page
+from permissions import current_user_id
+from queries import filter_tasks, visible_select
+from serializers import serialize, serialize_many
+
+
+def _start(status, headers):
+    return {'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]}
+
+
+class AsyncAPI:
+    """Serves ``routes`` (path -> coroutine) for GET requests; hands the rest to the Flask app"""
+
+    def __init__(self, flask_app, routes):
+        self.flask_app = flask_app
+        self.routes = routes
+        self.wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_FLASK_THREADS'])
+        self.engine = None
+        self._sessions = None
+
+    def session(self):
+        """A new AsyncSession; the engine and its pool are created on first use, in the worker"""
+        if self._sessions is None:
+            config = self.flask_app.config
+            self.engine = create_async_engine(database.async_url(config['SQLALCHEMY_DATABASE_URI']),
+                                              **database.async_engine_options(config))
+            database.enforce_foreign_keys(self.engine.sync_engine)
+            self._sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        return self._sessions()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        handler = self.routes.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+        environ = build_environ(scope, io.BytesIO())
+        response = await self._dispatch(handler, environ)
+        if response is None:
+            return await self.wsgi(scope, receive, send)
+        if inspect.isasyncgen(response.response):
+            return await self._stream(response, environ, receive, send)
+        body, status, headers = response.get_wsgi_response(environ)
+        try:
+            await send(_start(status, headers))
+            await send({'type': 'http.response.body', 'body': b''.join(body)})
+        finally:
+            response.close()
+
+    async def _stream(self, response, environ, receive, send):
+        """Send a response whose body is an async generator, until it ends or the client goes"""
+        body = response.response
+        headers = response.get_wsgi_headers(environ)
+
+        async def forward():
+            async for chunk in body:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        await send(_start(response.status, headers.to_wsgi_list()))
+        tasks = [asyncio.ensure_future(forward()), asyncio.ensure_future(disconnected())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await body.aclose()
+
+    async def _dispatch(self, handler, environ):
+        """Run ``handler`` the way Flask runs a view; None when Flask should serve the request"""
+        app = self.flask_app
+        with app.request_context(environ):
+            if streaming.requested():
+                return None
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    verify_jwt_in_request()
+                    rv = await handler(self)
+            except Exception as e:
+                try:
+                    rv = app.handle_user_exception(e)
+                except Exception as unhandled:
+                    rv = app.handle_exception(unhandled)
+            return app.process_response(app.make_response(rv))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def paginated_response(self, model, query, shape):
+        """Async ``app.paginated_response()`` for a ``select()``, without the response cache"""
+        ids = select(model.id).where(query.whereclause).scalar_subquery()
+        async with self.session() as session:
+            etag = request_etag(current_user_id(),
+                                tuple((await session.execute(watermark_query(model, shape, ids))).one()))
+            cached = not_modified(etag)
+            if cached:
+                return cached
+            limit = page_size(request.args)
+            query, sort, key = order(query, model, request.args)
+            rows, next_cursor = split_page((await session.scalars(query.limit(limit + 1))).unique().all(),
+                                           limit, sort, key)
+            response = jsonify(serialize_many(model, rows, shape))
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return finish(response, etag)
+
+
+async def tasks(api):
+    query = filter_tasks(visible_select(Task, 'with-relations'), request.args)
+    return await api.paginated_response(Task, query, 'with-relations')
+
+
+async def projects(api):
+    return await api.paginated_response(Project, visible_select(Project, 'with-relations'), 'with-relations')
+
+
+async def current_user(api):
+    """Async ``identity.current_user()``: from the token's claims while they are current"""
+    user_id = current_user_id()
+    version = user_versions.get(user_id)
+    async with api.session() as session:
+        if version is UNKNOWN:
+            version = await session.scalar(version_query(user_id))
+            user_versions.put(user_id, version)
+        user = claimed_user(get_jwt(), version)
+        if user is None and version is not None:
+            found = await session.get(User, user_id)
+            user = serialize(found) if found else None
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify({'user': user}), 200
+
+
+async def event_stream(api):
+    """Async ``GET /events``: an idle stream waits on the event loop instead of holding a thread"""
+    user_id = current_user_id()
+    if not events.broker.enabled:
+        return events.unavailable()
+
+    async def load_projects():
+        async with api.session() as session:
+            return (await session.scalars(events.projects_query(user_id))).all()
+
+    # The first subscription in a process waits for the LISTEN connection:
+    # on a thread, not on the event loop every other request shares
+    subscriber = await asyncio.to_thread(events.broker.subscribe, user_id, await load_projects(),
+                                         events.AsyncSubscriber, loop=asyncio.get_running_loop())
+    if subscriber is None:
+        return events.unavailable()
+    return events.stream_response(events.async_stream(subscriber, load_projects))
+
+
+ROUTES = {
+    '/tasks': tasks,
+    '/projects': projects,
+    '/auth/me': current_user,
+    '/events': event_stream,
+}
+
+# ASGI entry point for uvicorn (asgi:app)
+app = AsyncAPI(flask_app, ROUTES)
@@ -0,0 +1 @@
+"""Benchmark scripts. Run from the server directory: python -m benchmarks.<name>"""
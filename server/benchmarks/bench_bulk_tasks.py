@@ -0,0 +1,90 @@
+"""
+Throughput of POST /tasks/bulk against one request per task.
+
+    python -m benchmarks.bench_bulk_tasks [--tasks 1000] [--batch 500]
+
+Creates, then updates, then deletes the same number of tasks both ways and
+reports tasks per second for each phase. Every one-by-one request commits
+its own transaction; every bulk request commits once.
+"""
+
+import argparse
+import time
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import app, reset_database, seed_bulk
+from models import Task
+
+
+def one_by_one(client, headers, count):
+    timings = {}
+    start = time.perf_counter()
+    ids = [client.post('/tasks', headers=headers, json={'title': f'Single {i}', 'project_id': 10}).json['id']
+           for i in range(count)]
+    timings['create'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for task_id in ids:
+        client.patch(f'/tasks/{task_id}', headers=headers, json={'status': 'completed'})
+    timings['update'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for task_id in ids:
+        client.delete(f'/tasks/{task_id}', headers=headers)
+    timings['delete'] = time.perf_counter() - start
+    return timings
+
+
+def batched(client, headers, count, batch):
+    def run(operations):
+        results = []
+        for offset in range(0, len(operations), batch):
+            response = client.post('/tasks/bulk', headers=headers,
+                                   json={'operations': operations[offset:offset + batch]})
+            results.extend(response.json['results'])
+        return results
+
+    timings = {}
+    start = time.perf_counter()
+    results = run([{'op': 'create', 'data': {'title': f'Bulk {i}', 'project_id': 10}} for i in range(count)])
+    ids = [result['id'] for result in results]
+    timings['create'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run([{'op': 'update', 'id': task_id, 'data': {'status': 'completed'}} for task_id in ids])
+    timings['update'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    run([{'op': 'delete', 'id': task_id} for task_id in ids])
+    timings['delete'] = time.perf_counter() - start
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(tasks=0)
+        token = create_access_token(identity='1')
+        baseline = Task.query.count()
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    print(f'{args.tasks} tasks, bulk batch size {args.batch} ({app.config["SQLALCHEMY_DATABASE_URI"]})')
+    print(f'{"mode":<12} {"create/s":>10} {"update/s":>10} {"delete/s":>10}')
+    for name, timings in (('one-by-one', one_by_one(client, headers, args.tasks)),
+                          ('bulk', batched(client, headers, args.tasks, args.batch))):
+        print(f'{name:<12} ' + ' '.join(f'{args.tasks / timings[phase]:>10.0f}'
+                                        for phase in ('create', 'update', 'delete')))
+
+    with app.app_context():
+        assert Task.query.count() == baseline, 'benchmark left tasks behind'
+
+
+if __name__ == '__main__':
+    main()
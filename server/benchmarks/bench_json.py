@@ -0,0 +1,74 @@
+"""
+Compare JSON encoders on the GET /projects payload: encode time and bytes on the wire.
+
+    python -m benchmarks.bench_json [--tasks 10000] [--repeat 20]
+
+The payload is user 1's first page of projects in the 'with-relations'
+shape, serialized exactly as the route does. The baseline is Flask's default
+provider with indented output, which is what every response used before.
+"""
+
+import argparse
+import gzip
+import time
+
+from flask.json.provider import DefaultJSONProvider
+
+from benchmarks.common import app, reset_database, seed_bulk
+from json_provider import BACKENDS, JSONProvider, _installed
+from models import Project
+from pagination import paginate
+from queries import visible_query
+from serializers import serialize_many
+
+SHAPE = 'with-relations'
+
+
+def build_payload():
+    query = visible_query(Project, SHAPE, user_id=1)
+    with app.test_request_context('/projects'):
+        rows, _ = paginate(query, Project, {})
+    return serialize_many(Project, rows, SHAPE)
+
+
+def best_time(encode, payload, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(payload)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=args.tasks)
+        payload = build_payload()
+
+        baseline = DefaultJSONProvider(app)
+        encoders = [('flask default, indented', lambda obj: baseline.dumps(obj, indent=2).encode('utf-8'))]
+        for backend in BACKENDS:
+            if not _installed(backend):
+                print(f'{backend}: not installed, skipped')
+                continue
+            for compact in (False, True):
+                provider = JSONProvider(app, backend, compact)
+                encoders.append((f'{backend}, {"compact" if compact else "indented"}', provider.encoder()))
+
+    print(f'{len(payload)} projects, {sum(len(p["tasks"]) for p in payload)} nested tasks')
+    print(f'{"encoder":<26} {"encode ms":>10} {"bytes":>10} {"gzip bytes":>11}')
+    for label, encode in encoders:
+        body = encode(payload)
+        elapsed = best_time(encode, payload, args.repeat)
+        print(f'{label:<26} {elapsed * 1000:>10.2f} {len(body):>10} {len(gzip.compress(body)):>11}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Login throughput at several password hashing pool sizes.
+
+    python -m benchmarks.bench_password_hashing [--pools 0,1,2,4] [--clients 8] [--logins 64]
+
+Concurrent clients call POST /auth/login through the Flask test client, one
+thread each, while the hasher runs with each pool size in turn (0 = hash
+inline on the request thread).
+"""
+
+import argparse
+import threading
+import time
+
+from benchmarks.common import app, db, reset_database
+from models import User
+from passwords import hasher
+
+PASSWORD = 'benchmark-password'
+
+
+def run_logins(clients, logins):
+    per_client = logins // clients
+    failures = []
+
+    def client_loop(index):
+        client = app.test_client()
+        for _ in range(per_client):
+            response = client.post('/auth/login', json={'username': f'login{index}', 'password': PASSWORD})
+            if response.status_code != 200:
+                failures.append(response.status_code)
+
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_client * clients, time.perf_counter() - start, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pools', default='0,1,2,4', help='comma-separated pool sizes')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt work factor')
+    args = parser.parse_args()
+
+    hasher.configure(rounds=args.rounds, workers=0, max_pending=max(args.clients, 32))
+    with app.app_context():
+        reset_database()
+        for index in range(args.clients):
+            user = User(username=f'login{index}', email=f'login{index}@example.com')
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+
+    print(f'{args.logins} logins from {args.clients} clients, bcrypt rounds={args.rounds}')
+    print(f'{"pool":>6} {"logins/s":>10} {"avg ms":>8} {"avg wait ms":>12} {"rejected":>9}')
+    for workers in (int(size) for size in args.pools.split(',')):
+        hasher.configure(workers=workers)
+        # Warm the pool so process start-up is not measured
+        if workers:
+            for _ in range(workers):
+                hasher.hash('warm-up')
+        before = hasher.stats()
+        total, elapsed, failures = run_logins(args.clients, args.logins)
+        after = hasher.stats()
+        completed = after['completed'] - before['completed']
+        waited = after['avg_wait_ms'] * after['completed'] - before['avg_wait_ms'] * before['completed']
+        print(f'{workers:>6} {total / elapsed:>10.1f} {elapsed / total * 1000 * args.clients:>8.1f} '
+              f'{waited / completed if completed else 0:>12.2f} {len(failures):>9}')
+    hasher.shutdown()
+
+
+if __name__ == '__main__':
+    main()
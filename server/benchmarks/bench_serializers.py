@@ -0,0 +1,84 @@
+"""
+Compare SerializerMixin.to_dict() with the precompiled serializers.
+
+    python -m benchmarks.bench_serializers [--tasks 10000] [--repeat 3]
+
+Both serializers run over the same rows, loaded with the eager-loading
+options of the 'with-relations' shape. Anything to_dict() needs beyond that
+is lazy loaded, exactly as it was in the request handlers.
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from benchmarks.common import app, db, reset_database, seed_bulk
+from models import Task
+from serializers import get_serializer
+
+SHAPE = 'with-relations'
+
+
+def load_tasks():
+    db.session.expunge_all()
+    serializer = get_serializer(Task, SHAPE)
+    return Task.query.options(*serializer.loader_options()).all()
+
+
+def run_to_dict(tasks):
+    return [task.to_dict() for task in tasks]
+
+
+def run_compiled(tasks):
+    return get_serializer(Task, SHAPE).many(tasks)
+
+
+def measure_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        tasks = load_tasks()
+        gc.collect()
+        start = time.perf_counter()
+        fn(tasks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_allocations(fn):
+    tasks = load_tasks()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = fn(tasks)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    del result
+    return blocks, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(tasks=args.tasks)
+
+        print(f'Serializing {args.tasks} tasks ({SHAPE}), best of {args.repeat}')
+        print(f'{"serializer":<12} {"total ms":>10} {"us/row":>10} {"blocks/row":>12} {"peak KiB":>10}')
+        for name, fn in (('to_dict', run_to_dict), ('compiled', run_compiled)):
+            elapsed = measure_time(fn, args.repeat)
+            blocks, peak = measure_allocations(fn)
+            print(f'{name:<12} {elapsed * 1000:>10.1f} {elapsed / args.tasks * 1e6:>10.2f} '
+                  f'{blocks / args.tasks:>12.2f} {peak / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Measure cold start: import to first response, in fresh interpreter processes.
+
+    python -m benchmarks.bench_startup [--runs 5]
+
+Each run starts a new Python process that imports the app, builds it with
+create_app() and serves GET / and then GET /users (the first request
+that needs a database connection). The "create_all at startup" row adds the
+db.create_all() call every import used to make, for comparison. Point
+DATABASE_URL at a remote PostgreSQL to see the round trips it costs there.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STEPS = ('import', 'create_app', 'create_all', 'first_response', 'first_db_response')
+
+
+def child(create_all):
+    start = time.perf_counter()
+    marks = {}
+
+    from app import create_app
+    from models import db
+    from flask_jwt_extended import create_access_token
+    marks['import'] = time.perf_counter()
+
+    app = create_app()
+    marks['create_app'] = time.perf_counter()
+
+    if create_all:
+        with app.app_context():
+            db.create_all()
+    marks['create_all'] = time.perf_counter()
+
+    client = app.test_client()
+    assert client.get('/').status_code == 200
+    marks['first_response'] = time.perf_counter()
+
+    with app.app_context():
+        token = create_access_token(identity='1')
+    status = client.get('/users?limit=1', headers={'Authorization': f'Bearer {token}'}).status_code
+    assert status == 200, status
+    marks['first_db_response'] = time.perf_counter()
+
+    print(json.dumps({step: (marks[step] - start) * 1000 for step in STEPS}))
+
+
+def run(create_all):
+    env = dict(os.environ)
+    command = [sys.executable, '-m', 'benchmarks.bench_startup', '--child']
+    if create_all:
+        command.append('--create-all')
+    start = time.perf_counter()
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process'] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--create-all', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.create_all)
+        return
+
+    # Same throwaway database as the other benchmarks, seeded once up front
+    from benchmarks.common import app, reset_database, seed_bulk
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=20, tasks=1000)
+
+    print(f'median of {args.runs} runs, ms since the process started importing')
+    print(f'{"":<24}' + ''.join(f'{step:>18}' for step in STEPS + ('process',)))
+    for label, create_all in (('lazy (create_app)', False), ('create_all at startup', True)):
+        results = [run(create_all) for _ in range(args.runs)]
+        medians = [statistics.median(result[step] for result in results) for step in STEPS + ('process',)]
+        print(f'{label:<24}' + ''.join(f'{value:>18.1f}' for value in medians))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Check that a PATCH can only set the fields its role allows.
+
+    python -m benchmarks.check_access
+
+A project member may edit the project but not hand it to someone else:
+changing ``owner_id`` takes the owner. Fields outside a model's writable set
+(a user's ``password_hash`` or ``version``, a task's ``user_id``, any
+``id`` or ``created_at``) are refused with 400 and nothing is changed, and
+so is a body that isn't a JSON object. Exits non-zero on a failed check.
+"""
+
+import sys
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import app, db, reset_database, seed_bulk
+from models import Project, Task, User
+
+
+def main():
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=3, projects=0, tasks=0, collaborators_per_project=0)
+        tokens = {id: create_access_token(identity=str(id)) for id in range(1, 4)}
+    owner, member = ({'Authorization': f'Bearer {tokens[id]}'} for id in (1, 2))
+
+    project = client.post('/projects', headers=owner, json={'title': 'Shared'}).json['id']
+    client.post('/project-collaborators', headers=owner, json={'user_id': 2, 'project_id': project,
+                                                                'role': 'member'})
+    task = client.post('/tasks', headers=member, json={'title': 'Mine', 'project_id': project}).json['id']
+
+    def owner_of(project_id):
+        with app.app_context():
+            return db.session.get(Project, project_id).owner_id
+
+    code = client.patch(f'/projects/{project}', headers=member, json={'title': 'Renamed by a member'}).status_code
+    check('a member may rename the project', code == 200, code)
+    code = client.patch(f'/projects/{project}', headers=member, json={'owner_id': 2}).status_code
+    check('a member may not make themselves owner: 403', code == 403 and owner_of(project) == 1,
+          (code, owner_of(project)))
+    code = client.patch(f'/projects/{project}', headers=member, json={'title': 'Both', 'owner_id': 2}).status_code
+    check('not even next to a field they may set', code == 403 and owner_of(project) == 1, code)
+    code = client.patch(f'/projects/{project}', headers=owner, json={'id': 999}).status_code
+    check("a project's id: 400", code == 400, code)
+
+    code = client.patch(f'/tasks/{task}', headers=member, json={'user_id': 3}).status_code
+    with app.app_context():
+        assignee = db.session.get(Task, task).user_id
+    check("a task's assignee: 400", code == 400 and assignee == 2, (code, assignee))
+    code = client.patch(f'/tasks/{task}', headers=member, json={'created_at': '2000-01-01T00:00:00'}).status_code
+    check("a task's created_at: 400", code == 400, code)
+
+    with app.app_context():
+        before = db.session.get(User, 2)
+        before = (before.password_hash, before.version)
+    for field, value in (('password_hash', 'x'), ('version', 1000), ('id', 99)):
+        code = client.patch('/users/2', headers=member, json={field: value}).status_code
+        check(f"a user's {field}: 400", code == 400, code)
+    with app.app_context():
+        after = db.session.get(User, 2)
+        check('and the user is unchanged', (after.password_hash, after.version) == before)
+
+    code = client.patch(f'/tasks/{task}', headers=member, json=[{'title': 'a list'}]).status_code
+    check('a body that is not an object: 400', code == 400, code)
+
+    code = client.patch(f'/projects/{project}', headers=owner, json={'owner_id': 2}).status_code
+    check('the owner may hand the project over', code == 200 and owner_of(project) == 2,
+          (code, owner_of(project)))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
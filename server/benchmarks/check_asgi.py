@@ -0,0 +1,186 @@
+"""
+Check that the ASGI entry point (asgi.py) answers like the Flask app.
+
+    python -m benchmarks.check_asgi
+
+Sends the same requests to the Flask test client and, in process, to
+``asgi.app``: the async routes (GET /tasks with filters, sorts and cursor
+pages, GET /projects, GET /auth/me), their errors and 304s, and routes that
+fall through to Flask. Status, body, ETag, X-Next-Cursor and CORS headers
+must match, and so must the number of statements. Then 100 requests from
+five users run concurrently on one event loop, and each must get its own
+user's answer. Throughput is measured by ``benchmarks.load_test`` (the
+``uvicorn`` profile). Exits non-zero on a failed check.
+"""
+
+import asyncio
+import json
+import sys
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import select
+
+from benchmarks.common import app, db, record_statements, reset_database, seed_bulk
+from models import Project
+
+COMPARED_HEADERS = ('Content-Type', 'ETag', 'X-Next-Cursor', 'Cache-Control',
+                    'Access-Control-Allow-Origin', 'Access-Control-Expose-Headers')
+
+PATHS = (
+    '/tasks',
+    '/tasks?limit=7',
+    '/tasks?limit=5&sort=-title',
+    '/tasks?open=true&priority=high,medium&limit=20',
+    '/tasks?project_id=none',
+    '/tasks?due_after=2020-01-01&sort=-updated_at&limit=3',
+    '/projects',
+    '/projects?limit=2&sort=title',
+    '/auth/me',
+    '/tasks?limit=abc',
+    '/tasks?sort=nope',
+    '/tasks?cursor=garbage',
+    '/tasks?due_after=yesterday',
+    '/users/1',
+    '/tasks?stream=true&limit=3',
+    '/stats',
+)
+
+
+async def call(asgi_app, method, path, headers, body=b''):
+    """One request to an ASGI app; returns (status, headers, body)"""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+        'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'root_path': '', 'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        + ([(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())] if body else []),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app(scope, receive, send)
+    start = messages[0]
+    response_headers = {}
+    for name, value in start['headers']:
+        response_headers.setdefault(name.decode('latin-1').lower(), value.decode('latin-1'))
+    return start['status'], response_headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+
+async def lifespan(asgi_app):
+    """Start the app up and shut it down, as a server would around its requests"""
+    events = iter(({'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}))
+    sent = []
+
+    async def receive():
+        return next(events)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    await asgi_app({'type': 'lifespan'}, receive, send)
+    return sent
+
+
+def comparable(status, headers, body):
+    headers = {name.lower(): value for name, value in headers.items()}
+    return status, {name: headers.get(name.lower()) for name in COMPARED_HEADERS}, body
+
+
+def main():
+    app.config['CACHE_BACKEND'] = 'none'
+    from cache import response_cache
+    response_cache.init_app(app)
+    import asgi
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=5, projects=20, tasks=2000)
+        tokens = {id: create_access_token(identity=str(id)) for id in range(1, 6)}
+        own_project = db.session.scalar(select(Project.id).where(Project.owner_id == 1).limit(1))
+        engine = db.engine
+    origin = app.config['CORS_ORIGINS'][0]
+    headers = {'Authorization': f'Bearer {tokens[1]}', 'Origin': origin}
+
+    def flask_get(path, headers):
+        response = client.get(path, headers=headers)
+        return comparable(response.status_code, response.headers, response.data)
+
+    async def run():
+        try:
+            for path in PATHS:
+                expected = flask_get(path, headers)
+                with record_statements(engine) as flask_statements:
+                    client.get(path, headers=headers)
+                got = comparable(*await call(asgi.app, 'GET', path, headers))
+                statements = flask_statements
+                if path.split('?')[0] in asgi.ROUTES and asgi.app.engine is not None:
+                    with record_statements(asgi.app.engine.sync_engine) as statements:
+                        await call(asgi.app, 'GET', path, headers)
+                check(f'{path}: same response ({expected[0]})', got == expected,
+                      '' if got == expected else f'{got[:2]} vs {expected[:2]}')
+                check(f'{path}: same number of statements', len(statements) == len(flask_statements),
+                      f'{len(statements)} vs {len(flask_statements)}')
+
+            # Following cursors gives the same pages
+            cursor, pages, same = None, 0, True
+            while pages < 5:
+                path = '/tasks?limit=50' + (f'&cursor={cursor}' if cursor else '')
+                got = comparable(*await call(asgi.app, 'GET', path, headers))
+                same &= got == flask_get(path, headers)
+                cursor, pages = got[1]['X-Next-Cursor'], pages + 1
+            check('five pages through cursors match', same)
+
+            status, response_headers, _ = await call(asgi.app, 'GET', '/tasks?limit=7', headers)
+            etag = response_headers['etag']
+            status, _, body = await call(asgi.app, 'GET', '/tasks?limit=7', dict(headers, **{'If-None-Match': etag}))
+            check('If-None-Match: 304 with no body', status == 304 and body == b'', status)
+            check('the ETag is the one Flask gives', client.get('/tasks?limit=7', headers=headers).headers['ETag']
+                  == etag)
+
+            for label, request_headers, code in (('no token', {'Origin': origin}, 401),
+                                                 ('malformed token', {'Authorization': 'Bearer nope'}, 422)):
+                expected = flask_get('/tasks', request_headers)
+                got = comparable(*await call(asgi.app, 'GET', '/tasks', request_headers))
+                check(f'{label}: {code} like Flask', got == expected and got[0] == code, got[0])
+
+            # Writes go to Flask; the async routes see them
+            body = json.dumps({'title': 'Created through ASGI', 'project_id': own_project}).encode()
+            status, _, created = await call(asgi.app, 'POST', '/tasks', headers, body)
+            check('POST /tasks is served by Flask: 201', status == 201, status)
+            task_id = json.loads(created)['id']
+            status, response_headers, listed = await call(asgi.app, 'GET', '/tasks?sort=-id&limit=1', headers)
+            check('the new task is listed, with a new ETag',
+                  json.loads(listed)[0]['id'] == task_id and response_headers['etag'] != etag)
+
+            # Concurrent requests from different users each get their own answer
+            requests = [(id, path) for id in range(1, 6) for path in ('/tasks?limit=20', '/projects?limit=5',
+                                                                       '/auth/me', '/users/1')] * 5
+            auth = {id: {'Authorization': f'Bearer {token}'} for id, token in tokens.items()}
+            expected = {(id, path): flask_get(path, auth[id]) for id, path in set(requests)}
+            results = await asyncio.gather(*(call(asgi.app, 'GET', path, auth[id]) for id, path in requests))
+            mixed = [(id, path) for (id, path), result in zip(requests, results)
+                     if comparable(*result) != expected[id, path]]
+            check(f'{len(requests)} concurrent requests from 5 users each match Flask', not mixed, mixed[:3])
+        finally:
+            check('lifespan: startup and shutdown complete',
+                  await lifespan(asgi.app) == ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+    asyncio.run(run())
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
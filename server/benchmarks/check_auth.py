@@ -0,0 +1,161 @@
+"""
+Check /auth/me answering from token claims, the user version cache and refresh tokens.
+
+    python -m benchmarks.check_auth
+
+A signed-up user's /auth/me must cost no statement while their cached
+version matches the token, and one when the cache is cold. After an edit
+the old token shows the edited user; after a delete it gets 404. An edit
+made elsewhere (another process) shows up once the cache entry expires.
+Refresh tokens must give current claims, and each kind of token must be
+refused where the other is expected. The ASGI route must agree. Where no
+password hashing pool can start, sign-up and login still work. Then
+times /auth/me from claims against the database lookup it replaces. Exits
+non-zero on a failed check.
+"""
+
+import asyncio
+import sys
+import time
+
+from flask_jwt_extended import create_access_token, decode_token
+from sqlalchemy import text
+
+from benchmarks.common import app, db, record_statements, reset_database
+from identity import user_versions
+
+
+def timed(fn, runs=500):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1e6
+
+
+def main():
+    app.config['BCRYPT_LOG_ROUNDS'] = 4
+    from passwords import hasher
+    hasher.init_app(app)
+    # Deleting a user is a job; run it within the request
+    app.config['JOBS_EXECUTOR'] = 'inline'
+    from jobs import job_queue
+    job_queue.init_app(app)
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        engine = db.engine
+
+    def me(token):
+        with record_statements(engine) as statements:
+            response = client.get('/auth/me', headers={'Authorization': f'Bearer {token}'})
+        return response, len(statements)
+
+    signup = client.post('/auth/signup', json={'username': 'claims', 'email': 'claims@example.com',
+                                               'password': 'secret-password'}).json
+    access, refresh = signup['access_token'], signup['refresh_token']
+    user_id = signup['user']['id']
+    with app.app_context():
+        claims = decode_token(access)
+        legacy = create_access_token(identity=str(user_id))
+    check('access token carries the user and its version', claims['user'] == signup['user'] and claims['uv'] == 1)
+
+    response, statements = me(access)
+    check('/auth/me from the claims: no statement', response.json == {'user': signup['user']} and statements == 0,
+          statements)
+    user_versions.backend.clear()
+    response, statements = me(access)
+    check('cold cache: one statement for the version', response.status_code == 200 and statements == 1, statements)
+    response, statements = me(legacy)
+    check('token without claims: read from the database', response.json == {'user': signup['user']}, statements)
+
+    headers = {'Authorization': f'Bearer {access}'}
+    client.patch(f'/users/{user_id}', headers=headers, json={'username': 'renamed'})
+    response, statements = me(access)
+    check('after an edit the old token shows the edited user',
+          response.json['user']['username'] == 'renamed', statements)
+
+    refreshed = client.post('/auth/refresh', headers={'Authorization': f'Bearer {refresh}'})
+    response, statements = me(refreshed.json['access_token'])
+    check('refresh: a new access token with current claims, answered without a statement',
+          refreshed.status_code == 200 and response.json['user']['username'] == 'renamed' and statements == 0,
+          statements)
+    code = client.get('/auth/me', headers={'Authorization': f'Bearer {refresh}'}).status_code
+    check('a refresh token is refused as an access token', code == 422, code)
+    code = client.post('/auth/refresh', headers=headers).status_code
+    check('an access token is refused by /auth/refresh', code == 422, code)
+
+    # An edit served by another process: this one learns of it when its entry expires
+    current = refreshed.json['access_token']
+    with app.app_context():
+        db.session.execute(text("UPDATE users SET username = 'elsewhere', version = version + 1 WHERE id = :id"),
+                           {'id': user_id})
+        db.session.commit()
+    check('an edit elsewhere: previous claims within the TTL',
+          me(current)[0].json['user']['username'] == 'renamed')
+    ttl, user_versions.ttl = user_versions.ttl, 0.5
+    user_versions.backend.clear()
+    me(current)
+    time.sleep(0.6)
+    check('and current ones once the cache entry expires', me(current)[0].json['user']['username'] == 'elsewhere')
+    user_versions.ttl = ttl
+
+    import asgi
+    from benchmarks.check_asgi import call, lifespan
+
+    async def async_me(token):
+        status, _, body = await call(asgi.app, 'GET', '/auth/me', {'Authorization': f'Bearer {token}'})
+        await lifespan(asgi.app)
+        return status, body
+
+    flask_response = client.get('/auth/me', headers={'Authorization': f'Bearer {current}'})
+    check('the ASGI route agrees', asyncio.run(async_me(current)) == (200, flask_response.data))
+
+    client.delete(f'/users/{user_id}', headers={'Authorization': f'Bearer {current}'})
+    response, statements = me(current)
+    check('after a delete: 404 without a statement', response.status_code == 404 and statements == 0, statements)
+    check('and for a token without claims', me(legacy)[0].status_code == 404)
+    code = client.post('/auth/refresh', headers={'Authorization': f'Bearer {refresh}'}).status_code
+    check('refreshing a deleted user: 401', code == 401, code)
+
+    # A runtime that can't start a process pool (no sem_open): hash inline
+    import passwords
+
+    def no_pool(*args, **kwargs):
+        raise OSError('sem_open is not available')
+
+    real_pool, passwords.ProcessPoolExecutor = passwords.ProcessPoolExecutor, no_pool
+    hasher.configure(workers=0)
+    hasher.configure(workers=2)
+    code = client.post('/auth/signup', json={'username': 'nopool', 'email': 'nopool@example.com',
+                                             'password': 'secret-password'}).status_code
+    login = client.post('/auth/login', json={'username': 'nopool', 'password': 'secret-password'}).status_code
+    wrong = client.post('/auth/login', json={'username': 'nopool', 'password': 'wrong-password'}).status_code
+    check('no process pool: sign-up and login hash inline', (code, login, wrong) == (201, 200, 401)
+          and hasher.stats()['pool_unavailable'], (code, login, wrong))
+    passwords.ProcessPoolExecutor = real_pool
+    hasher.configure(workers=0)
+    hasher.init_app(app)
+
+    timing = client.post('/auth/signup', json={'username': 'timing', 'email': 'timing@example.com',
+                                               'password': 'secret-password'}).json
+    with app.app_context():
+        without_claims = create_access_token(identity=str(timing['user']['id']))
+    headers, legacy_headers = ({'Authorization': f'Bearer {token}'}
+                               for token in (timing['access_token'], without_claims))
+    claims_us = timed(lambda: client.get('/auth/me', headers=headers))
+    database_us = timed(lambda: client.get('/auth/me', headers=legacy_headers))
+    print(f'\n/auth/me: {claims_us:.0f} us from claims, {database_us:.0f} us reading the user')
+    print(user_versions.stats())
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
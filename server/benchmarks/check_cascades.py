@@ -0,0 +1,162 @@
+"""
+Check that deletes reach tasks and collaborators by set-based statements, in bounded memory.
+
+    python -m benchmarks.check_cascades [--tasks 1000000] [--compare-tasks 20000]
+
+The foreign keys to users and projects must be ON DELETE CASCADE, and the
+relationships passive, so deleting a parent through the ORM loads no child.
+DELETE /projects/<id> must run the same statements for a project of
+--compare-tasks tasks and one of --tasks tasks, without its Python memory
+peak growing with the project. Afterwards nothing of the project is left,
+task_counts still add up and the sync log has a deletion for every task.
+Deleting a user in SQL, on a connection as the app sets it up (SQLite
+included), must take their projects, the tasks in them and their
+collaborations along. Prints the time and memory of the route against the
+old way, loading every task to delete it through the ORM. Exits non-zero on
+a failed check.
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import delete, func, inspect, select
+
+from benchmarks.common import app, db, record_statements, reset_database, seed_bulk
+from models import Change, Project, ProjectCollaborator, Task, TaskCount, User
+from queries import for_shape
+
+# (table, column): referred table
+FOREIGN_KEYS = {
+    ('projects', 'owner_id'): 'users',
+    ('tasks', 'user_id'): 'users',
+    ('tasks', 'project_id'): 'projects',
+    ('project_collaborators', 'user_id'): 'users',
+    ('project_collaborators', 'project_id'): 'projects',
+}
+
+
+def measured(fn):
+    """``(result, seconds, peak bytes of Python memory)`` of a call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn()
+        return result, time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def count(model, *criteria):
+    return db.session.scalar(select(func.count()).select_from(model).where(*criteria))
+
+
+def project_left(project_id):
+    """Rows of a deleted project still in the database"""
+    return (count(Project, Project.id == project_id) + count(Task, Task.project_id == project_id)
+            + count(ProjectCollaborator, ProjectCollaborator.project_id == project_id))
+
+
+def counts_add_up():
+    return db.session.scalar(select(func.coalesce(func.sum(TaskCount.task_count), 0))) == count(Task)
+
+
+def delete_loaded(project_id):
+    """The old DELETE /projects/<id>: the project with its relations, then a DELETE per child"""
+    project = for_shape(Project, 'with-relations').filter_by(id=project_id).one()
+    for child in project.tasks + project.collaborators:
+        db.session.delete(child)
+    db.session.delete(project)
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tasks', type=int, default=1000000, help='tasks in the large project')
+    parser.add_argument('--compare-tasks', type=int, default=20000, help='tasks in each small project')
+    args = parser.parse_args()
+
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    def delete_route(project_id, owner_id):
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(owner_id))}'}
+        with record_statements(engine) as statements:
+            response, seconds, peak = measured(lambda: client.delete(f'/projects/{project_id}', headers=headers))
+        return response.status_code, len(statements), seconds, peak
+
+    # Small projects: project p belongs to user p % 3 + 1 and holds ~4/15 of the tasks
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=3, projects=3, tasks=args.compare_tasks * 15 // 4, collaborators_per_project=2)
+        engine = db.engine
+        inspector = inspect(engine)
+        cascades = {(table, fk['constrained_columns'][0]): (fk['referred_table'], fk['options'].get('ondelete'))
+                    for table in ('projects', 'tasks', 'project_collaborators')
+                    for fk in inspector.get_foreign_keys(table)}
+        check('foreign keys are ON DELETE CASCADE',
+              cascades == {key: (referred, 'CASCADE') for key, referred in FOREIGN_KEYS.items()}, cascades)
+
+        with record_statements(engine) as statements:
+            db.session.delete(db.session.get(User, 1))
+            db.session.flush()
+        db.session.rollback()
+        loaded = [statement for statement, _ in statements if statement.lstrip().upper().startswith('SELECT')]
+        check('deleting a user through the ORM loads none of their rows', len(loaded) == 1, loaded[1:])
+
+        small_tasks = count(Task, Task.project_id == 1)
+        with record_statements(engine) as statements:
+            _, loaded_seconds, loaded_peak = measured(lambda: delete_loaded(1))
+        loaded_statements = len(statements)
+        db.session.remove()
+
+        code, small_statements, small_seconds, small_peak = delete_route(2, 3)
+        check('DELETE /projects/<id>: 204, with nothing of the project left',
+              code == 204 and project_left(2) == 0, code)
+
+        # The last project's owner, straight in SQL: the database does the rest
+        owner = db.session.get(Project, 3).owner_id
+        with engine.connect() as connection:
+            connection.execute(delete(User).where(User.id == owner))
+            connection.commit()
+        left = (project_left(3) + count(Task, Task.user_id == owner)
+                + count(ProjectCollaborator, ProjectCollaborator.user_id == owner))
+        check('DELETE FROM users cascades to projects, tasks and collaborations', left == 0, left)
+        check('task_counts still add up', counts_add_up())
+
+    # One large project: 4 in 5 tasks are in it
+    with app.app_context():
+        reset_database()
+        start = time.perf_counter()
+        seed_bulk(users=3, projects=1, tasks=args.tasks * 5 // 4, collaborators_per_project=2)
+        tasks = count(Task, Task.project_id == 1)
+        print(f'     seeded a project of {tasks} tasks in {time.perf_counter() - start:.0f}s')
+        changes_before = count(Change, Change.kind == 'task', Change.deleted.is_(True))
+        code, statements, seconds, peak = delete_route(1, 2)
+        check(f'{tasks} tasks: 204, with nothing of the project left', code == 204 and project_left(1) == 0, code)
+        check('the same statements as the small project', statements == small_statements,
+              f'{statements} vs {small_statements}')
+        check('Python memory does not grow with the project', peak < small_peak + 1024 * 1024,
+              f'{peak / 1024:.0f} KiB vs {small_peak / 1024:.0f} KiB')
+        check('task_counts still add up', counts_add_up())
+        logged = count(Change, Change.kind == 'task', Change.deleted.is_(True)) - changes_before
+        check('a deletion in the sync log for every task', logged == tasks, logged)
+
+    print(f'\n{small_tasks} tasks, loaded and deleted by the ORM: {loaded_seconds * 1000:.0f} ms, '
+          f'{loaded_statements} statements, {loaded_peak / 1024 / 1024:.1f} MiB peak')
+    print(f'{small_tasks} tasks, DELETE /projects/<id>: {small_seconds * 1000:.0f} ms, '
+          f'{small_statements} statements, {small_peak / 1024 / 1024:.1f} MiB peak')
+    print(f'{tasks} tasks, DELETE /projects/<id>: {seconds * 1000:.0f} ms, '
+          f'{statements} statements, {peak / 1024 / 1024:.1f} MiB peak')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
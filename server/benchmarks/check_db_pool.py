@@ -0,0 +1,95 @@
+"""
+Check the connection pool settings and the metrics at /metrics/db-pool.
+
+    python -m benchmarks.check_db_pool
+
+Runs against DATABASE_URL (a local PostgreSQL container works) or the
+SQLite stand-in, with a pool of two connections and no overflow. Background
+threads hold both connections so that one request waits for a connection and
+another times out. Exits non-zero if the metrics don't show it.
+"""
+
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('DB_POOL_SIZE', '2')
+os.environ.setdefault('DB_MAX_OVERFLOW', '0')
+os.environ.setdefault('DB_POOL_TIMEOUT', '1')
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import app, db, reset_database, seed_bulk
+from database import pool_metrics
+
+
+def hold_connections(engine, count, release):
+    """Check out ``count`` connections in background threads until ``release`` is set"""
+    held = threading.Semaphore(0)
+
+    def hold():
+        with engine.connect() as connection:
+            connection.exec_driver_sql('SELECT 1')
+            held.release()
+            release.wait()
+
+    threads = [threading.Thread(target=hold) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        held.acquire()
+    return threads
+
+
+def main():
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=5, projects=10, tasks=200)
+        token = create_access_token(identity='1')
+        engine = db.engine
+    print('engine options:', {key: getattr(value, '__name__', value)
+                              for key, value in app.config['SQLALCHEMY_ENGINE_OPTIONS'].items()})
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    engine.dispose()
+    pool_metrics.reset()
+    failures = 0
+
+    def check(label, ok):
+        nonlocal failures
+        print(f'{"ok  " if ok else "FAIL"} {label}')
+        failures += not ok
+
+    response = client.get('/users', headers=headers)
+    check('requests check out and return connections', response.status_code == 200)
+
+    # Both connections busy and never released: the request times out
+    release = threading.Event()
+    threads = hold_connections(engine, 2, release)
+    response = client.get('/users', headers=headers)
+    check('a request times out when the pool stays exhausted', response.status_code == 500)
+
+    # Released shortly after the request starts waiting: it gets a connection
+    threading.Timer(0.2, release.set).start()
+    response = client.get('/users', headers=headers)
+    check('a request waits for a connection to come back', response.status_code == 200)
+    for thread in threads:
+        thread.join()
+
+    time.sleep(0.05)
+    metrics = client.get('/metrics/db-pool').json
+    print(metrics)
+    check('checkouts, waits and timeouts are counted',
+          metrics['checkouts'] >= 4 and metrics['waits'] >= 2 and metrics['timeouts'] >= 1)
+    check('waiting shows in checkout latency', metrics['checkout_ms_max'] >= 150)
+    check('every connection was returned', metrics.get('in_use', 0) == 0)
+
+    if failures:
+        print(f'{failures} check(s) failed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
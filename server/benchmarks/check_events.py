@@ -0,0 +1,245 @@
+"""
+Check GET /events: who hears about which change, backpressure, and the ASGI stream.
+
+    python -m benchmarks.check_events
+
+Three users hold streams: a project's owner, a collaborator and an
+outsider. Task, project and collaborator writes must reach the owner and
+the collaborator and never the outsider, until the outsider is added to the
+project; once removed, they stop hearing about it. POST /tasks/bulk sends a
+message per task. Publishing must add no statement to a write. A
+subscriber that stops reading is evicted with a ``reset`` once its queue
+fills, without slowing the writer, and streams past EVENTS_MAX_SUBSCRIBERS
+get 503. Two brokers on one channel stand in for two
+processes. The ASGI route must stream the same messages and let go of its
+subscriber when the client leaves. Then times the fan-out of one change to
+many subscribers against one poll of GET /tasks. Exits non-zero on a failed
+check.
+"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import app, db, record_statements, reset_database, seed_bulk
+from events import Broker, LocalBackend, LocalChannel, broker
+
+HEARTBEAT = 0.2
+
+
+class Reader:
+    """Reads one /events stream on a thread and keeps the messages it gets"""
+
+    def __init__(self, token):
+        self.chunks = []
+        self.thread = threading.Thread(target=self._read, args=(token,), daemon=True)
+        self.thread.start()
+
+    def _read(self, token):
+        # The request and its body on one thread, as a server runs them
+        response = app.test_client().get('/events', headers={'Authorization': f'Bearer {token}'},
+                                         buffered=False)
+        for chunk in response.response:
+            self.chunks.append(chunk)
+
+    def events(self):
+        """The data of every plain message so far"""
+        text = b''.join(self.chunks).decode('utf-8')
+        return [json.loads(block[len('data: '):]) for block in text.split('\n\n') if block.startswith('data: ')]
+
+    def named(self, name):
+        return f'event: {name}\n'.encode() in b''.join(self.chunks)
+
+
+def settle():
+    time.sleep(HEARTBEAT * 1.5)
+
+
+def main():
+    app.config['EVENTS_HEARTBEAT'] = HEARTBEAT
+    app.config['EVENTS_QUEUE_SIZE'] = 16
+    broker.init_app(app)
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=4, projects=0, tasks=0, collaborators_per_project=0)
+        tokens = {id: create_access_token(identity=str(id)) for id in range(1, 5)}
+        engine = db.engine
+    owner, member = ({'Authorization': f'Bearer {tokens[id]}'} for id in (1, 2))
+
+    project = client.post('/projects', headers=owner, json={'title': 'Shared'}).json['id']
+    client.post('/project-collaborators', headers=owner,
+                json={'project_id': project, 'user_id': 2, 'role': 'member'})
+    readers = {id: Reader(tokens[id]) for id in (1, 2, 3)}
+    settle()
+    check('streams start with ready', all(reader.named('ready') for reader in readers.values()))
+    check('three subscribers', broker.stats()['subscribers'] == 3, broker.stats()['subscribers'])
+
+    task = client.post('/tasks', headers=member, json={'title': 'Collaborate', 'project_id': project}).json['id']
+    client.patch(f'/tasks/{task}', headers=member, json={'status': 'completed'})
+    settle()
+    expected = [{'type': 'task', 'action': 'created', 'id': task, 'project_id': project},
+                {'type': 'task', 'action': 'updated', 'id': task, 'project_id': project}]
+    check('owner and collaborator hear about the task', readers[1].events() == expected == readers[2].events(),
+          readers[1].events())
+    check('the outsider hears nothing', readers[3].events() == [], readers[3].events())
+
+    collaborator = client.post('/project-collaborators', headers=owner,
+                               json={'project_id': project, 'user_id': 3, 'role': 'viewer'}).json['id']
+    client.patch(f'/projects/{project}', headers=owner, json={'title': 'Shared, renamed'})
+    settle()
+    check('added to the project: the outsider hears from then on',
+          [(e['type'], e['action']) for e in readers[3].events()]
+          == [('collaborator', 'created'), ('project', 'updated')], readers[3].events())
+
+    client.delete(f'/project-collaborators/{collaborator}', headers=owner)
+    client.patch(f'/tasks/{task}', headers=member, json={'status': 'pending'})
+    settle()
+    check('removed again: they hear that, and nothing after',
+          [(e['type'], e['action']) for e in readers[3].events()][-1] == ('collaborator', 'deleted'),
+          readers[3].events())
+
+    heard = len(readers[1].events())
+    results = client.post('/tasks/bulk', headers=member, json={'operations': [
+        {'op': 'create', 'data': {'title': 'In bulk', 'project_id': project}},
+        {'op': 'update', 'id': task, 'data': {'status': 'completed'}},
+    ]}).json['results']
+    created = results[0]['id']
+    client.post('/tasks/bulk', headers=member, json={'operations': [{'op': 'delete', 'id': created}]})
+    settle()
+    check('bulk operations: a message per task',
+          [(e['action'], e['id']) for e in readers[1].events()[heard:]]
+          == [('created', created), ('updated', task), ('deleted', created)], readers[1].events()[heard:])
+
+    with record_statements(engine) as statements:
+        client.patch(f'/tasks/{task}', headers=member, json={'priority': 'high'})
+    published = len(statements)
+    app.config['EVENTS_BACKEND'] = 'none'
+    broker.init_app(app)
+    with record_statements(engine) as statements:
+        client.patch(f'/tasks/{task}', headers=member, json={'priority': 'low'})
+    app.config['EVENTS_BACKEND'] = 'local'
+    broker.init_app(app)
+    check('publishing adds no statement to a write', published == len(statements), f'{published} vs {len(statements)}')
+
+    broker.reset()
+    for reader in readers.values():
+        reader.thread.join(2)
+    check('reset closes every stream with event: reset',
+          all(reader.named('reset') and not reader.thread.is_alive() for reader in readers.values()))
+    check('and lets go of the subscribers', broker.stats()['subscribers'] == 0, broker.stats()['subscribers'])
+
+    # Backpressure: a subscriber that never reads, next to one that does
+    stuck = broker.subscribe(4, [project])
+    reader = Reader(tokens[1])
+    settle()
+    evicted = broker.stats()['evicted']
+    burst = broker.queue_size * 3 // 4
+    writer_us = 0
+    for _ in range(2):
+        start = time.perf_counter()
+        for _ in range(burst):
+            broker.publish('task', 'updated', task, (project,), project_id=project)
+        writer_us += (time.perf_counter() - start) / (2 * burst) * 1e6
+        settle()
+    check('a full queue evicts the subscriber', stuck.evicted and broker.stats()['evicted'] == evicted + 1)
+    check('a reader keeping up is not evicted', len(reader.events()) == 2 * burst and not reader.named('reset'),
+          len(reader.events()))
+    check('the writer never waits', writer_us < 1000, f'{writer_us:.0f} us per publish')
+    broker.reset()
+    reader.thread.join(2)
+
+    broker.max_subscribers = 1
+    kept = broker.subscribe(4, [])
+    response = client.get('/events', headers=owner)
+    check('past EVENTS_MAX_SUBSCRIBERS: 503 with Retry-After',
+          response.status_code == 503 and response.headers.get('Retry-After') == '5', response.status_code)
+    broker.unsubscribe(kept)
+    broker.max_subscribers = app.config['EVENTS_MAX_SUBSCRIBERS']
+
+    # Two processes sharing a channel, as with EVENTS_BACKEND=postgres
+    channel = LocalChannel()
+    writer, listener = Broker(), Broker()
+    for process in (writer, listener):
+        process.backend = LocalBackend(channel)
+    remote = listener.subscribe(2, [project])
+    writer.subscribe(1, [project])
+    writer.publish('task', 'deleted', task, (project,), project_id=project)
+    check('a change published in one process reaches the other',
+          [json.loads(data)['action'] for data in remote.take()] == ['deleted'])
+
+    import asgi
+    from benchmarks.check_asgi import lifespan
+
+    async def asgi_stream():
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'scheme': 'http',
+            'method': 'GET', 'path': '/events', 'raw_path': b'/events', 'query_string': b'',
+            'root_path': '', 'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+            'headers': [(b'authorization', f'Bearer {tokens[2]}'.encode())],
+        }
+        sent = []
+        gone = asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        served = asyncio.ensure_future(asgi.app(scope, receive, send))
+        await asyncio.sleep(HEARTBEAT / 2)
+        subscribed = broker.stats()['subscribers']
+        # A write from a Flask thread wakes the coroutine
+        await asyncio.to_thread(client.patch, f'/tasks/{task}', headers=member, json={'title': 'Async'})
+        await asyncio.sleep(HEARTBEAT * 1.5)
+        gone.set()
+        await asyncio.wait_for(served, 2)
+        await lifespan(asgi.app)
+        return sent, subscribed
+
+    task = client.post('/tasks', headers=member, json={'title': 'Again', 'project_id': project}).json['id']
+    sent, subscribed = asyncio.run(asgi_stream())
+    headers = dict(sent[0]['headers'])
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    check('ASGI: an event stream without Content-Length',
+          sent[0]['status'] == 200 and headers[b'content-type'].startswith(b'text/event-stream')
+          and b'content-length' not in headers, sent[0])
+    check('ASGI: ready, the change, then keepalives',
+          body.startswith(b'retry: 3000\nevent: ready\n') and b'"action":"updated"' in body
+          and b': keepalive' in body, body[:200])
+    check('ASGI: the subscriber goes with the client', subscribed == 1 and broker.stats()['subscribers'] == 0,
+          f'{subscribed} then {broker.stats()["subscribers"]}')
+
+    # Fan-out of one change against what a poll costs
+    broker.max_subscribers = 1000
+    subscribers = [broker.subscribe(2, [project]) for _ in range(1000)]
+    start = time.perf_counter()
+    broker.publish('task', 'updated', task, (project,), project_id=project)
+    fan_out_us = (time.perf_counter() - start) * 1e6
+    for subscriber in subscribers:
+        broker.unsubscribe(subscriber)
+    start = time.perf_counter()
+    for _ in range(50):
+        client.get('/tasks', headers=member)
+    poll_us = (time.perf_counter() - start) / 50 * 1e6
+    print(f'\none change to 1000 subscribers: {fan_out_us:.0f} us in all; one GET /tasks poll: {poll_us:.0f} us')
+    print(broker.stats())
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Check background jobs: deleting a user through the queue, retries, priorities, leases and executors.
+
+    python -m benchmarks.check_jobs [--tasks 40000]
+
+DELETE /users/<id> must answer 202 with a job at once, and asking again
+returns the same job. Its status is private to whoever started it. Once run,
+the user's tasks, projects (with the tasks in them) and collaborations must
+be gone, with nothing orphaned. Task counts and the sync change log must
+match, as after the old cascading delete. A failing job is retried and then
+fails for good; its key queues it again. Higher priorities run first. A job
+whose worker stopped renewing its lease is taken over, and the old worker
+can't finish it; reading such a job is enough to have it run again. The
+thread and inline executors run jobs without a worker. A user given a
+deleted user's id gets a job of their own.
+Prints the time of the 202 against the whole delete of a similar user.
+Exits non-zero on a failed check.
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func, select, update
+
+import jobs
+from benchmarks.common import app, db, reset_database, seed_bulk
+from models import Change, Job, User, Task, Project, ProjectCollaborator, TaskCount
+
+ATTEMPTS = {}
+
+
+@jobs.handler('check-flaky')
+def flaky(context):
+    """Fails on the first ``failures`` attempts"""
+    name = context.payload['name']
+    ATTEMPTS[name] = ATTEMPTS.get(name, 0) + 1
+    if ATTEMPTS[name] <= context.payload['failures']:
+        raise RuntimeError(f'attempt {ATTEMPTS[name]} fails')
+    return {'attempts': ATTEMPTS[name]}
+
+
+def owned_counts(user_id):
+    """Rows that deleting the user must remove"""
+    owned = select(Project.id).where(Project.owner_id == user_id)
+    return {
+        'tasks': db.session.scalar(select(func.count()).select_from(Task).where(
+            (Task.user_id == user_id) | Task.project_id.in_(owned))),
+        'collaborators': db.session.scalar(select(func.count()).select_from(ProjectCollaborator).where(
+            (ProjectCollaborator.user_id == user_id) | ProjectCollaborator.project_id.in_(owned))),
+        'projects': db.session.scalar(select(func.count()).select_from(Project).where(Project.owner_id == user_id)),
+        'users': 1,
+    }
+
+
+def leftovers(user_id):
+    """Rows still pointing at the user, or at projects that no longer exist"""
+    projects = select(Project.id)
+    return sum(db.session.scalar(select(func.count()).select_from(model).where(criterion)) for model, criterion in (
+        (User, User.id == user_id),
+        (Project, Project.owner_id == user_id),
+        (Task, Task.user_id == user_id),
+        (Task, Task.project_id.isnot(None) & Task.project_id.notin_(projects)),
+        (ProjectCollaborator, ProjectCollaborator.user_id == user_id),
+        (ProjectCollaborator, ProjectCollaborator.project_id.notin_(projects)),
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--tasks', type=int, default=40000)
+    args = parser.parse_args()
+
+    app.config.update(JOBS_EXECUTOR='worker', JOB_RETRY_DELAY=0, JOB_BATCH_SIZE=2000)
+    queue = jobs.job_queue
+    queue.init_app(app)
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=4, projects=40, tasks=args.tasks, collaborators_per_project=2)
+        tokens = {id: create_access_token(identity=str(id)) for id in range(1, 5)}
+
+        # The whole delete of a similar user, as a request would wait for it
+        inline = owned_counts(2)
+        queue.enqueue('delete-user', {'user_id': 2})
+        start = time.perf_counter()
+        queue.run_next('check')
+        inline_ms = (time.perf_counter() - start) * 1000
+        db.session.remove()
+        expected = owned_counts(1)
+        changes_before = db.session.scalar(select(func.count()).select_from(Change))
+    headers = {'Authorization': f'Bearer {tokens[1]}'}
+
+    start = time.perf_counter()
+    response = client.delete('/users/1', headers=headers)
+    accepted_ms = (time.perf_counter() - start) * 1000
+    job = response.json['job']
+    check('DELETE /users/<id>: 202 with a queued job and its Location',
+          response.status_code == 202 and job['status'] == 'queued'
+          and response.headers['Location'] == f'/jobs/{job["id"]}', response.status_code)
+    again = client.delete('/users/1', headers=headers)
+    check('asking again returns the same job', again.status_code == 202 and again.json['job']['id'] == job['id'])
+    code = client.get(f'/jobs/{job["id"]}', headers={'Authorization': f'Bearer {tokens[3]}'}).status_code
+    check("someone else's job: 404", code == 404, code)
+
+    with app.app_context():
+        check('run by a worker', queue.work(burst=True) == 1)
+    status = client.get(f'/jobs/{job["id"]}', headers=headers).json['job']
+    check('succeeded, with the rows it deleted', status['status'] == 'succeeded' and status['result'] == expected,
+          f'{status["result"]} vs {expected}')
+    with app.app_context():
+        check('nothing of the user is left, nothing orphaned', leftovers(1) == 0, leftovers(1))
+        counted = db.session.scalar(select(func.coalesce(func.sum(TaskCount.task_count), 0)))
+        tasks = db.session.scalar(select(func.count()).select_from(Task))
+        check('task_counts still add up', counted == tasks, f'{counted} vs {tasks}')
+        logged = db.session.scalar(select(func.count()).select_from(Change)) - changes_before
+        check('the deletes reach the sync log', logged >= expected['tasks'], logged)
+        batches = -(-expected['tasks'] // queue.batch_size)
+        print(f'     {expected["tasks"]} tasks in {batches}+ transactions of at most {queue.batch_size} rows')
+    code = client.get('/auth/me', headers=headers).status_code
+    check('the deleted user is gone for /auth/me', code == 404, code)
+
+    with app.app_context():
+        # Retries, then failure for good; the key queues it again
+        job = queue.enqueue('check-flaky', {'name': 'once', 'failures': 1}, key='flaky-once')
+        queue.work(burst=True)
+        db.session.refresh(job)
+        check('a failed attempt is retried', job.status == 'succeeded' and job.attempts == 2, job.attempts)
+        job = queue.enqueue('check-flaky', {'name': 'always', 'failures': 99}, key='flaky-always')
+        queue.work(burst=True)
+        db.session.refresh(job)
+        check('failed for good after JOB_MAX_ATTEMPTS', job.status == 'failed' and job.attempts == queue.max_attempts
+              and 'attempt 5 fails' in job.error, (job.status, job.attempts))
+        again = queue.enqueue('check-flaky', {'name': 'always', 'failures': 99}, key='flaky-always')
+        check('its key queues it again', again.id == job.id and again.status == 'queued' and again.attempts == 0)
+        db.session.execute(update(Job).where(Job.id == again.id).values(status='failed'))
+        db.session.commit()
+
+        # Priorities
+        low = queue.enqueue('check-flaky', {'name': 'low', 'failures': 0})
+        high = queue.enqueue('check-flaky', {'name': 'high', 'failures': 0}, priority=10)
+        first = queue.claim('check')
+        check('higher priority runs first', first.id == high.id, first.id)
+        queue.work(burst=True)
+
+        # A worker that stopped renewing its lease
+        job = queue.enqueue('check-flaky', {'name': 'lease', 'failures': 0})
+        stale = queue.claim('dead-worker')
+        db.session.execute(update(Job).where(Job.id == job.id).values(
+            locked_at=datetime.utcnow() - timedelta(seconds=queue.lease + 1)))
+        db.session.commit()
+        queue._recovered_at = 0
+        check('an expired lease is taken over', queue.run_next('live-worker') and
+              db.session.get(Job, job.id).status == 'succeeded')
+        try:
+            jobs.Context(stale, 'dead-worker', 1).checkpoint(rows=1)
+            lost = False
+        except jobs.LeaseLost:
+            db.session.rollback()
+            lost = True
+        check("and the old worker's checkpoint is refused", lost)
+        check('low priority ran too', db.session.get(Job, low.id).status == 'succeeded')
+
+    # A job left running by a web process that went away, with nothing else queued
+    app.config['JOBS_EXECUTOR'] = 'thread'
+    queue.init_app(app)
+    with app.app_context():
+        orphan = Job(kind='check-flaky', payload=json.dumps({'name': 'orphan', 'failures': 0}), status='running',
+                     attempts=1, locked_by='gone-worker', created_by=3,
+                     locked_at=datetime.utcnow() - timedelta(seconds=queue.lease + 1))
+        db.session.add(orphan)
+        db.session.commit()
+        location = f'/jobs/{orphan.id}'
+    deadline = time.monotonic() + 30
+    status = 'running'
+    while status != 'succeeded' and time.monotonic() < deadline:
+        status = client.get(location, headers={'Authorization': f'Bearer {tokens[3]}'}).json['job']['status']
+        time.sleep(0.1)
+    check('GET /jobs/<id> takes back a job whose worker is gone, and it runs', status == 'succeeded', status)
+
+    for executor, id in (('thread', 3), ('inline', 4)):
+        app.config['JOBS_EXECUTOR'] = executor
+        queue.init_app(app)
+        response = client.delete(f'/users/{id}', headers={'Authorization': f'Bearer {tokens[id]}'})
+        location = response.headers['Location']
+        deadline = time.monotonic() + 60
+        status = response.json['job']['status']
+        while status != 'succeeded' and time.monotonic() < deadline:
+            time.sleep(0.1)
+            status = client.get(location, headers={'Authorization': f'Bearer {tokens[id]}'}).json['job']['status']
+        check(f'{executor} executor: the job runs without a worker', status == 'succeeded', status)
+        with app.app_context():
+            check(f'{executor} executor: nothing left', leftovers(id) == 0)
+
+    # A new user given a deleted user's id (SQLite reuses the highest rowid)
+    with app.app_context():
+        old_job = db.session.scalar(select(Job.id).where(Job.key.like('delete-user:4:%')))
+        db.session.add(User(id=4, username='reused', email='reused@example.com', password_hash='-'))
+        db.session.commit()
+    response = client.delete('/users/4', headers={'Authorization': f'Bearer {tokens[4]}'})
+    job = response.json['job']
+    check("a reused id gets its own job, not the old user's", job['id'] != old_job and job['status'] == 'succeeded',
+          (old_job, job['id'], job['status']))
+    with app.app_context():
+        check('and is deleted', leftovers(4) == 0)
+
+    print(f'\nDELETE /users/<id>: 202 in {accepted_ms:.1f} ms; '
+          f'the whole delete of a user with {inline["tasks"]} tasks: {inline_ms:.0f} ms')
+    with app.app_context():
+        print(queue.stats())
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
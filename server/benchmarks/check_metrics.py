@@ -0,0 +1,217 @@
+"""
+Check /metrics and the /health readiness check.
+
+    python -m benchmarks.check_metrics [--workers 3] [--requests 300]
+
+In process: request counts and histograms add up across client threads,
+and the counters of threads that ended are folded into one. /metrics and
+/metrics/* refuse other hosts without METRICS_TOKEN and anyone without the
+token once it is set. /health fails with 503 within its budget when no
+connection is available or the database can't be reached. Then under
+gunicorn with several sync workers: whichever worker answers the scrape
+reports the requests served by all of them, also after a worker exits and
+its file is merged away. Also prints the recording overhead per request.
+Exits non-zero on a failed check.
+"""
+
+import argparse
+import http.client
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault('DB_POOL_SIZE', '2')
+os.environ.setdefault('DB_MAX_OVERFLOW', '0')
+os.environ.setdefault('HEALTH_DB_TIMEOUT_MS', '300')
+os.environ.setdefault('METRICS_FLUSH_INTERVAL', '0.2')
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import create_engine
+
+import database
+from benchmarks.check_db_pool import hold_connections
+from benchmarks.common import app, db, reset_database, seed_bulk
+from benchmarks.load_test import free_port, start_server, stop_server
+from metrics import request_metrics
+
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def parse(text):
+    """{(name, frozenset of label pairs): value} from the text format"""
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            pairs = frozenset(re.findall(r'(\w+)="([^"]*)"', labels or ''))
+            samples[(name, pairs)] = float(value)
+    return samples
+
+
+def value(samples, name, **labels):
+    return samples.get((name, frozenset(labels.items())), 0)
+
+
+def total(samples, name, **labels):
+    """Summed over the labels not given"""
+    return sum(value for (sample, pairs), value in samples.items()
+               if sample == name and frozenset(labels.items()) <= pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=5, projects=10, tasks=500)
+        token = create_access_token(identity='1')
+        engine = db.engine
+    headers = {'Authorization': f'Bearer {token}'}
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    # Counts from 4 client threads, each recording into its own counters
+    def client_thread():
+        client = app.test_client()
+        for _ in range(args.requests // 4):
+            client.get('/tasks/10', headers=headers)
+
+    before = parse(app.test_client().get('/metrics').get_data(as_text=True))
+    threads = [threading.Thread(target=client_thread) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    response = app.test_client().get('/metrics')
+    samples = parse(response.get_data(as_text=True))
+    expected = args.requests // 4 * 4
+    route = {'method': 'GET', 'route': '/tasks/<int:id>'}
+    # Any status: with 2 connections for 4 threads, one may time out waiting
+    counted = (total(samples, 'planwise_http_requests_total', **route)
+               - total(before, 'planwise_http_requests_total', **route))
+    check('content type', response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+    check('requests counted across threads', counted == expected, f'{counted:.0f} of {expected}')
+    check('histogram count matches', value(samples, 'planwise_http_request_duration_seconds_count', **route)
+          == value(samples, 'planwise_http_request_duration_seconds_bucket', le='+Inf', **route))
+    check('pool and cache series present', ('planwise_db_pool_checkouts_total', frozenset()) in samples
+          and ('planwise_response_cache_hit_ratio', frozenset()) in samples)
+    check('in flight (the scrape itself)', value(samples, 'planwise_http_requests_in_flight') == 1)
+
+    # Many short-lived threads: counted, but not kept around
+    threads = [threading.Thread(target=lambda: app.test_client().get('/tasks/10', headers=headers))
+               for _ in range(200)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    after = parse(app.test_client().get('/metrics').get_data(as_text=True))
+    counted = (value(after, 'planwise_http_requests_total', status='200', **route)
+               - value(samples, 'planwise_http_requests_total', status='200', **route))
+    check("ended threads' counts kept, their counters dropped",
+          counted == len(threads) and len(request_metrics._threads) <= 1,
+          f'{counted:.0f} of {len(threads)}, {len(request_metrics._threads)} counters')
+
+    # Access: localhost only without a token, then only with the token
+    client = app.test_client()
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    paths = ('/metrics', '/metrics/db-pool', '/metrics/jobs')
+    codes = [client.get(path, environ_base=remote).status_code for path in paths]
+    check('no token: other hosts get 403', codes == [403] * len(paths), codes)
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    try:
+        codes = [client.get(path, environ_base=remote, headers=auth).status_code
+                 for path in paths for auth in ({}, headers, {'Authorization': 'Bearer scrape-secret'})]
+    finally:
+        app.config['METRICS_TOKEN'] = ''
+    check('with METRICS_TOKEN: only its bearer gets in', codes == [403, 403, 200] * len(paths), codes)
+
+    # Readiness
+    client = app.test_client()
+    health = client.get('/health')
+    check('/health ready', health.status_code == 200 and health.json['database']['ok'], health.json)
+    release = threading.Event()
+    holders = hold_connections(engine, 2, release)
+    start = time.perf_counter()
+    health = client.get('/health')
+    elapsed = (time.perf_counter() - start) * 1000
+    release.set()
+    for holder in holders:
+        holder.join()
+    check('/health 503 within budget with the pool exhausted',
+          health.status_code == 503 and elapsed < app.config['DB_POOL_TIMEOUT'] * 1000,
+          f'{health.status_code} in {elapsed:.0f} ms, {health.json}')
+    time.sleep(app.config['DB_POOL_TIMEOUT'] + 0.5)  # let the abandoned check give up
+    try:
+        database.ping(create_engine('sqlite:////nonexistent/planwise.db'), 1)
+        check('unreachable database reported', False)
+    except database.DatabaseUnavailable as e:
+        check('unreachable database reported', True, str(e))
+    health = client.get('/health')
+    check('/health ready again', health.status_code == 200, health.json)
+
+    # Overhead of recording, without the rest of the request around it
+    ok = app.response_class(status=200)
+    with app.test_request_context('/tasks/10'):
+        start = time.perf_counter()
+        for _ in range(10000):
+            request_metrics._before_request()
+            request_metrics._after_request(ok)
+            request_metrics._teardown_request(None)
+        print(f'recording overhead: {(time.perf_counter() - start) / 10000 * 1e6:.1f} us/request')
+
+    # Several gunicorn workers, one scrape
+    def scrape_totals():
+        totals = []
+        for _ in range(args.workers * 2):
+            # A new connection each time, so different workers answer
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            connection.request('GET', '/metrics')
+            samples = parse(connection.getresponse().read().decode())
+            connection.close()
+            totals.append(value(samples, 'planwise_http_requests_total', status='200', **route))
+        return totals
+
+    port = free_port()
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='planwise-metrics-')
+    process = start_server('sync', port, SimpleNamespace(cache=False, workers=args.workers))
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        for _ in range(args.requests):
+            connection.request('GET', '/tasks/10', headers=headers)
+            connection.getresponse().read()
+        connection.close()
+        time.sleep(float(os.environ['METRICS_FLUSH_INTERVAL']) * 3)
+        totals = scrape_totals()
+        check(f'every scrape sees all {args.requests} requests across {args.workers} workers',
+              all(total == args.requests for total in totals), totals)
+
+        # Stop a worker; gunicorn replaces it and merges its file into the exited workers' one
+        victim = min(int(name[8:-5]) for name in os.listdir(directory) if name[8:-5].isdigit())
+        os.kill(victim, signal.SIGTERM)
+        deadline = time.monotonic() + 10
+        while os.path.exists(os.path.join(directory, f'metrics-{victim}.json')) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        totals = scrape_totals()
+        check("an exited worker's file is merged away, its requests kept",
+              not os.path.exists(os.path.join(directory, f'metrics-{victim}.json'))
+              and all(total == args.requests for total in totals), totals)
+    finally:
+        stop_server(process)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
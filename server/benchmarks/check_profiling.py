@@ -0,0 +1,133 @@
+"""
+Check request profiling: Server-Timing, the log line and sampled dumps.
+
+    python -m benchmarks.check_profiling [--requests 500]
+
+Enables profiling by token with every profiled request sampled, then checks
+that only requests sending the token get a Server-Timing header, that its
+SQL count matches the statements actually executed, that JWT and
+serialization time are reported, and that the slowest dumps per route are
+kept on disk. Also prints the overhead of profiling per request. Exits
+non-zero on a failed check.
+"""
+
+import argparse
+import json
+import logging
+import os
+import pstats
+import statistics
+import sys
+import tempfile
+import time
+
+PROFILE_DIR = tempfile.mkdtemp(prefix='planwise_profiles_')
+os.environ.setdefault('PROFILING_TOKEN', 'benchmark-profiling-token')
+os.environ.setdefault('PROFILING_SAMPLE_RATE', '1')
+os.environ.setdefault('PROFILING_KEEP_SLOWEST', '3')
+os.environ.setdefault('PROFILING_DIR', PROFILE_DIR)
+os.environ.setdefault('CACHE_BACKEND', 'none')
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import app, db, record_statements, reset_database, seed_bulk
+from profiling import logger, request_profiler
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+def server_timing(response):
+    """{'total': (ms, desc), ...} from a Server-Timing header"""
+    metrics = {}
+    for entry in response.headers.get('Server-Timing', '').split(','):
+        name, *params = [part.strip() for part in entry.split(';')]
+        values = dict(param.split('=', 1) for param in params)
+        metrics[name] = (float(values.get('dur', 0)), values.get('desc', '').strip('"'))
+    return metrics
+
+
+def timed_requests(client, path, headers, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.get(path, headers=headers)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500, help='requests per overhead measurement')
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=5000)
+        token = create_access_token(identity='1')
+        engine = db.engine
+
+    capture = Capture()
+    logger.handlers = [capture]
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    profiled = dict(headers, **{'X-Profile': app.config['PROFILING_TOKEN']})
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    response = client.get('/tasks?limit=50', headers=headers)
+    check('no header without X-Profile', 'Server-Timing' not in response.headers)
+    response = client.get('/tasks?limit=50', headers=dict(headers, **{'X-Profile': 'wrong'}))
+    check('no header with a wrong token', 'Server-Timing' not in response.headers)
+
+    with record_statements(engine) as statements:
+        response = client.get('/tasks?limit=50', headers=profiled)
+    metrics = server_timing(response)
+    check('Server-Timing with the token', response.status_code == 200 and 'total' in metrics,
+          response.headers.get('Server-Timing'))
+    check('SQL count matches the statements executed',
+          metrics.get('db', (0, ''))[1] == f'{len(statements)} statements',
+          f'{metrics.get("db")} vs {len(statements)}')
+    check('JWT decode timed', metrics.get('jwt', (0,))[0] > 0)
+    check('serialization timed', metrics.get('serialize', (0,))[0] > 0)
+    check('phases fit in the total',
+          metrics['db'][0] + metrics['serialize'][0] + metrics['jwt'][0] <= metrics['total'][0])
+
+    line = capture.records[-1] if capture.records else {}
+    check('log line', line.get('route') == 'GET /tasks' and line.get('status') == 200
+          and line.get('sql_count') == len(statements), line)
+
+    for _ in range(10):
+        client.get('/tasks?limit=50', headers=profiled)
+        client.get('/projects/10', headers=profiled)
+    dumps = sorted(os.listdir(PROFILE_DIR))
+    slowest = request_profiler.stats()['slowest']
+    check('slowest 3 dumps kept per route',
+          len(dumps) == 6 and all(len(kept) == 3 for kept in slowest.values()), dumps)
+    stats = pstats.Stats(os.path.join(PROFILE_DIR, dumps[0]))
+    check('dumps load with pstats', stats.total_calls > 0)
+
+    # Overhead: plain requests, timed, and timed under cProfile
+    plain = timed_requests(client, '/tasks?limit=50', headers, args.requests)
+    request_profiler.sample_rate = 0
+    timed = timed_requests(client, '/tasks?limit=50', profiled, args.requests)
+    request_profiler.sample_rate = 1
+    sampled = timed_requests(client, '/tasks?limit=50', profiled, min(args.requests, 100))
+    print(f'\nGET /tasks?limit=50 median: {plain:.3f} ms plain, {timed:.3f} ms timed '
+          f'({(timed / plain - 1) * 100:+.1f}%), {sampled:.3f} ms under cProfile')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Check that cached list responses are served without SQL and invalidated by writes.
+
+    python -m benchmarks.check_response_cache [--backend lru|redis]
+
+``redis`` runs against the in-memory fake unless CACHE_REDIS_URL is set.
+Exits non-zero if any check fails.
+"""
+
+import argparse
+import sys
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.common import app, db, reset_database, seed_bulk, record_statements
+from cache import response_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=('lru', 'redis'), default='lru')
+    args = parser.parse_args()
+
+    app.config['CACHE_BACKEND'] = args.backend
+    response_cache.init_app(app)
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=5, projects=10, tasks=500)
+        token = create_access_token(identity='1')
+        engine = db.engine
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    failures = 0
+
+    def get(path):
+        with record_statements(engine) as statements:
+            response = client.get(path, headers=headers)
+        return response, len(statements)
+
+    def check(label, ok):
+        nonlocal failures
+        print(f'{"ok  " if ok else "FAIL"} {label}')
+        failures += not ok
+
+    projects, _ = get('/projects?limit=500')
+    again, statements = get('/projects?limit=500')
+    check('repeated GET /projects is a cache hit', statements == 0 and again.data == projects.data)
+
+    project_id = next(project['id'] for project in projects.json if project['owner_id'] == 1)
+    tasks, _ = get(f'/tasks?project_id={project_id}')
+    created = client.post('/tasks', json={'title': 'cached?', 'project_id': project_id}, headers=headers)
+    task_id = created.json['id']
+    projects, statements = get('/projects?limit=500')
+    check('creating a task invalidates the project list',
+          statements > 0 and any(task['id'] == task_id for project in projects.json for task in project['tasks']))
+    tasks, statements = get(f'/tasks?project_id={project_id}')
+    check('creating a task invalidates the task list', statements > 0 and len(tasks.json) == 1)
+
+    client.patch(f'/projects/{project_id}', json={'title': 'Renamed'}, headers=headers)
+    tasks, statements = get(f'/tasks?project_id={project_id}')
+    check('renaming a project invalidates task lists that embed it',
+          statements > 0 and tasks.json[0]['project']['title'] == 'Renamed')
+
+    get('/tasks?limit=5')
+    client.patch('/users/1', json={'username': 'renamed'}, headers=headers)
+    tasks, statements = get('/tasks?limit=5')
+    check('editing a user invalidates lists that embed them',
+          statements > 0 and tasks.json[0]['user']['username'] == 'renamed')
+
+    client.delete(f'/tasks/{task_id}', headers=headers)
+    projects, statements = get('/projects?limit=500')
+    check('deleting a task invalidates the project list',
+          not any(task['id'] == task_id for project in projects.json for task in project['tasks']))
+
+    # A response computed before a write commits must not outlive the write's invalidation
+    path = f'/tasks?project_id={project_id}'
+    with app.test_request_context(path):
+        key = response_cache.key_for_request(1)
+        generation = response_cache.generation()
+        stale = client.get(path, headers=headers)
+    client.patch(f'/projects/{project_id}', json={'title': 'Renamed again'}, headers=headers)
+    with app.test_request_context(path):
+        response_cache.store(key, stale, [f'projects:{project_id}', 'tasks-of:1'], generation)
+    tasks, statements = get(path)
+    check('a response computed before an invalidation is not stored',
+          statements > 0 and tasks.json[0]['project']['title'] == 'Renamed again')
+    with app.test_request_context(path):
+        response_cache.store(key, stale, ['tasks-of:1'], response_cache.generation())
+    tasks, statements = get(path)
+    check('one computed after it is', statements == 0 and tasks.data == stale.data)
+
+    print(client.get('/metrics/response-cache').json)
+    if failures:
+        print(f'{failures} check(s) failed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
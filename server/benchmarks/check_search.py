@@ -0,0 +1,161 @@
+"""
+Check GET /search and time it on a large dataset.
+
+    python -m benchmarks.check_search [--tasks 1000000] [--runs 20]
+
+Correctness on a small dataset: results only include projects the user can
+read and tasks assigned to them or in those projects; titles outrank
+descriptions; the last word matches as a prefix; pages follow each other
+without gaps or repeats; creates, renames and deletes show up in the index
+straight away, and so do changes of assignee or project. Then times
+searches for rare, medium and common terms against ``--tasks`` tasks and
+reports p50/p99, failing a term whose p50 is over ``--budget-ms``. Exits non-zero on a failed check.
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import or_, select
+
+from benchmarks.common import app, db, record_statements, reset_database, seed_bulk
+from models import Task, Project
+from permissions import visible
+
+# (label, query, held to the budget) from the rarest to the most common in
+# seed.py's vocabulary. On SQLite bm25 reads the whole posting list of each
+# word once per query to weigh it, so a word in every task, in effect a stop
+# word, costs time in proportion to the table; it is reported, not budgeted.
+TERMS = (
+    ('unique number', '123000', True),
+    ('two rare words', 'quarterly forecast', True),
+    ('one word', 'invoice', True),
+    ('prefix', 'newsl', True),
+    ('area and noun', 'finance budget', True),
+    ('in every task', 'team', False),
+)
+
+
+def expected_ids(user_id, word):
+    """Ids the user may see whose title or description contains ``word``, worked out without the index"""
+    readable_projects = select(Project.id).where(visible(Project, user_id=user_id))
+    tasks = db.session.scalars(select(Task.id).where(
+        or_(Task.user_id == user_id, Task.project_id.in_(readable_projects)),
+        or_(Task.title.ilike(f'%{word}%'), Task.description.ilike(f'%{word}%')))).all()
+    projects = db.session.scalars(select(Project.id).where(
+        visible(Project, user_id=user_id),
+        or_(Project.title.ilike(f'%{word}%'), Project.description.ilike(f'%{word}%')))).all()
+    return {('task', id) for id in tasks} | {('project', id) for id in projects}
+
+
+def all_pages(client, headers, query, limit):
+    seen, cursor, pages = [], None, 0
+    while True:
+        response = client.get(f'/search?q={query}&limit={limit}' + (f'&cursor={cursor}' if cursor else ''),
+                              headers=headers)
+        seen += [(item['type'], item[item['type']]['id']) for item in response.json]
+        pages += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return seen, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1000000, help='tasks in the timed dataset')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--projects', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=50.0, help='p50 budget per search')
+    args = parser.parse_args()
+
+    app.config['CACHE_BACKEND'] = 'none'
+    from cache import response_cache
+    response_cache.init_app(app)
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=3000)
+        token = create_access_token(identity='1')
+        engine = db.engine
+    headers = {'Authorization': f'Bearer {token}'}
+
+    for word in ('invoice', 'finance', 'quarterly'):
+        with app.app_context():
+            expected = expected_ids(1, word)
+        found, pages = all_pages(client, headers, word, 25)
+        check(f'{word!r}: every readable match and nothing else', set(found) == expected,
+              f'{len(found)} found, {len(expected)} expected')
+        check(f'{word!r}: {pages} pages without repeats', len(found) == len(set(found)))
+    with record_statements(engine) as statements:
+        response = client.get('/search?q=invoice&limit=25', headers=headers)
+    check('a page in 3 statements (search, tasks, projects)', len(statements) == 3, len(statements))
+    ranks = [item['rank'] for item in response.json]
+    check('best first', ranks == sorted(ranks, reverse=True))
+    first = response.json[0]
+    check('title matches outrank description matches',
+          'invoice' in first[first['type']]['title'].lower(), first)
+    check('prefix match on the last word',
+          set(all_pages(client, headers, 'invoi', 100)[0]) == set(all_pages(client, headers, 'invoice', 100)[0]))
+    only_projects = client.get('/search?q=invoice&type=project', headers=headers).json
+    check('type filter', only_projects and all(item['type'] == 'project' for item in only_projects))
+    for query, status in (('', 400), ('%20-%20', 400), ('budget&type=nope', 400), ('budget&cursor=bogus', 400)):
+        code = client.get(f'/search?q={query}', headers=headers).status_code
+        check(f'q={query!r} rejected', code == status, code)
+
+    with app.app_context():
+        other = create_access_token(identity='2')
+        # One of user 1's projects that user 2 can read as well
+        shared = db.session.scalar(select(Project.id).where(Project.owner_id == 1, visible(Project, user_id=2)))
+    other_headers = {'Authorization': f'Bearer {other}'}
+    found = lambda q, headers=headers: {
+        item['task']['id'] for item in client.get(f'/search?q={q}&type=task', headers=headers).json}
+    created = client.post('/tasks', headers=headers, json={
+        'title': 'Zeppelin maintenance', 'description': 'hangar'}).json['id']
+    check('new task found', created in found('zeppelin') and created in found('hangar'))
+    check("other users don't see it", created not in found('zeppelin', other_headers))
+    client.patch(f'/tasks/{created}', headers=headers, json={'title': 'Airship maintenance', 'project_id': shared})
+    check('renamed task found by its new title only', created in found('airship') and created not in found('zeppelin'))
+    check('moved into a shared project, the other user finds it', created in found('airship', other_headers),
+          f'project {shared}')
+    client.delete(f'/tasks/{created}', headers=headers)
+    check('deleted task gone', created not in found('airship'))
+    project = client.post('/projects', headers=headers, json={'title': 'Blimp fleet'}).json['id']
+    check('new project found', any(item['project']['id'] == project
+                                   for item in client.get('/search?q=blimp', headers=headers).json))
+
+    print(f'\nSeeding {args.tasks} tasks, {args.projects} projects, {args.users} users...')
+    start = time.perf_counter()
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=args.users, projects=args.projects, tasks=args.tasks)
+    print(f'seeded in {time.perf_counter() - start:.0f}s\n')
+    print(f'{"terms":<16} {"query":<20} {"results":>8} {"p50 ms":>8} {"p99 ms":>8}')
+    for label, query, budgeted in TERMS:
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            response = client.get(f'/search?q={query}&limit=25', headers=headers)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50 = statistics.median(timings)
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        over = budgeted and p50 > args.budget_ms
+        print(f'{label:<16} {query:<20} {len(response.json):>8} {p50:>8.1f} {p99:>8.1f}'
+              f'{"  over budget" if over else "" if budgeted else "  (not budgeted)"}')
+        failures += over
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Check the dashboard statistics and the task_counts summary, and time them.
+
+    python -m benchmarks.check_stats [--tasks 10000,100000]
+
+After each kind of write (create, update, bulk update, delete, project
+delete) the trigger-maintained task_counts rows must equal a fresh GROUP BY
+over tasks. GET /stats and GET /projects/<id>/stats must give the same
+answer from the summary, from the tasks table, and from adding up
+GET /tasks pages on the client, which is how the frontend does it today,
+and the same zero-filled shape for a user or project without tasks.
+The timings then compare the three as the task count grows. Exits non-zero
+on a failed check.
+"""
+
+import argparse
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func, select
+
+from benchmarks.common import app, db, record_statements, reset_database, seed_bulk
+from models import Project, Task, TaskCount, User
+
+
+def fresh_counts():
+    columns = (Task.user_id, func.coalesce(Task.project_id, 0), func.coalesce(Task.status, ''),
+               func.coalesce(Task.priority, ''))
+    rows = db.session.execute(select(*columns, func.count()).group_by(*columns)).all()
+    return {tuple(row[:4]): row[4] for row in rows}
+
+
+def summary_counts():
+    rows = db.session.execute(select(TaskCount.user_id, TaskCount.project_id, TaskCount.status,
+                                     TaskCount.priority, TaskCount.task_count)
+                              .where(TaskCount.task_count != 0)).all()
+    return {tuple(row[:4]): row[4] for row in rows}
+
+
+def client_side_stats(client, headers):
+    """What the frontend does: page through every task and count"""
+    by_status, cursor, total, overdue = Counter(), None, 0, 0
+    now = datetime.utcnow()
+    while True:
+        response = client.get('/tasks?limit=500' + (f'&cursor={cursor}' if cursor else ''), headers=headers)
+        for task in response.json:
+            by_status[task['status']] += 1
+            total += 1
+            due = task['due_date'] and datetime.strptime(task['due_date'], '%Y-%m-%d %H:%M:%S')
+            overdue += bool(due and due < now and task['status'] != 'completed')
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return {'total': total, 'by_status': dict(by_status), 'overdue': overdue}
+
+
+def timed(fn, runs=5):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', default='10000,100000', help='comma-separated dataset sizes to time')
+    args = parser.parse_args()
+
+    app.config['CACHE_BACKEND'] = 'none'
+    from cache import response_cache
+    response_cache.init_app(app)
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=3000)
+        token = create_access_token(identity='1')
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def check_summary(label):
+        with app.app_context():
+            check(f'summary matches tasks after {label}', summary_counts() == fresh_counts())
+
+    check_summary('seeding')
+    past = (datetime.utcnow() - timedelta(days=3)).isoformat()
+    created = [client.post('/tasks', headers=headers, json={
+        'title': f'Overdue {i}', 'project_id': 10, 'due_date': past, 'priority': 'high'}).json['id']
+        for i in range(5)]
+    check_summary('creates')
+    client.patch(f'/tasks/{created[0]}', headers=headers, json={'status': 'completed'})
+    client.patch(f'/tasks/{created[1]}', headers=headers, json={'project_id': None, 'priority': 'low'})
+    client.patch(f'/tasks/{created[2]}', headers=headers, json={'title': 'Renamed only'})
+    check_summary('updates')
+    client.post('/tasks/bulk', headers=headers, json={'operations': [
+        {'op': 'update', 'id': task_id, 'data': {'status': 'in_progress'}} for task_id in created[2:]]})
+    check_summary('a bulk update')
+    client.delete(f'/tasks/{created[4]}', headers=headers)
+    check_summary('a delete')
+    project = client.post('/projects', headers=headers, json={'title': 'Doomed'}).json['id']
+    for _ in range(3):
+        client.post('/tasks', headers=headers, json={'title': 'Goes with the project', 'project_id': project})
+    client.delete(f'/projects/{project}', headers=headers)
+    check_summary('a project delete')
+
+    answers = {}
+    for source in ('summary', 'tasks'):
+        app.config['STATS_SOURCE'] = source
+        with app.app_context():
+            engine = db.engine
+        with record_statements(engine) as statements:
+            mine = client.get('/stats', headers=headers)
+        with record_statements(engine) as project_statements:
+            project_stats = client.get('/projects/10/stats', headers=headers)
+        answers[source] = (mine.json, project_stats.json)
+        check(f'{source}: /stats in 2 statements', mine.status_code == 200 and len(statements) == 2,
+              len(statements))
+        check(f'{source}: /projects/10/stats in 3 statements (with the access check)',
+              project_stats.status_code == 200 and len(project_statements) == 3, len(project_statements))
+    check('summary and tasks give the same answer', answers['summary'] == answers['tasks'])
+    mine, project_stats = answers['summary']
+    client_side = client_side_stats(client, headers)
+    check('/stats matches adding up GET /tasks on the client',
+          mine['tasks']['total'] == client_side['total']
+          and all(mine['tasks']['by_status'][status] == count
+                  for status, count in client_side['by_status'].items()),
+          f'{mine["tasks"]["total"]} vs {client_side["total"]}')
+    check('overdue matches the client-side count', mine['tasks']['overdue'] == client_side['overdue'],
+          f'{mine["tasks"]["overdue"]} vs {client_side["overdue"]}')
+    me = next(member for member in project_stats['workload'] if member['user_id'] == 1)
+    check('workload includes the owner and the overdue tasks created', me['overdue'] >= 2, me)
+    check('access denied to other projects', client.get('/projects/11/stats', headers=headers).status_code == 403)
+
+    # A user, and a project, without a single task
+    with app.app_context():
+        idle = User(username='idle', email='idle@example.com', password_hash='-')
+        db.session.add(idle)
+        db.session.flush()
+        empty_project = Project(title='Empty', owner_id=idle.id)
+        db.session.add(empty_project)
+        db.session.commit()
+        idle_headers = {'Authorization': f'Bearer {create_access_token(identity=str(idle.id))}'}
+        empty_project_id = empty_project.id
+    empty = {'total': 0, 'by_status': dict.fromkeys(('pending', 'in_progress', 'completed'), 0),
+             'by_priority': dict.fromkeys(('low', 'medium', 'high'), 0), 'overdue': 0, 'completion_pct': 0.0}
+    for source in ('summary', 'tasks'):
+        app.config['STATS_SOURCE'] = source
+        idle_stats = client.get('/stats', headers=idle_headers).json
+        check(f'{source}: no tasks, all zero with the usual keys', idle_stats['tasks'] == empty, idle_stats['tasks'])
+        idle_project = client.get(f'/projects/{empty_project_id}/stats', headers=idle_headers).json
+        check(f'{source}: an empty project, the same', idle_project['tasks'] == empty, idle_project['tasks'])
+    app.config['STATS_SOURCE'] = 'summary'
+
+    print(f'\n{"tasks":>10} {"summary ms":>12} {"GROUP BY ms":>12} {"client-side ms":>15}')
+    for size in (int(size) for size in args.tasks.split(',')):
+        with app.app_context():
+            reset_database()
+            seed_bulk(users=10, projects=50, tasks=size)
+        timings = []
+        for source in ('summary', 'tasks'):
+            app.config['STATS_SOURCE'] = source
+            timings.append(timed(lambda: client.get('/stats', headers=headers)))
+        timings.append(timed(lambda: client_side_stats(client, headers), runs=1))
+        print(f'{size:>10} {timings[0]:>12.1f} {timings[1]:>12.1f} {timings[2]:>15.1f}')
+    app.config['STATS_SOURCE'] = 'summary'
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
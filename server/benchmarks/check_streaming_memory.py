@@ -0,0 +1,138 @@
+"""
+Check that streamed collection responses use flat memory regardless of row count.
+
+    python -m benchmarks.check_streaming_memory [--rows 1000000] [--small 10000]
+
+Builds two SQLite fixtures of users (kept in the temp directory between runs)
+and streams ``GET /users`` from each, as NDJSON and as a JSON array, in a
+fresh process. Fails if the peak RSS growth while streaming the large fixture
+exceeds the small one's by more than ``--tolerance`` MB.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+PASSWORD_HASH = '$2b$12$' + 'x' * 53
+INSERT_BATCH = 50000
+
+
+def fixture_path(rows):
+    return os.path.join(tempfile.gettempdir(), f'planwise_stream_{rows}.db')
+
+
+def build_fixture(rows, rebuild=False):
+    """A SQLite database with ``rows`` users, inserted in batches"""
+    from models import db, User
+
+    path = fixture_path(rows)
+    if os.path.exists(path) and not rebuild:
+        return path
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f'sqlite:///{path}')
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        for start in range(1, rows + 1, INSERT_BATCH):
+            conn.execute(User.__table__.insert(), [
+                {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+                 'password_hash': PASSWORD_HASH, 'created_at': now, 'updated_at': now}
+                for i in range(start, min(start + INSERT_BATCH, rows + 1))
+            ])
+    engine.dispose()
+    return path
+
+
+def rss_mb():
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(ndjson):
+    """Stream /users in this process; print rows seen and peak RSS growth as JSON"""
+    from flask_jwt_extended import create_access_token
+    from app import app
+
+    with app.app_context():
+        token = create_access_token(identity='1')
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    if ndjson:
+        headers['Accept'] = 'application/x-ndjson'
+    path = '/users' if ndjson else '/users?stream=true'
+
+    client.get('/users?limit=10', headers={'Authorization': headers['Authorization']})
+    baseline = peak = rss_mb()
+    response = client.get(path, headers=headers, buffered=False)
+    rows = 0
+    last = ''
+    for chunk in response.iter_encoded():
+        text = chunk.decode('utf-8')
+        rows += text.count('\n') if ndjson else text.count('"username"')
+        last = text or last
+        peak = max(peak, rss_mb())
+    response.close()
+    print(json.dumps({'rows': rows, 'growth_mb': round(peak - baseline, 1),
+                      'complete': ndjson or last.endswith(']')}))
+
+
+def run_child(rows, ndjson):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{fixture_path(rows)}')
+    env.setdefault('JWT_SECRET_KEY', 'benchmark-jwt-secret-key-of-sufficient-length')
+    command = [sys.executable, '-m', 'benchmarks.check_streaming_memory', '--measure']
+    if ndjson:
+        command.append('--ndjson')
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--small', type=int, default=10000)
+    parser.add_argument('--tolerance', type=float, default=20.0, help='MB')
+    parser.add_argument('--rebuild', action='store_true', help='recreate the fixtures')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--ndjson', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.ndjson)
+        return
+
+    for rows in (args.small, args.rows):
+        build_fixture(rows, args.rebuild)
+
+    failures = 0
+    for ndjson in (True, False):
+        label = 'ndjson' if ndjson else 'json array'
+        small = run_child(args.small, ndjson)
+        large = run_child(args.rows, ndjson)
+        for rows, result in ((args.small, small), (args.rows, large)):
+            print(f'{label:<10} {rows:>9} rows  {result["rows"]:>9} streamed  '
+                  f'+{result["growth_mb"]:.1f} MB peak RSS')
+        ok = (large['growth_mb'] <= small['growth_mb'] + args.tolerance
+              and large['rows'] == args.rows and small['rows'] == args.small
+              and large['complete'] and small['complete'])
+        print(f'{"ok  " if ok else "FAIL"} {label} memory is flat')
+        failures += not ok
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Check GET /sync against full reloads, and time polls as the data grows.
+
+    python -m benchmarks.check_sync [--tasks 10000,100000,1000000]
+
+Two users keep a replica each, built only from /sync responses, through
+creates, updates, bulk operations, deletes with cascades, a reassignment
+done in SQL, and a collaborator joining and leaving a project. After each
+step the replica must equal what GET /tasks, /projects and
+/project-collaborators return. Also checks paging, expired and malformed
+tokens. The timings then compare a poll after a few changes, and an empty
+poll, with reloading every task, for growing datasets. Exits non-zero on a
+failed check.
+"""
+
+import argparse
+import base64
+import json
+import sys
+import time
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+
+from benchmarks.common import app, db, record_statements, reset_database, seed_bulk
+
+COLLECTIONS = {'tasks': '/tasks', 'projects': '/projects', 'collaborators': '/project-collaborators'}
+
+
+class Replica:
+    """What a client holds: records by id, kept current from /sync"""
+
+    def __init__(self, client, headers):
+        self.client, self.headers = client, headers
+        self.records = {key: {} for key in COLLECTIONS}
+        self.token = client.get('/sync', headers=headers).json['token']
+        for key, path in COLLECTIONS.items():
+            for record in load_all(client, headers, path):
+                self.records[key][record['id']] = record['updated_at']
+
+    def sync(self, limit=100):
+        """Poll until caught up; returns the number of responses"""
+        polls = 0
+        while True:
+            body = self.client.get(f'/sync?since={self.token}&limit={limit}', headers=self.headers).json
+            polls += 1
+            for key in COLLECTIONS:
+                for record in body[key]:
+                    self.records[key][record['id']] = record['updated_at']
+                for id in body['deleted'][key]:
+                    self.records[key].pop(id, None)
+            self.token = body['token']
+            if not body['more']:
+                return polls
+
+    def matches_server(self):
+        return all(self.records[key] == {record['id']: record['updated_at']
+                                         for record in load_all(self.client, self.headers, path)}
+                   for key, path in COLLECTIONS.items())
+
+
+def load_all(client, headers, path):
+    records, cursor = [], None
+    while True:
+        response = client.get(f'{path}?limit=500' + (f'&cursor={cursor}' if cursor else ''), headers=headers)
+        records += response.json
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return records
+
+
+def timed(fn, runs=5):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', default='10000,100000', help='comma-separated dataset sizes to time')
+    args = parser.parse_args()
+
+    app.config['CACHE_BACKEND'] = 'none'
+    from cache import response_cache
+    response_cache.init_app(app)
+    client = app.test_client()
+    failures = 0
+
+    def check(label, ok, detail=''):
+        nonlocal failures
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {label}{f": {detail}" if detail else ""}')
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=2000)
+        tokens = [create_access_token(identity=str(id)) for id in (1, 2)]
+        engine = db.engine
+    headers, other_headers = ({'Authorization': f'Bearer {token}'} for token in tokens)
+    mine, theirs = Replica(client, headers), Replica(client, other_headers)
+
+    def step(label):
+        polls = mine.sync(), theirs.sync()
+        check(f'{label}: replicas match the server', mine.matches_server() and theirs.matches_server(),
+              f'{polls} polls')
+
+    with record_statements(engine) as statements:
+        empty = client.get(f'/sync?since={mine.token}', headers=headers).json
+    check('nothing changed: empty, in 1 statement',
+          not any(empty[key] or empty['deleted'][key] for key in COLLECTIONS) and len(statements) == 1,
+          len(statements))
+
+    created = [client.post('/tasks', headers=headers, json={'title': f'Sync {i}', 'project_id': 10}).json['id']
+               for i in range(3)]
+    client.patch(f'/tasks/{created[0]}', headers=headers, json={'status': 'completed'})
+    client.patch(f'/tasks/{created[0]}', headers=headers, json={'title': 'Sync 0, renamed'})
+    client.delete(f'/tasks/{created[1]}', headers=headers)
+    body = client.get(f'/sync?since={mine.token}', headers=headers).json
+    check('a record changed three times comes once, as it is now',
+          [task['title'] for task in body['tasks'] if task['id'] == created[0]] == ['Sync 0, renamed'])
+    check('created then deleted is listed as deleted', created[1] in body['deleted']['tasks'])
+    step('creates, updates and a delete')
+
+    client.post('/tasks/bulk', headers=headers, json={'operations': [
+        {'op': 'update', 'id': created[2], 'data': {'priority': 'high'}},
+        {'op': 'delete', 'id': created[0]},
+        {'op': 'create', 'data': {'title': 'Bulk created'}},
+    ]})
+    step('a bulk request')
+
+    with app.app_context():
+        # Outside the ORM, as a set-based statement would do it
+        db.session.execute(text('UPDATE tasks SET user_id = 2 WHERE id = :id'), {'id': created[2]})
+        db.session.commit()
+    step('a task reassigned in SQL')
+    check('gone for the old assignee, there for the new one',
+          created[2] not in mine.records['tasks'] and created[2] in theirs.records['tasks'])
+
+    project = client.post('/projects', headers=headers, json={'title': 'Synced project'}).json['id']
+    for i in range(3):
+        client.post('/tasks', headers=headers, json={'title': f'In the project {i}', 'project_id': project})
+    client.post('/project-collaborators', headers=headers, json={'user_id': 3, 'project_id': project,
+                                                                   'role': 'viewer'})
+    step('a project with tasks and a collaborator')
+    joined = client.post('/project-collaborators', headers=headers, json={
+        'user_id': 2, 'project_id': project, 'role': 'member'}).json['id']
+    step('a collaborator joins')
+    with app.app_context():
+        on_project = set(db.session.scalars(
+            text('SELECT id FROM project_collaborators WHERE project_id = :id'), {'id': project}))
+    check('the new collaborator gets the project and everyone on it',
+          project in theirs.records['projects'] and on_project <= set(theirs.records['collaborators']),
+          f'{len(on_project)} collaborators')
+    client.delete(f'/project-collaborators/{joined}', headers=headers)
+    step('the collaborator leaves')
+    check('the project is gone for them', project not in theirs.records['projects'])
+    client.delete(f'/projects/{project}', headers=headers)
+    step('a project deleted with its tasks and collaborators')
+
+    for i in range(250):
+        client.post('/tasks', headers=headers, json={'title': f'Paged {i}'})
+    check('250 changes in pages of 100', mine.sync(limit=100) == 3 and mine.matches_server())
+
+    payload = json.dumps(['sync', 0, 0, int(time.time()) - 400 * 86400]).encode()
+    expired = base64.urlsafe_b64encode(payload).rstrip(b'=').decode()
+    code = client.get(f'/sync?since={expired}', headers=headers).status_code
+    check('expired token: 410', code == 410, code)
+    code = client.get('/sync?since=bogus', headers=headers).status_code
+    check('malformed token: 400', code == 400, code)
+
+    print(f'\n{"tasks":>10} {"poll, 10 changes ms":>20} {"empty poll ms":>14} {"reload tasks ms":>16}')
+    for size in (int(size) for size in args.tasks.split(',')):
+        with app.app_context():
+            reset_database()
+            seed_bulk(users=10, projects=50, tasks=size)
+        token = client.get('/sync', headers=headers).json['token']
+        for i in range(10):
+            client.post('/tasks', headers=headers, json={'title': f'Change {i}', 'project_id': 10})
+        poll = timed(lambda token=token: client.get(f'/sync?since={token}', headers=headers))
+        latest = client.get(f'/sync?since={token}', headers=headers).json['token']
+        empty = timed(lambda latest=latest: client.get(f'/sync?since={latest}', headers=headers))
+        reload = timed(lambda: load_all(client, headers, '/tasks'), runs=1)
+        print(f'{size:>10} {poll:>20.1f} {empty:>14.1f} {reload:>16.1f}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
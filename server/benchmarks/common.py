@@ -0,0 +1,43 @@
+"""Shared setup for the benchmark scripts"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Benchmarks get their own throwaway SQLite database unless one is given
+if 'DATABASE_URL' not in os.environ:
+    _db_path = os.path.join(tempfile.gettempdir(), 'planwise_bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-jwt-secret-key-of-sufficient-length')
+
+from sqlalchemy import event
+
+# Re-exported: the benchmark scripts take the configured app from here
+from app import app  # noqa: F401
+from models import db
+from seed import insert_synthetic
+
+
+def reset_database():
+    db.drop_all()
+    db.create_all()
+
+
+@contextmanager
+def record_statements(engine):
+    """Collect ``(statement, parameters)`` for everything executed while the block runs"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed_bulk(users=10, projects=20, tasks=10000, collaborators_per_project=3):
+    """Insert a synthetic dataset with bulk statements (no bcrypt, no ORM objects)"""
+    insert_synthetic(users, projects, tasks, collaborators_per_project)
@@ -0,0 +1,102 @@
+"""
+Check that every query behind the GET routes is served by an index.
+
+    python -m benchmarks.explain_indexes [--verbose]
+
+Each route is requested once while its statements are recorded; every
+statement is then run through EXPLAIN on the same database. On SQLite a
+``SCAN <table>`` step without an index fails the check. On Postgres
+sequential scans are disabled for the session first, so any remaining
+``Seq Scan`` node means no usable index exists. Exits non-zero on failure.
+"""
+
+import argparse
+import json
+import re
+import sys
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+
+from benchmarks.common import app, db, reset_database, seed_bulk, record_statements
+
+# Seeded user 1 owns task 10 and project 10; collaborator 28 is on project 10
+ROUTES = (
+    '/auth/me',
+    '/users',
+    '/users/1',
+    '/tasks',
+    '/tasks?status=pending,in_progress',
+    '/tasks?priority=high',
+    '/tasks?project_id=10',
+    '/tasks?open=true&due_before=2100-01-01',
+    '/tasks?sort=-created_at&limit=5',
+    '/tasks/10',
+    '/projects',
+    '/projects/10',
+    '/project-collaborators',
+    '/project-collaborators/28',
+)
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def sqlite_full_scans(connection, statement, parameters):
+    plan = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    return [row[3] for row in plan if SQLITE_FULL_SCAN.match(row[3])]
+
+
+def postgres_full_scans(connection, statement, parameters):
+    connection.execute(text('SET enable_seqscan = off'))
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(f"Seq Scan on {node['Relation Name']}")
+        nodes.extend(node.get('Plans', ()))
+    return scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--verbose', action='store_true', help='print the offending statements')
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=2000)
+        token = create_access_token(identity='1')
+        engine = db.engine
+
+    full_scans = postgres_full_scans if engine.dialect.name == 'postgresql' else sqlite_full_scans
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    failures = 0
+    for path in ROUTES:
+        with record_statements(engine) as statements:
+            response = client.get(path, headers=headers)
+        problems = []
+        with engine.connect() as connection:
+            for statement, parameters in statements:
+                scans = full_scans(connection, statement, parameters)
+                if scans:
+                    problems.append((statement, scans))
+        ok = response.status_code == 200 and not problems
+        failures += not ok
+        print(f'{"ok  " if ok else "FAIL"} {path:<44} {response.status_code} {len(statements):>3} statements')
+        for statement, scans in problems:
+            print(f'       {", ".join(scans)}')
+            if args.verbose:
+                print('       ', ' '.join(statement.split())[:300])
+
+    if failures:
+        print(f'{failures} route(s) with unindexed queries')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Load-test gunicorn worker profiles: requests/sec and latency percentiles.
+
+    python -m benchmarks.load_test [--profiles sync,gthread,gevent,uvicorn] [--concurrency 16] [--duration 10]
+
+Seeds the benchmark database, then for each profile starts gunicorn with
+gunicorn.conf.py on a free port and sends authenticated GETs from
+``--concurrency`` client threads for ``--duration`` seconds. The request mix
+covers the list and detail routes for user 1; ``--async-routes`` keeps only
+the ones asgi.py serves with coroutines. The ``uvicorn`` profile serves
+asgi:app, the others app:app. The response cache is off unless ``--cache``
+is given, so the numbers reflect the database work. Profiles whose
+dependencies are missing (gevent, uvicorn-worker) are skipped.
+"""
+
+import argparse
+import http.client
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import app, db, reset_database, seed_bulk
+from identity import access_token
+from models import User
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = (
+    '/tasks?limit=50',
+    '/tasks?open=true&limit=50',
+    '/projects?limit=20',
+    '/tasks/10',
+    '/projects/10',
+    '/users/1',
+    '/auth/me',
+)
+ASYNC_PATHS = tuple(path for path in PATHS if path.split('?')[0] in ('/tasks', '/projects', '/auth/me'))
+
+# Profiles that serve another entry point than app:app
+APPS = {'uvicorn': 'asgi:app'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(profile, port, args):
+    env = dict(os.environ, PORT=str(port), GUNICORN_WORKER_CLASS=profile,
+               CACHE_BACKEND='lru' if args.cache else 'none')
+    if args.workers:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         APPS.get(profile, 'app:app')],
+        cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn ({profile}) exited:\n{process.stderr.read()[-2000:]}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'gunicorn ({profile}) did not start')
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def client_loop(port, paths, headers, deadline, latencies, errors, offset):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    i = offset
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors.append(path)
+    connection.close()
+
+
+def run_load(port, token, concurrency, duration, paths=PATHS):
+    headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': 'identity'}
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=client_loop, args=(port, paths, headers, deadline, latencies, errors, n))
+               for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profiles', default='sync,gthread,gevent,uvicorn')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=2)
+    parser.add_argument('--workers', type=int, help='override WEB_CONCURRENCY')
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--cache', action='store_true', help='leave the response cache on')
+    parser.add_argument('--async-routes', action='store_true', help='only the routes asgi.py serves async')
+    args = parser.parse_args()
+    paths = ASYNC_PATHS if args.async_routes else PATHS
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=args.tasks)
+        token = access_token(db.session.get(User, 1))
+
+    print(f'{args.concurrency} clients, {args.duration:.0f}s per profile, {os.cpu_count()} CPU(s)')
+    print(f'{"profile":<10} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9}')
+    for profile in args.profiles.split(','):
+        port = free_port()
+        try:
+            process = start_server(profile, port, args)
+        except RuntimeError as e:
+            print(f'{profile:<10} skipped: {str(e).strip().splitlines()[-1]}')
+            continue
+        try:
+            run_load(port, token, args.concurrency, args.warmup, paths)
+            latencies, errors, elapsed = run_load(port, token, args.concurrency, args.duration, paths)
+        finally:
+            stop_server(process)
+        print(f'{profile:<10} {len(latencies):>9} {len(errors):>7} {len(latencies) / elapsed:>9.1f} '
+              f'{statistics.median(latencies) * 1000:>9.1f} {percentile(latencies, 0.99) * 1000:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
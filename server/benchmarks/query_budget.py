@@ -0,0 +1,78 @@
+"""
+Count SQL statements per request and fail when a route exceeds its budget.
+
+    python -m benchmarks.query_budget [--tasks 2000]
+
+Every route must load its rows and all nested relationships in a fixed
+number of statements, and answer a conditional GET without loading rows. The dataset is large enough that an N+1 pattern
+blows through any of the budgets below.
+"""
+
+import argparse
+import sys
+
+from benchmarks.common import app, db, reset_database, seed_bulk, record_statements
+from identity import access_token
+from models import User
+
+# Maximum statements per request after authentication: a full response, and
+# a conditional GET that revalidates a current ETag (answered with 304)
+BUDGETS = {
+    # From the token's claims; one statement when the version isn't cached
+    '/auth/me': (1, None),
+    '/users': (2, 1),
+    '/users/1': (4, 1),
+    '/tasks': (2, 1),
+    '/tasks/10': (3, 2),
+    '/projects': (4, 1),
+    '/projects/10': (5, 2),
+    '/project-collaborators': (2, 1),
+    '/project-collaborators/28': (3, 2),
+}
+
+
+def report(label, response, expected_status, statements, budget, verbose):
+    ok = response.status_code == expected_status and len(statements) <= budget
+    print(f'{"ok  " if ok else "FAIL"} {label:<34} {response.status_code} '
+          f'{len(statements):>4} statements (budget {budget})')
+    if not ok and verbose:
+        for statement, _ in statements:
+            print('       ', ' '.join(statement.split())[:200])
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--verbose', action='store_true', help='print the statements of failing routes')
+    args = parser.parse_args()
+
+    with app.app_context():
+        reset_database()
+        seed_bulk(users=10, projects=50, tasks=args.tasks)
+        # A token as login issues it, with the user's claims
+        token = access_token(db.session.get(User, 1))
+        engine = db.engine
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    failures = 0
+    for path, (budget, conditional_budget) in BUDGETS.items():
+        with record_statements(engine) as statements:
+            response = client.get(path, headers=headers)
+        failures += not report(path, response, 200, statements, budget, args.verbose)
+
+        if conditional_budget is None:
+            continue
+        etag = response.headers.get('ETag')
+        with record_statements(engine) as statements:
+            response = client.get(path, headers={**headers, 'If-None-Match': etag or ''})
+        failures += not report(path + ' (304)', response, 304, statements, conditional_budget, args.verbose)
+
+    if failures:
+        print(f'{failures} route(s) over budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+"""
+Benchmark every API route and write a JSON report that can be compared between commits.
+
+    python -m benchmarks.suite [--users 1000 --projects 500 --tasks 100000] [--requests 200]
+                               [--concurrency 4] [--output report.json] [--compare base.json]
+
+Seeds the dataset with seed.insert_synthetic() (or uses the existing one with
+--no-seed, e.g. after `python seed.py --users 100000 ...`), then drives each
+route in app.py in-process with authenticated test clients. For each route
+the report records requests, errors, throughput, latency percentiles and SQL
+statements per request. Writes run after the reads of the same resource, and
+deletes only remove rows the suite created.
+
+With --compare, prints the change against an earlier report and exits
+non-zero if any route now issues more SQL statements per request.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, func, select
+
+from benchmarks.common import app, db, reset_database, seed_bulk
+from models import User, Task, Project, ProjectCollaborator
+
+BENCH_PASSWORD = 'benchmark-password'
+
+
+class Scenario:
+    def __init__(self, method, path, body=None, expect=200, token=None, auth_heavy=False, limit=None):
+        self.method = method
+        self.path = path          # str, or callable(i) -> str (None: nothing left to do)
+        self.body = body          # dict, or callable(i) -> dict
+        self.expect = expect
+        self.token = token        # callable(i) -> token; defaults to the benchmark user's
+        self.auth_heavy = auth_heavy
+        self.limit = limit        # callable() -> how many iterations are possible
+        self.name = f'{method} {path if isinstance(path, str) else path.__doc__}'
+
+
+class Context:
+    """Ids the scenarios work on, and rows they create for later scenarios to delete"""
+
+    def __init__(self, token, user_id, task_id, project_id, collaborator_id, free_user_ids):
+        self.token = token
+        self.user_id = user_id
+        self.task_id = task_id
+        self.project_id = project_id
+        self.collaborator_id = collaborator_id
+        self.free_user_ids = free_user_ids
+        self.created = {'users': [], 'tasks': [], 'projects': [], 'collaborators': []}
+        self.owned_task_ids = []
+        self.email = None
+        self.sync_token = None
+
+
+def discover(user_id):
+    """Find rows the benchmark user may read and write, creating what the dataset lacks"""
+    token = create_access_token(identity=str(user_id))
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    project_id = db.session.scalar(select(Project.id).where(Project.owner_id == user_id).limit(1))
+    if project_id is None:
+        project_id = client.post('/projects', json={'title': 'Benchmark project'}, headers=headers).json['id']
+    task_id = db.session.scalar(select(Task.id).where(Task.user_id == user_id, Task.project_id.isnot(None)).limit(1))
+    if task_id is None:
+        task_id = client.post('/tasks', json={'title': 'Benchmark task', 'project_id': project_id},
+                              headers=headers).json['id']
+
+    members = set(db.session.scalars(select(ProjectCollaborator.user_id)
+                                     .where(ProjectCollaborator.project_id == project_id)))
+    free_user_ids = list(db.session.scalars(
+        select(User.id).where(User.id != user_id, User.id.notin_(members) if members else True)
+        .order_by(User.id).limit(5000)
+    ))
+    collaborator_id = db.session.scalar(select(ProjectCollaborator.id)
+                                        .where(ProjectCollaborator.project_id == project_id).limit(1))
+    if collaborator_id is None:
+        collaborator_id = client.post('/project-collaborators', headers=headers, json={
+            'user_id': free_user_ids.pop(), 'project_id': project_id, 'role': 'member'}).json['id']
+
+    context = Context(token, user_id, task_id, project_id, collaborator_id, free_user_ids)
+    context.owned_task_ids = list(db.session.scalars(select(Task.id).where(Task.user_id == user_id)
+                                                     .order_by(Task.id).limit(50)))
+    # PATCH /users/<id> sets it to what it already is
+    context.email = db.session.scalar(select(User.email).where(User.id == user_id))
+    # Polls from here pick up whatever the write scenarios change
+    context.sync_token = client.get('/sync', headers=headers).json['token']
+    db.session.remove()
+    return context
+
+
+def scenarios(ctx):
+    def pop(kind):
+        def path(i):
+            ids = ctx.created[kind]
+            return path.template.format(ids.pop()) if ids else None
+        return path
+
+    def deletes(kind, template):
+        path = pop(kind)
+        path.template = template
+        path.__doc__ = template.format('<created>')
+        return path
+
+    def delete_user_path(i):
+        """/users/<created>"""
+        return f'/users/{ctx.created["users"][i][0]}'
+
+    def sync_path(i):
+        """/sync?since=<token>"""
+        return f'/sync?since={ctx.sync_token}'
+
+    def collaborator_body(i):
+        return {'user_id': ctx.free_user_ids[i], 'project_id': ctx.project_id, 'role': 'viewer'}
+
+    def bulk_body(i):
+        return {'operations': [{'op': 'update', 'id': task_id, 'data': {'priority': ('low', 'high')[i % 2]}}
+                               for task_id in ctx.owned_task_ids]}
+
+    users_created = lambda: len(ctx.created['users'])
+    return [
+        Scenario('GET', '/'),
+        Scenario('GET', '/health'),
+        Scenario('GET', '/metrics'),
+        Scenario('GET', '/metrics/profiling'),
+        Scenario('GET', '/metrics/password-hashing'),
+        Scenario('GET', '/metrics/db-pool'),
+        Scenario('GET', '/metrics/response-cache'),
+        Scenario('POST', '/auth/signup', expect=201, auth_heavy=True, body=lambda i: {
+            'username': f'bench{os.getpid()}_{i}', 'email': f'bench{os.getpid()}_{i}@example.com',
+            'password': BENCH_PASSWORD}),
+        Scenario('POST', '/auth/login', auth_heavy=True, limit=users_created, body=lambda i: {
+            'username': f'bench{os.getpid()}_{i}', 'password': BENCH_PASSWORD}),
+        Scenario('GET', '/auth/me'),
+        Scenario('GET', '/users?limit=100'),
+        Scenario('GET', f'/users/{ctx.user_id}'),
+        Scenario('PATCH', f'/users/{ctx.user_id}', body={'email': ctx.email}),
+        Scenario('GET', '/tasks?limit=100'),
+        Scenario('GET', '/tasks?open=true&limit=100'),
+        Scenario('GET', f'/tasks?project_id={ctx.project_id}&limit=100'),
+        Scenario('POST', '/tasks', expect=201, body={'title': 'Benchmark task', 'project_id': ctx.project_id}),
+        Scenario('POST', '/tasks/bulk', body=bulk_body),
+        Scenario('GET', f'/tasks/{ctx.task_id}'),
+        Scenario('PATCH', f'/tasks/{ctx.task_id}', body=lambda i: {'status': ('pending', 'in_progress')[i % 2]}),
+        Scenario('DELETE', deletes('tasks', '/tasks/{}'), expect=204),
+        Scenario('GET', '/projects?limit=20'),
+        Scenario('POST', '/projects', expect=201, body={'title': 'Benchmark project'}),
+        Scenario('GET', f'/projects/{ctx.project_id}'),
+        Scenario('PATCH', f'/projects/{ctx.project_id}', body=lambda i: {'description': f'Revision {i}'}),
+        Scenario('DELETE', deletes('projects', '/projects/{}'), expect=204),
+        Scenario('GET', '/stats'),
+        Scenario('GET', f'/projects/{ctx.project_id}/stats'),
+        Scenario('GET', '/search?q=invoice'),
+        Scenario('GET', '/search?q=quarterly%20budg'),
+        Scenario('GET', '/search?q=team&type=task'),
+        Scenario('GET', '/sync'),
+        Scenario('GET', sync_path),
+        Scenario('GET', '/project-collaborators?limit=100'),
+        Scenario('POST', '/project-collaborators', expect=201, body=collaborator_body,
+                 limit=lambda: len(ctx.free_user_ids)),
+        Scenario('GET', f'/project-collaborators/{ctx.collaborator_id}'),
+        Scenario('PATCH', f'/project-collaborators/{ctx.collaborator_id}', body={'role': 'member'}),
+        Scenario('DELETE', deletes('collaborators', '/project-collaborators/{}'), expect=204),
+        Scenario('DELETE', delete_user_path, expect=202, limit=users_created,
+                 token=lambda i: ctx.created['users'][i][1]),
+    ]
+
+
+class StatementCounter:
+    """Counts statements per thread, so concurrent requests are measured separately"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.local = threading.local()
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.local.count = getattr(self.local, 'count', 0) + 1
+
+    def read(self):
+        return getattr(self.local, 'count', 0)
+
+
+def remember_created(ctx, scenario, response):
+    if response.status_code != 201 or scenario.method != 'POST':
+        return
+    if scenario.name == 'POST /auth/signup':
+        ctx.created['users'].append((response.json['user']['id'], response.json['access_token']))
+    else:
+        kind = {'POST /tasks': 'tasks', 'POST /projects': 'projects',
+                'POST /project-collaborators': 'collaborators'}[scenario.name]
+        ctx.created[kind].append(response.json['id'])
+
+
+def run_scenario(ctx, scenario, requests, concurrency, counter):
+    total = requests if scenario.limit is None else min(requests, scenario.limit())
+    indexes = iter(range(total))
+    lock = threading.Lock()
+    latencies, statements, errors = [], [], []
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                i = next(indexes, None)
+            if i is None:
+                return
+            path = scenario.path(i) if callable(scenario.path) else scenario.path
+            if path is None:
+                return
+            body = scenario.body(i) if callable(scenario.body) else scenario.body
+            token = scenario.token(i) if scenario.token else ctx.token
+            headers = {'Authorization': f'Bearer {token}'}
+            before = counter.read()
+            start = time.perf_counter()
+            response = client.open(path, method=scenario.method, json=body, headers=headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statements.append(counter.read() - before)
+                if response.status_code != scenario.expect:
+                    errors.append(response.status_code)
+                else:
+                    remember_created(ctx, scenario, response)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(concurrency, total)))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    return summarize(latencies, statements, errors, wall)
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies, statements, errors, wall):
+    if not latencies:
+        return {'requests': 0}
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_statuses': sorted(set(errors)),
+        'rps': round(len(latencies) / wall, 1),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(ordered, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'sql_per_request': round(statistics.mean(statements), 2),
+        'sql_max': max(statements),
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit.strip() + ('-dirty' if dirty.strip() else '')
+
+
+def compare(report, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f'\ncompared with {baseline["meta"].get("commit")} ({baseline_path})')
+    print(f'{"route":<44} {"req/s":>16} {"p99 ms":>18} {"sql/request":>14}')
+    regressions = []
+    for name, result in report['routes'].items():
+        before = baseline['routes'].get(name)
+        if not before or not before.get('requests') or not result.get('requests'):
+            continue
+        sql_delta = result['sql_per_request'] - before['sql_per_request']
+        print(f'{name:<44} {before["rps"]:>7} -> {result["rps"]:<7} '
+              f'{before["p99_ms"]:>8} -> {result["p99_ms"]:<8} '
+              f'{before["sql_per_request"]:>5} -> {result["sql_per_request"]:<5}')
+        if sql_delta > 0:
+            regressions.append(name)
+    if regressions:
+        print(f'more SQL statements per request: {", ".join(regressions)}')
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--projects', type=int, default=500)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--no-seed', action='store_true', help='use the dataset already in DATABASE_URL')
+    parser.add_argument('--user-id', type=int, default=1, help='user the clients authenticate as')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--auth-requests', type=int, default=10, help='requests per bcrypt-bound route')
+    parser.add_argument('--concurrency', type=int, default=1, help='client threads per route')
+    parser.add_argument('--cache', action='store_true', help='leave the response cache on')
+    parser.add_argument('--routes', help='only routes whose name contains this text')
+    parser.add_argument('--output', default='benchmark_report.json')
+    parser.add_argument('--compare', help='earlier report to compare against')
+    args = parser.parse_args()
+
+    if not args.cache:
+        app.config['CACHE_BACKEND'] = 'none'
+        from cache import response_cache
+        response_cache.init_app(app)
+
+    with app.app_context():
+        if not args.no_seed:
+            reset_database()
+            seed_bulk(users=args.users, projects=args.projects, tasks=args.tasks)
+        dataset = {name: db.session.scalar(select(func.count()).select_from(model))
+                   for name, model in (('users', User), ('projects', Project), ('tasks', Task),
+                                       ('project_collaborators', ProjectCollaborator))}
+        ctx = discover(args.user_id)
+        engine = db.engine
+        dialect = engine.dialect.name
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'python': platform.python_version(),
+            'database': dialect,
+            'dataset': dataset,
+            'requests': args.requests,
+            'auth_requests': args.auth_requests,
+            'concurrency': args.concurrency,
+            'cache': args.cache,
+        },
+        'routes': {},
+    }
+    print(f'{"route":<44} {"n":>5} {"err":>4} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"sql":>6}')
+    with StatementCounter(engine) as counter:
+        for scenario in scenarios(ctx):
+            if args.routes and args.routes not in scenario.name:
+                continue
+            requests = args.auth_requests if scenario.auth_heavy else args.requests
+            result = run_scenario(ctx, scenario, requests, args.concurrency, counter)
+            report['routes'][scenario.name] = result
+            if result['requests']:
+                print(f'{scenario.name:<44} {result["requests"]:>5} {result["errors"]:>4} {result["rps"]:>8} '
+                      f'{result["p50_ms"]:>8} {result["p99_ms"]:>8} {result["sql_per_request"]:>6}')
+            else:
+                print(f'{scenario.name:<44} skipped: nothing to act on')
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'report written to {args.output}')
+
+    failed = sum(result.get('errors', 0) for result in report['routes'].values())
+    if failed:
+        print(f'{failed} request(s) got an unexpected status')
+    if args.compare and not compare(report, args.compare):
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
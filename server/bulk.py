@@ -0,0 +1,192 @@
+"""
+Batch task operations for POST /tasks/bulk.
+
+A request carries a list of operations:
+
+    {"operations": [
+        {"op": "create", "data": {"title": "...", "project_id": 3}},
+        {"op": "update", "id": 12, "data": {"status": "completed"}},
+        {"op": "delete", "id": 14}
+    ]}
+
+Every operation is validated up front with a fixed number of queries (one for
+the referenced tasks, one for the referenced projects) using the same access
+rules as the single-task routes. If any operation is invalid nothing is
+applied. Otherwise creates, updates and deletes each run as one executemany
+or set-based statement, in a single transaction.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+
+from models import db, Task, Project
+from permissions import visible, WRITE, WRITABLE_FIELDS as PATCH_FIELDS
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# Fields a bulk create or update may set: those of a single task PATCH
+WRITABLE_FIELDS = PATCH_FIELDS[Task]
+
+
+class BulkValidationError(Exception):
+    """One or more operations were rejected; carries the per-item errors"""
+
+    def __init__(self, errors):
+        super().__init__(f'{len(errors)} operation(s) rejected')
+        self.errors = errors
+
+
+def _error(index, status, message):
+    return {'index': index, 'status': status, 'error': message}
+
+
+def _clean(index, data, errors):
+    """Validate the fields of a create/update; returns the column values or None"""
+    if not isinstance(data, dict):
+        errors.append(_error(index, 400, 'data must be an object'))
+        return None
+    unknown = sorted(set(data) - set(WRITABLE_FIELDS))
+    if unknown:
+        errors.append(_error(index, 400, f'Unknown field(s): {", ".join(unknown)}'))
+        return None
+    values = dict(data)
+    if values.get('due_date'):
+        try:
+            values['due_date'] = datetime.fromisoformat(values['due_date'])
+        except (TypeError, ValueError):
+            errors.append(_error(index, 400, 'due_date must be an ISO 8601 date'))
+            return None
+    elif 'due_date' in values:
+        values['due_date'] = None
+    if 'title' in values and not values['title']:
+        errors.append(_error(index, 400, 'title cannot be empty'))
+        return None
+    return values
+
+
+def validate(operations, user_id, max_operations):
+    """Check every operation; returns ``(index, op, id, values, current)`` tuples or raises BulkValidationError.
+
+    ``current`` is the task's ``(user_id, project_id)`` before the operation
+    (None for creates), for telling whoever could see it.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BulkValidationError([_error(None, 400, 'operations must be a non-empty list')])
+    if len(operations) > max_operations:
+        raise BulkValidationError([_error(None, 400, f'At most {max_operations} operations per request')])
+
+    errors = []
+    planned = []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        if op not in (CREATE, UPDATE, DELETE):
+            errors.append(_error(index, 400, 'op must be create, update or delete'))
+            continue
+        task_id = None
+        if op != CREATE:
+            task_id = operation.get('id')
+            if not isinstance(task_id, int):
+                errors.append(_error(index, 400, 'id must be an integer'))
+                continue
+            if task_id in seen_ids:
+                errors.append(_error(index, 400, f'Task {task_id} appears more than once'))
+                continue
+            seen_ids.add(task_id)
+        values = None
+        if op != DELETE:
+            values = _clean(index, operation.get('data', {}), errors)
+            if values is None:
+                continue
+            if op == CREATE and not values.get('title'):
+                errors.append(_error(index, 400, 'title is required'))
+                continue
+        planned.append((index, op, task_id, values))
+
+    owned = {}
+    writable_projects = set()
+
+    # Ownership of every referenced task, in one query (same rule as task_by_id)
+    task_ids = [task_id for _, op, task_id, _ in planned if op != CREATE]
+    current = {}
+    if task_ids:
+        rows = db.session.execute(
+            select(Task.id, visible(Task, WRITE, user_id), Task.user_id, Task.project_id)
+            .where(Task.id.in_(task_ids))
+        ).all()
+        owned = {task_id: allowed for task_id, allowed, _, _ in rows}
+        current = {task_id: (assignee_id, project_id) for task_id, _, assignee_id, project_id in rows}
+    project_ids = {values['project_id'] for _, op, _, values in planned
+                   if values and values.get('project_id') is not None}
+    if project_ids:
+        writable_projects = set(db.session.scalars(
+            select(Project.id).where(Project.id.in_(project_ids), visible(Project, WRITE, user_id))
+        ))
+
+    for index, op, task_id, values in planned:
+        if op != CREATE:
+            if task_id not in owned:
+                errors.append(_error(index, 404, f'Task {task_id} not found'))
+                continue
+            if not owned[task_id]:
+                errors.append(_error(index, 403, 'Access denied'))
+                continue
+        if values and values.get('project_id') is not None and values['project_id'] not in writable_projects:
+            errors.append(_error(index, 403, f'Cannot add tasks to project {values["project_id"]}'))
+
+    if errors:
+        errors.sort(key=lambda error: error['index'])
+        raise BulkValidationError(errors)
+    return [(index, op, task_id, values, current.get(task_id)) for index, op, task_id, values in planned]
+
+
+def apply(planned, user_id):
+    """Run validated operations in one transaction; returns per-item results"""
+    now = datetime.utcnow()
+    results = [None] * len(planned)
+
+    creates = [(position, values) for position, (_, op, _, values, _) in enumerate(planned) if op == CREATE]
+    if creates:
+        rows = [{
+            'title': values['title'],
+            'description': values.get('description', ''),
+            'status': values.get('status', 'pending'),
+            'priority': values.get('priority', 'medium'),
+            'due_date': values.get('due_date'),
+            'project_id': values.get('project_id'),
+            'user_id': user_id,
+            'created_at': now,
+            'updated_at': now,
+        } for _, values in creates]
+        new_ids = db.session.scalars(
+            insert(Task).returning(Task.id, sort_by_parameter_order=True), rows
+        ).all()
+        for (position, _), task_id in zip(creates, new_ids):
+            results[position] = (task_id, 201)
+
+    updates = [(position, task_id, values) for position, (_, op, task_id, values, _) in enumerate(planned) if op == UPDATE]
+    if updates:
+        # Rows with the same set of changed fields share one executemany batch
+        db.session.execute(update(Task), [
+            dict(values, id=task_id, updated_at=now) for _, task_id, values in updates
+        ])
+        for position, task_id, _ in updates:
+            results[position] = (task_id, 200)
+
+    deletes = [(position, task_id) for position, (_, op, task_id, _, _) in enumerate(planned) if op == DELETE]
+    if deletes:
+        db.session.execute(
+            delete(Task).where(Task.id.in_([task_id for _, task_id in deletes])),
+            execution_options={'synchronize_session': False},
+        )
+        for position, task_id in deletes:
+            results[position] = (task_id, 204)
+
+    db.session.commit()
+    return [
+        {'index': index, 'op': op, 'id': results[position][0], 'status': results[position][1]}
+        for position, (index, op, _, _, _) in enumerate(planned)
+    ]
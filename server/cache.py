@@ -0,0 +1,434 @@
+"""
+Response cache with tag-based invalidation.
+
+Cached entries are whole responses (status, body and the headers that
+matter) keyed by user and request path plus query string. Each entry is
+tagged with every row it embeds (``tasks:12``, ``projects:3``, ``users:5``)
+and with list tags such as ``tasks-of:5``, which mark "this user's task
+list". Write paths invalidate exactly the tags they touch; see the
+``invalidate_*`` helpers at the bottom.
+
+Backends, chosen by ``CACHE_BACKEND``:
+
+- ``lru``: in-process, bounded by ``CACHE_MAX_ENTRIES``. Invalidation
+  only reaches the process that served the write, so it suits a single
+  process; gunicorn.conf.py picks it for one worker and refuses it for more.
+- ``redis``: shared between workers, at ``CACHE_REDIS_URL``. Needs the
+  optional ``redis`` package. ``InMemoryRedis`` implements the few
+  commands used and can stand in for a server locally.
+- ``none`` (default): caching disabled. Outside gunicorn.conf.py the
+  number of processes is unknown (serverless hosts such as Vercel run any
+  number of instances), and an lru cache there would serve other
+  instances' stale lists for up to ``CACHE_TTL``.
+
+A response computed while a write commits could otherwise be stored after
+that write's invalidation had already run, and be served stale for the
+whole TTL. Every invalidation therefore takes a number from a generation
+counter and records it against each tag it clears; a request reads the
+counter before running its query and passes that to ``store``, which
+skips the entry when any of its tags has been invalidated since.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, current_app
+from sqlalchemy import select
+from sqlalchemy.orm.attributes import instance_state
+
+from models import db, ProjectCollaborator, Project
+from serializers import get_serializer
+
+
+class LRUBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}                # tag -> set of keys
+        self._generation = 0
+        self._invalidated = OrderedDict()  # tag -> generation of its last invalidation
+        self._forgotten = 0            # newest generation dropped from _invalidated
+        self._lock = threading.Lock()
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, tags, ttl, since=None):
+        """Store ``value``, unless ``since`` is given and a tag was invalidated after it"""
+        with self._lock:
+            if since is not None and (self._forgotten > since or
+                                      any(self._invalidated.get(tag, 0) > since for tag in tags)):
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                self._invalidated[tag] = self._generation
+                self._invalidated.move_to_end(tag)
+            # Past the bound, stores begun before the oldest dropped tag are refused
+            while len(self._invalidated) > self.max_entries * 4:
+                self._forgotten = self._invalidated.popitem(last=False)[1]
+            removed = 0
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+            return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._generation += 1
+            self._forgotten = self._generation
+            self._invalidated.clear()
+
+    def size(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend:
+    """Entries as plain keys with a TTL; each tag is a set of the keys carrying it.
+
+    The generation counter is ``<prefix>generation``; an invalidation writes
+    its number to ``<prefix>gen:<tag>`` for each tag, kept for
+    ``GENERATION_TTL`` seconds (longer than any request runs), and ``clear``
+    writes it to ``<prefix>cleared``.
+    """
+
+    GENERATION_TTL = 3600
+
+    def __init__(self, client, prefix='planwise:cache:'):
+        self.client = client
+        self.prefix = prefix
+        self.evictions = 0  # Redis evicts on its own; not observable here
+
+    def generation(self):
+        return int(self.client.get(self.prefix + 'generation') or 0)
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key, value, tags, ttl, since=None):
+        """Store ``value``, unless ``since`` is given and a tag was invalidated after it"""
+        ttl = max(1, int(ttl))
+        self.client.set(self.prefix + key, value, ex=ttl)
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            self.client.sadd(tag_key, key)
+            self.client.expire(tag_key, ttl)
+        if since is None:
+            return True
+        # Checked after the write: an invalidation that bumps its tags after
+        # this read still finds the key in the tag sets and deletes it
+        markers = [self.prefix + 'cleared'] + [self.prefix + 'gen:' + tag for tag in tags]
+        if any(int(value) > since for value in self.client.mget(markers) if value is not None):
+            self.client.delete(self.prefix + key)
+            return False
+        return True
+
+    def invalidate(self, tags):
+        generation = self.client.incr(self.prefix + 'generation')
+        for tag in tags:
+            self.client.set(self.prefix + 'gen:' + tag, generation, ex=self.GENERATION_TTL)
+        removed = 0
+        for tag in tags:
+            tag_key = self.prefix + 'tag:' + tag
+            keys = self.client.smembers(tag_key)
+            if keys:
+                removed += self.client.delete(*[
+                    self.prefix + (k.decode('utf-8') if isinstance(k, bytes) else k) for k in keys
+                ])
+            self.client.delete(tag_key)
+        return removed
+
+    def clear(self):
+        counter = self.prefix + 'generation'
+        generation = self.client.incr(counter)
+        for key in self.client.scan_iter(self.prefix + '*'):
+            if key not in (counter, counter.encode()):
+                self.client.delete(key)
+        self.client.set(self.prefix + 'cleared', generation, ex=self.GENERATION_TTL)
+
+    def size(self):
+        return None
+
+
+class InMemoryRedis:
+    """The subset of the redis-py client RedisBackend uses, kept in a dict"""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires < time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            return self._data[key] if self._live(key) else None
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._data[key] if self._live(key) else None for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data[key]) + 1 if self._live(key) else 1
+            self._data[key] = value
+            return value
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = value
+            self._expires.pop(key, None)
+            if ex is not None:
+                self._expires[key] = time.monotonic() + ex
+            return True
+
+    def sadd(self, key, *members):
+        with self._lock:
+            if not self._live(key):
+                self._data[key] = set()
+            members_set = self._data[key]
+            before = len(members_set)
+            members_set.update(members)
+            return len(members_set) - before
+
+    def smembers(self, key):
+        with self._lock:
+            return set(self._data[key]) if self._live(key) else set()
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if not self._live(key):
+                return False
+            self._expires[key] = time.monotonic() + seconds
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._live(key):
+                    removed += 1
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return removed
+
+    def scan_iter(self, pattern):
+        prefix = pattern.rstrip('*')
+        with self._lock:
+            return [key for key in list(self._data) if key.startswith(prefix)]
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 60
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_skips = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('CACHE_TTL', 60)
+        kind = app.config.get('CACHE_BACKEND', 'none')
+        if kind == 'lru':
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif kind == 'redis':
+            self.backend = RedisBackend(_redis_client(app.config.get('CACHE_REDIS_URL')))
+        elif kind == 'none':
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown CACHE_BACKEND {kind!r}')
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def key_for_request(self, user_id):
+        return f'{user_id}:{request.full_path}'
+
+    def get_response(self, key):
+        """The cached response for ``key``, as 304 if the client holds its ETag; None on a miss"""
+        if self.backend is None:
+            return None
+        raw = self.backend.get(key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        entry = json.loads(raw)
+        headers = entry['headers']
+        etag = headers.get('ETag')
+        if etag and request.if_none_match.contains_raw(etag):
+            return current_app.response_class(status=304, headers=headers)
+        return current_app.response_class(entry['body'], status=entry['status'], headers=headers,
+                                          mimetype='application/json')
+
+    def generation(self):
+        """Read before running the query whose response goes to ``store``; None when disabled"""
+        return self.backend.generation() if self.backend is not None else None
+
+    def store(self, key, response, tags, since=None):
+        """Cache ``response``; skipped if ``since`` (from generation()) predates an invalidation of a tag"""
+        if self.backend is None or response.status_code != 200:
+            return
+        headers = {name: response.headers[name]
+                   for name in ('ETag', 'Cache-Control', 'X-Next-Cursor') if name in response.headers}
+        entry = json.dumps({'status': response.status_code, 'headers': headers,
+                            'body': response.get_data(as_text=True)})
+        if not self.backend.set(key, entry, sorted(set(tags)), self.ttl, since):
+            with self._lock:
+                self.stale_skips += 1
+
+    def invalidate(self, *tags):
+        if self.backend is None or not tags:
+            return
+        removed = self.backend.invalidate(tags)
+        with self._lock:
+            self.invalidations += removed
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__ if self.backend else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.backend.evictions if self.backend else 0,
+                'invalidations': self.invalidations,
+                'stale_skips': self.stale_skips,
+                'entries': self.backend.size() if self.backend else 0,
+            }
+
+
+def _redis_client(url):
+    if not url or url == 'memory://':
+        return InMemoryRedis()
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError('CACHE_BACKEND=redis needs the redis package (pip install redis)')
+    return redis.Redis.from_url(url)
+
+
+response_cache = ResponseCache()
+
+
+def entity_tag(table, id):
+    return f'{table}:{id}'
+
+
+def tasks_of(user_id):
+    return f'tasks-of:{user_id}'
+
+
+def projects_of(user_id):
+    return f'projects-of:{user_id}'
+
+
+def entity_tags(model, shape, rows):
+    """Tags for every row a response embeds: the rows and each loaded nested relationship"""
+    tags = set()
+    _collect(get_serializer(model, shape), rows, tags)
+    return tags
+
+
+def _collect(serializer, rows, tags):
+    table = serializer.model.__tablename__
+    for row in rows:
+        tags.add(entity_tag(table, row.id))
+        loaded = instance_state(row).dict
+        for name, child, uselist in serializer.relations:
+            value = loaded.get(name)
+            if value is None:
+                continue
+            _collect(child, value if uselist else (value,), tags)
+
+
+def project_audience(project_id):
+    """Ids of everyone whose project list includes the project"""
+    owner = select(Project.owner_id).where(Project.id == project_id)
+    collaborators = select(ProjectCollaborator.user_id).where(ProjectCollaborator.project_id == project_id)
+    return set(db.session.scalars(owner.union(collaborators)))
+
+
+def invalidate_tasks(task_ids, assignee_id, project_ids=()):
+    """Tasks were created, changed or deleted.
+
+    Lists that already hold a task carry its tag; ``project_ids`` are the
+    projects the tasks now belong to, whose lists must pick up new members.
+    """
+    tags = [tasks_of(assignee_id)]
+    tags.extend(entity_tag('tasks', task_id) for task_id in task_ids)
+    tags.extend(entity_tag('projects', project_id) for project_id in project_ids if project_id is not None)
+    response_cache.invalidate(*tags)
+
+
+def invalidate_task(task_id, assignee_id, project_id=None):
+    invalidate_tasks((task_id,), assignee_id, (project_id,))
+
+
+def invalidate_project(project_id, audience):
+    """A project was created, changed or deleted; ``audience`` from project_audience()"""
+    response_cache.invalidate(entity_tag('projects', project_id), *(projects_of(user_id) for user_id in audience))
+
+
+def invalidate_collaborator(user_id, project_id):
+    response_cache.invalidate(entity_tag('projects', project_id), projects_of(user_id))
+
+
+def invalidate_user(user_id):
+    response_cache.invalidate(entity_tag('users', user_id))
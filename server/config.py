@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,9 +9,113 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///task_manager.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool and timeouts (see database.py); DB_POOL_SIZE=0 opens a
+    # connection per checkout, for PgBouncer in transaction mode
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '10'))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', '10'))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', '30000'))
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', 'false').lower() in ('1', 'true', 'yes')
+    
+    # Pagination: page size when the client sends no limit, and the hard cap
+    PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', '100'))
+    PAGE_SIZE_MAX = int(os.environ.get('PAGE_SIZE_MAX', '500'))
+    # Rows fetched and written per batch by streamed collection responses
+    STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '1000'))
+    
     # Security Configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-string'
+    # Access tokens carry the user (see identity.py); refresh tokens get new
+    # ones from POST /auth/refresh without logging in again
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(seconds=int(os.environ.get('JWT_ACCESS_TOKEN_EXPIRES', '86400')))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(seconds=int(os.environ.get('JWT_REFRESH_TOKEN_EXPIRES', str(30 * 86400))))
+    # Seconds each process trusts a user's cached version (0 = look it up
+    # on every request), and how many users it remembers
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '30'))
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000'))
+    
+    # Dashboard statistics read the trigger-maintained task_counts summary, or
+    # aggregate the tasks table directly with STATS_SOURCE=tasks
+    STATS_SOURCE = os.environ.get('STATS_SOURCE', 'summary')
+    
+    # Maximum operations accepted by POST /tasks/bulk
+    BULK_MAX_OPERATIONS = int(os.environ.get('BULK_MAX_OPERATIONS', '500'))
+    
+    # Password hashing: bcrypt work factor, process pool size (0 = inline),
+    # cap on running plus queued hashing jobs, and seconds to wait for one
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', '12'))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+    
+    # ASGI entry point (asgi.py): threads per worker for the routes that still
+    # run on Flask; the async routes share one event loop
+    ASGI_FLASK_THREADS = int(os.environ.get('ASGI_FLASK_THREADS', '4'))
+    
+    # Response cache for list routes: lru (per process), redis (shared) or none.
+    # Off unless chosen: nothing here knows how many processes serve the app
+    # (serverless runs many). gunicorn.conf.py picks lru for a single worker
+    # and redis, when CACHE_REDIS_URL is set, for more.
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'none')
+    CACHE_TTL = int(os.environ.get('CACHE_TTL', '60'))
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', '')
+    
+    # JSON responses: encoder (auto uses orjson or msgspec when installed,
+    # else the standard library) and compact output outside development
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')
+    JSON_COMPACT = os.environ.get(
+        'JSON_COMPACT', str(os.environ.get('FLASK_ENV', 'production') != 'development')
+    ).lower() in ('1', 'true', 'yes')
+    
+    # Request profiling (see profiling.py): every request, or one sending
+    # X-Profile: <PROFILING_TOKEN>; a sampled fraction also runs under a
+    # profiler, keeping dumps of the slowest few per route
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+    PROFILING_KEEP_SLOWEST = int(os.environ.get('PROFILING_KEEP_SLOWEST', '5'))
+    PROFILING_PROFILER = os.environ.get('PROFILING_PROFILER', 'cprofile')
+    PROFILING_DIR = os.environ.get('PROFILING_DIR', 'profiles')
+    
+    # /metrics: with several gunicorn workers each one writes its counters to
+    # PROMETHEUS_MULTIPROC_DIR at most every METRICS_FLUSH_INTERVAL seconds
+    METRICS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))
+    # /metrics and /metrics/* need `Authorization: Bearer <token>`; unset, they
+    # only answer requests from localhost
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    
+    # /health fails unless the database answers SELECT 1 within this budget
+    HEALTH_DB_TIMEOUT_MS = int(os.environ.get('HEALTH_DB_TIMEOUT_MS', '1000'))
+    
+    # GET /sync tokens expire after this many days; `flask prune-changes`
+    # deletes the change log behind them
+    SYNC_RETENTION_DAYS = int(os.environ.get('SYNC_RETENTION_DAYS', '30'))
+    
+    # GET /events (see events.py): auto, local, postgres or none; streams per
+    # process, messages a stream may fall behind by before it is closed, and
+    # seconds between keepalives
+    EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'auto')
+    EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('EVENTS_MAX_SUBSCRIBERS', '1000'))
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', '256'))
+    EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', '15'))
+    
+    # Background jobs (see jobs.py): who runs them (thread, worker or inline),
+    # seconds between polls for due jobs, seconds a job's lease lasts without
+    # a checkpoint, attempts before giving up, seconds before the first retry
+    # (doubled each time), rows deleted per transaction, and days finished
+    # jobs are kept
+    JOBS_EXECUTOR = os.environ.get('JOBS_EXECUTOR', 'thread')
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '1'))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+    JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', '10'))
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', '5000'))
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '7'))
     
     # CORS Configuration
     CORS_ORIGINS = os.environ.get('FRONTEND_URL', 'https://planwise-phase4-project-frontend.vercel.app').split(',')
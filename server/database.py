@@ -0,0 +1,280 @@
+"""
+Engine and connection pool configuration, and pool metrics.
+
+``engine_options()`` turns the ``DB_*`` settings in ``Config`` into the
+engine options Flask-SQLAlchemy passes to ``create_engine``:
+
+- ``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW``: connections kept open, and extra
+  ones opened under load. A pool size of 0 opens a connection per checkout
+  (``NullPool``), which suits PgBouncer in transaction mode.
+- ``DB_POOL_TIMEOUT``: whole seconds to wait for a free connection before
+  failing (Flask-SQLAlchemy coerces engine options, so fractions are dropped).
+- ``DB_POOL_RECYCLE``: replace connections older than this many seconds,
+  before the server or a proxy drops them.
+- ``DB_POOL_PRE_PING``: test each connection on checkout and reconnect if it
+  went stale, instead of failing the request.
+- ``DB_STATEMENT_TIMEOUT_MS``: PostgreSQL ``statement_timeout``, sent as a
+  startup option (0 disables it). Migrations lift it for their run (see
+  migrations/env.py).
+- ``DB_PGBOUNCER``: disable server-side prepared statements for drivers that
+  use them (psycopg 3, asyncpg), and don't send startup options, which
+  PgBouncer rejects. Set ``statement_timeout`` on the database role instead.
+
+``async_engine_options()`` and ``async_url()`` do the same for the async
+engine the ASGI entry point uses (asyncpg or aiosqlite; see asgi.py), which
+has its own pool of the same size.
+
+The pool classes below count checkouts, time spent waiting for a connection
+and checkout timeouts. ``stats()`` adds the pool's live counts. ``ping()``
+is the readiness check: one round trip within a time budget.
+
+SQLite leaves foreign keys unenforced unless each connection asks for them,
+so ``init_app()`` turns them on for every connection (``enforce_foreign_keys``):
+the ``ON DELETE CASCADE`` keys do the deleting there as on PostgreSQL.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from sqlalchemy import event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.waits = 0
+            self.timeouts = 0
+            self.invalidations = 0
+            self.checkout_seconds_total = 0.0
+            self.checkout_seconds_max = 0.0
+
+    def record_checkout(self, seconds, waited):
+        with self._lock:
+            self.checkouts += 1
+            self.waits += waited
+            self.checkout_seconds_total += seconds
+            self.checkout_seconds_max = max(self.checkout_seconds_max, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.waits += 1
+            self.timeouts += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'invalidations': self.invalidations,
+                'checkout_ms_avg': round(self.checkout_seconds_total / self.checkouts * 1000, 3)
+                if self.checkouts else 0.0,
+                'checkout_ms_max': round(self.checkout_seconds_max * 1000, 3),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class _InstrumentedPool:
+    """Times every checkout; a pool recreated after dispose() keeps reporting to pool_metrics"""
+
+    def _must_wait(self):
+        return False
+
+    def _do_get(self):
+        waited = self._must_wait()
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start, waited)
+        return connection
+
+
+class InstrumentedQueuePool(_InstrumentedPool, QueuePool):
+    def _must_wait(self):
+        # No idle connection and no room to open another one
+        return self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """For the async engine; inherits the invalidation listener below"""
+
+
+class InstrumentedNullPool(_InstrumentedPool, NullPool):
+    pass
+
+
+def _count_invalidation(dbapi_connection, connection_record, exception):
+    pool_metrics.record_invalidation()
+
+
+for _pool_class in (InstrumentedQueuePool, InstrumentedNullPool):
+    event.listen(_pool_class, 'invalidate', _count_invalidation)
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, uri=None):
+    """Engine options for ``SQLALCHEMY_ENGINE_OPTIONS`` from the ``DB_*`` settings"""
+    url = make_url(uri or config['SQLALCHEMY_DATABASE_URI'])
+    if _is_memory_sqlite(url):
+        # Flask-SQLAlchemy gives in-memory SQLite a single shared connection
+        return {}
+
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if config['DB_POOL_SIZE'] == 0:
+        options['poolclass'] = InstrumentedNullPool
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
+
+    if url.get_backend_name() == 'postgresql':
+        connect_args = {}
+        driver = url.get_driver_name()
+        if config['DB_PGBOUNCER']:
+            if driver == 'psycopg':
+                connect_args['prepare_threshold'] = None
+            elif driver == 'asyncpg':
+                connect_args['statement_cache_size'] = 0
+                connect_args['prepared_statement_cache_size'] = 0
+        elif config['DB_STATEMENT_TIMEOUT_MS'] and driver == 'asyncpg':
+            connect_args['server_settings'] = {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT_MS'])}
+        elif config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['options'] = f'-c statement_timeout={config["DB_STATEMENT_TIMEOUT_MS"]}'
+        if connect_args:
+            options['connect_args'] = connect_args
+    return options
+
+
+# Backend -> the async driver the ASGI entry point uses for it
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_url(uri):
+    """``uri`` with the async driver for its backend"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for {backend}; supported: {", ".join(ASYNC_DRIVERS)}')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def async_engine_options(config):
+    """Engine options for ``create_async_engine`` from the same ``DB_*`` settings"""
+    options = engine_options(config, async_url(config['SQLALCHEMY_DATABASE_URI']))
+    if options.get('poolclass') is InstrumentedQueuePool:
+        options['poolclass'] = InstrumentedAsyncQueuePool
+    return options
+
+
+def _foreign_keys_on(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys = ON')
+    cursor.close()
+
+
+def enforce_foreign_keys(engine):
+    """Turn on foreign key enforcement for every new SQLite connection of ``engine``"""
+    if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', _foreign_keys_on):
+        event.listen(engine, 'connect', _foreign_keys_on)
+
+
+def init_app(app, db):
+    """Set SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings, then set up ``db`` on ``app``
+
+    Flask-SQLAlchemy creates its engines in ``db.init_app()`` without
+    connecting, so the connect hooks are in place before the first connection.
+    """
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            enforce_foreign_keys(engine)
+
+
+def stats(engine):
+    """Pool configuration, live connection counts and checkout metrics"""
+    pool = engine.pool
+    data = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        data.update(
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            idle=pool.checkedin(),
+            in_use=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    data.update(pool_metrics.snapshot())
+    return data
+
+
+class DatabaseUnavailable(Exception):
+    """The database did not answer a round trip in time, or failed"""
+
+
+_ping_lock = threading.Lock()
+_ping_executor = None
+_ping_pid = None
+_ping_future = None
+
+
+def _round_trip(engine):
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        connection.exec_driver_sql('SELECT 1')
+    return (time.perf_counter() - start) * 1000
+
+
+def ping(engine, timeout):
+    """Run ``SELECT 1`` and return the round trip in ms; raises DatabaseUnavailable.
+
+    The query runs on a helper thread, so a hung connection or a full pool
+    fails the check after ``timeout`` seconds instead of holding the request.
+    Until a hung check finishes, later checks fail straight away rather than
+    queueing behind it.
+    """
+    global _ping_executor, _ping_pid, _ping_future
+    with _ping_lock:
+        if _ping_executor is None or _ping_pid != os.getpid():
+            _ping_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-ping')
+            _ping_pid = os.getpid()
+            _ping_future = None
+        if _ping_future is not None and not _ping_future.done():
+            raise DatabaseUnavailable('previous check still waiting for the database')
+        future = _ping_future = _ping_executor.submit(_round_trip, engine)
+    try:
+        return round(future.result(timeout=timeout), 3)
+    except FutureTimeout:
+        raise DatabaseUnavailable(f'no answer within {timeout * 1000:.0f} ms')
+    except SQLAlchemyError as e:
+        raise DatabaseUnavailable(type(e.orig if getattr(e, 'orig', None) else e).__name__)
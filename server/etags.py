@@ -0,0 +1,97 @@
+"""
+Weak ETags from updated_at watermarks.
+
+A response's ETag is a hash of the request (path, query string, user) and of
+the newest timestamp and row count of every table that feeds it: the rows
+themselves plus each nested relationship of the serializer shape. One
+aggregate statement computes all of it, without loading or serializing rows,
+so a matching ``If-None-Match`` is answered with 304 almost for free.
+
+Row counts catch deletes, which leave no newer timestamp behind. The
+watermark covers every row that matches the route's filters, not just the
+current page. That can only cause false misses, never stale 304s.
+
+``If-Match`` on PATCH uses the same tags for optimistic concurrency. They
+are weak, so the comparison is weak too: good enough to detect a concurrent
+edit, since any write moves ``updated_at``.
+"""
+
+import hashlib
+
+from flask import request, current_app
+from sqlalchemy import func, select
+
+from models import db
+from serializers import get_serializer
+
+
+class PreconditionFailed(Exception):
+    """If-Match did not match the resource's current ETag"""
+
+
+def _timestamp_column(model):
+    return model.__table__.c.updated_at
+
+
+def _watermark_columns(model, ids, relations, columns):
+    in_scope = model.id.in_(ids)
+    columns.append(select(func.max(_timestamp_column(model))).where(in_scope).scalar_subquery())
+    columns.append(select(func.count()).select_from(model).where(in_scope).scalar_subquery())
+    for name, child, _ in relations:
+        prop = model.__mapper__.relationships[name]
+        (local, remote), = prop.local_remote_pairs
+        child_ids = select(child.model.id).where(remote.in_(select(local).where(in_scope)))
+        _watermark_columns(child.model, child_ids, child.relations, columns)
+
+
+def watermark_query(model, shape, ids):
+    """The aggregate statement ``watermark()`` runs, for callers with their own session"""
+    columns = []
+    _watermark_columns(model, ids, get_serializer(model, shape).relations, columns)
+    return select(*columns)
+
+
+def watermark(model, shape, ids):
+    """Newest timestamp and row count for the rows ``ids`` selects and everything the shape nests"""
+    return tuple(db.session.execute(watermark_query(model, shape, ids)).one())
+
+
+def request_etag(user_id, watermark):
+    """The ETag of the current request's response, given its watermark"""
+    parts = (request.path, sorted(request.args.items(multi=True)), user_id, watermark)
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def make_etag(model, shape, ids, user_id):
+    return request_etag(user_id, watermark(model, shape, ids))
+
+
+def collection_etag(model, shape, query, user_id):
+    """ETag for a filtered collection; ``query`` is the route's query before pagination"""
+    ids = query.enable_eagerloads(False).with_entities(model.id).order_by(None).scalar_subquery()
+    return make_etag(model, shape, ids, user_id)
+
+
+def item_etag(model, shape, id, user_id):
+    return make_etag(model, shape, [id], user_id)
+
+
+def not_modified(etag):
+    """A 304 response if the client already holds ``etag``, else None"""
+    if request.if_none_match.contains_weak(etag):
+        return finish(current_app.response_class(status=304), etag)
+    return None
+
+
+def check_if_match(etag):
+    """Raise PreconditionFailed unless If-Match is absent, '*' or matches ``etag``"""
+    if_match = request.if_match
+    if if_match and not if_match.star_tag and not if_match.contains_weak(etag):
+        raise PreconditionFailed('Resource was modified since it was fetched')
+
+
+def finish(response, etag):
+    response.set_etag(etag, weak=True)
+    # Clients may keep the copy but must revalidate before every use
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
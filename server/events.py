@@ -0,0 +1,464 @@
+"""
+Push notifications of task, project and collaborator changes (``GET /events``).
+
+``GET /events`` is a Server-Sent Events stream. Each change made through
+the task, project and collaborator routes arrives as one compact message,
+for example ``{"type": "task", "action": "updated", "id": 12,
+"project_id": 3}``. It reaches everyone who can open the project (its
+owner and collaborators) and the task's assignee. Messages say what
+changed but don't include the record. Clients fetch the records they
+care about, or poll ``GET /sync`` with the token they already hold. The
+stream also sends:
+
+- ``event: ready`` once the subscription is live
+- a ``: keepalive`` comment every ``EVENTS_HEARTBEAT`` seconds
+- ``event: reset`` before the server closes a stream that fell behind
+
+After a reset or a dropped connection, a client may have missed changes:
+reconnect and catch up through ``GET /sync``.
+
+Writes publish after they commit and never wait on a reader; a publish
+that fails is logged and counted, and the write still succeeds. Each
+subscriber has a queue of ``EVENTS_QUEUE_SIZE`` messages; a subscriber
+whose queue is full is evicted rather than slowing the writer down. At most
+``EVENTS_MAX_SUBSCRIBERS`` streams are open per process; beyond that
+``GET /events`` answers 503. A stream holds a thread of the Flask app, but
+no database connection while idle. The ASGI entry point (asgi.py) serves
+the streams on its event loop instead.
+
+Backends, chosen by ``EVENTS_BACKEND``:
+
+- ``local``: delivered within the process that served the write. The
+  subscribers of other gunicorn workers don't hear about it.
+- ``postgres``: ``NOTIFY`` on publish. Each process with subscribers holds
+  one ``LISTEN`` connection and fans the messages out to them. It needs a
+  direct connection, not PgBouncer in transaction mode.
+- ``auto`` (default): ``postgres`` on PostgreSQL without PgBouncer, else
+  ``local``.
+- ``none``: nothing is published, and ``GET /events`` answers 503.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from select import select as wait_readable
+
+from flask import current_app, jsonify
+from sqlalchemy import func, select
+
+from models import db, Project
+from permissions import visible
+
+log = logging.getLogger(__name__)
+
+# Change types whose events can change which projects a subscriber sees
+MEMBERSHIP_TYPES = ('project', 'collaborator')
+
+
+class Subscriber:
+    """One open stream: the user, the projects they see and their pending messages"""
+
+    def __init__(self, user_id, projects, max_pending):
+        self.user_id = user_id
+        self.projects = set(projects)
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.evicted = False
+        # Set when a change may have added or removed one of the user's projects
+        self.stale = False
+        self._ready = threading.Event()
+
+    def offer(self, message):
+        """Queue ``message``; False when the queue is full. Called with the broker's lock held."""
+        if len(self.pending) >= self.max_pending:
+            return False
+        self.pending.append(message)
+        self.wake()
+        return True
+
+    def take(self):
+        """Every pending message, oldest first"""
+        self._ready.clear()
+        messages = []
+        while self.pending:
+            messages.append(self.pending.popleft())
+        return messages
+
+    def wake(self):
+        self._ready.set()
+
+    def wait(self, timeout):
+        """Block until a message arrives or ``timeout`` seconds pass"""
+        return self._ready.wait(timeout)
+
+
+class AsyncSubscriber(Subscriber):
+    """A subscriber whose stream runs on an event loop; woken from any thread"""
+
+    def __init__(self, user_id, projects, max_pending, loop):
+        super().__init__(user_id, projects, max_pending)
+        self._loop = loop
+        self._ready = asyncio.Event()
+
+    def wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # The loop has closed; the stream is gone
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class LocalChannel:
+    """The LISTEN/NOTIFY subset PostgresBackend uses, within one process"""
+
+    def __init__(self):
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def listen(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def notify(self, payload):
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback(payload)
+
+
+class LocalBackend:
+    """Messages reach the brokers listening on ``channel``: by default only this process's"""
+
+    def __init__(self, channel=None):
+        self.channel = channel or LocalChannel()
+
+    def start(self, deliver, reset):
+        self.channel.listen(deliver)
+
+    def publish(self, payload):
+        self.channel.notify(payload)
+
+
+class PostgresBackend:
+    """NOTIFY on publish; a thread LISTENs on its own connection and delivers to this process"""
+
+    def __init__(self, engine, channel='planwise_events', poll_interval=5):
+        self.engine = engine
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._listening = threading.Event()
+        self._thread = None
+
+    def start(self, deliver, reset, timeout=5):
+        self._thread = threading.Thread(target=self._listen, args=(deliver, reset),
+                                        name='events-listener', daemon=True)
+        self._thread.start()
+        # So the first stream doesn't report ready before anything can reach it
+        self._listening.wait(timeout)
+
+    def publish(self, payload):
+        # Fails with PostgreSQL's own error past its 8000-byte payload limit;
+        # messages are a few dozen bytes
+        if self.engine is None:
+            # A process may write before anything subscribes in it
+            self.engine = db.engine
+        with self.engine.begin() as connection:
+            connection.execute(func.pg_notify(self.channel, payload).select())
+
+    def _listen(self, deliver, reset):
+        delay = 0.5
+        while True:
+            connection = None
+            try:
+                # Taken out of the pool for good: it stays idle in LISTEN
+                connection = self.engine.raw_connection()
+                connection.detach()
+                driver = connection.driver_connection
+                driver.autocommit = True
+                driver.cursor().execute(f'LISTEN {self.channel}')
+                if self._listening.is_set():
+                    # Messages sent while no connection was listening are lost
+                    reset()
+                self._listening.set()
+                delay = 0.5
+                while True:
+                    if wait_readable([driver], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    driver.poll()
+                    while driver.notifies:
+                        deliver(driver.notifies.pop(0).payload)
+            except Exception:
+                log.exception('Event listener connection failed; reconnecting in %.1fs', delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+class Broker:
+    def __init__(self, app=None):
+        self.backend = None
+        self.max_subscribers = 1000
+        self.queue_size = 256
+        self.heartbeat = 15
+        self.published = 0
+        self.delivered = 0
+        self.evicted = 0
+        self.rejected = 0
+        self.failed = 0
+        self._by_user = {}     # user id -> set of subscribers
+        self._by_project = {}  # project id -> set of subscribers
+        self._started = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_subscribers = app.config.get('EVENTS_MAX_SUBSCRIBERS', 1000)
+        self.queue_size = app.config.get('EVENTS_QUEUE_SIZE', 256)
+        self.heartbeat = app.config.get('EVENTS_HEARTBEAT', 15)
+        kind = app.config.get('EVENTS_BACKEND', 'auto')
+        url = app.config['SQLALCHEMY_DATABASE_URI'] or ''
+        if kind == 'auto':
+            postgres = url.startswith('postgresql') and not app.config.get('DB_PGBOUNCER')
+            kind = 'postgres' if postgres else 'local'
+        if kind == 'local':
+            self.backend = LocalBackend()
+        elif kind == 'postgres':
+            if not url.startswith('postgresql'):
+                raise RuntimeError('EVENTS_BACKEND=postgres needs a PostgreSQL database')
+            # The engine is created per worker, after any fork: see publish() and _start()
+            self.backend = PostgresBackend(None)
+        elif kind == 'none':
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown EVENTS_BACKEND {kind!r}')
+        self._started = False
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def publish(self, type, action, id, projects=(), users=(), **fields):
+        """Tell the subscribers of ``projects`` and ``users`` that a record changed; call after commit"""
+        if self.backend is None:
+            return
+        event = dict(type=type, action=action, id=id, **fields)
+        payload = json.dumps({
+            'event': event,
+            'projects': sorted({project for project in projects if project is not None}),
+            'users': sorted({user for user in users if user is not None}),
+        }, separators=(',', ':'))
+        try:
+            self.backend.publish(payload)
+        except Exception:
+            # The write has committed; subscribers catch up through GET /sync
+            log.exception('Could not publish %s %s %s', type, action, id)
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            self.published += 1
+
+    def subscribe(self, user_id, projects, subscriber_class=Subscriber, **kwargs):
+        """A new subscriber for ``user_id``, or None when the process has no room for another"""
+        with self._lock:
+            if self.backend is None or self.count() >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            subscriber = subscriber_class(user_id, projects, self.queue_size, **kwargs)
+            self._by_user.setdefault(user_id, set()).add(subscriber)
+            self._index(subscriber, subscriber.projects)
+        self._start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._remove(subscriber)
+
+    def update(self, subscriber, projects):
+        """Replace the projects a subscriber hears about"""
+        with self._lock:
+            if subscriber.evicted:
+                return
+            self._unindex(subscriber, subscriber.projects - set(projects))
+            subscriber.projects = set(projects)
+            self._index(subscriber, subscriber.projects)
+
+    def deliver(self, payload):
+        """Fan one published message out to this process's subscribers"""
+        message = json.loads(payload)
+        event = message['event']
+        membership = event['type'] in MEMBERSHIP_TYPES
+        data = json.dumps(event, separators=(',', ':'))
+        with self._lock:
+            recipients = set()
+            for user_id in message['users']:
+                for subscriber in self._by_user.get(user_id, ()):
+                    recipients.add(subscriber)
+                    if membership:
+                        subscriber.stale = True
+            for project_id in message['projects']:
+                recipients.update(self._by_project.get(project_id, ()))
+            if event['type'] == 'project' and event['action'] == 'deleted':
+                for subscriber in self._by_project.pop(event['id'], ()):
+                    subscriber.projects.discard(event['id'])
+            for subscriber in recipients:
+                if subscriber.offer(data):
+                    self.delivered += 1
+                else:
+                    self._evict(subscriber)
+
+    def reset(self):
+        """Close every stream: they may have missed messages"""
+        with self._lock:
+            for subscriber in [s for subscribers in self._by_user.values() for s in subscribers]:
+                self._evict(subscriber)
+
+    def count(self):
+        return sum(len(subscribers) for subscribers in self._by_user.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': type(self.backend).__name__ if self.backend else None,
+                'subscribers': self.count(),
+                'max_subscribers': self.max_subscribers,
+                'published': self.published,
+                'delivered': self.delivered,
+                'evicted': self.evicted,
+                'rejected': self.rejected,
+                'failed': self.failed,
+            }
+
+    def _start(self):
+        """Start listening on the first subscription, in the process that serves it"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if isinstance(self.backend, PostgresBackend) and self.backend.engine is None:
+            self.backend.engine = db.engine
+        self.backend.start(self.deliver, self.reset)
+
+    def _evict(self, subscriber):
+        self._remove(subscriber)
+        subscriber.evicted = True
+        subscriber.wake()
+        self.evicted += 1
+
+    def _remove(self, subscriber):
+        subscribers = self._by_user.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_user[subscriber.user_id]
+        self._unindex(subscriber, subscriber.projects)
+
+    def _index(self, subscriber, projects):
+        for project_id in projects:
+            self._by_project.setdefault(project_id, set()).add(subscriber)
+
+    def _unindex(self, subscriber, projects):
+        for project_id in projects:
+            subscribers = self._by_project.get(project_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._by_project[project_id]
+
+
+broker = Broker()
+
+
+def message(data, event=None):
+    """One SSE message; without ``event`` it is a plain ``message`` event"""
+    name = f'event: {event}\n' if event else ''
+    return f'{name}data: {data}\n\n'.encode('utf-8')
+
+
+READY = b'retry: 3000\n' + message('{}', 'ready')
+KEEPALIVE = b': keepalive\n\n'
+RESET = message('{"reason":"missed events; catch up through GET /sync"}', 'reset')
+
+
+def projects_query(user_id):
+    """The projects whose changes the user hears about: those they can read"""
+    return select(Project.id).where(visible(Project, user_id=user_id))
+
+
+def unavailable():
+    """503 for a stream this process can't take on"""
+    if broker.enabled and broker.max_subscribers:
+        error = 'Too many event streams; try again shortly'
+    else:
+        error = 'Events are disabled'
+    response = jsonify({'error': error})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+
+def stream_response(body):
+    response = current_app.response_class(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Proxies must pass messages on as they come
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def stream(subscriber, load_projects):
+    """SSE body for a subscriber; ``load_projects()`` re-reads their projects after a membership change"""
+    try:
+        yield READY
+        while True:
+            if not subscriber.wait(broker.heartbeat):
+                if subscriber.evicted:
+                    yield RESET
+                    return
+                yield KEEPALIVE
+                continue
+            if subscriber.stale:
+                subscriber.stale = False
+                broker.update(subscriber, load_projects())
+            messages = subscriber.take()
+            if messages:
+                yield b''.join(message(data) for data in messages)
+            if subscriber.evicted:
+                yield RESET
+                return
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+async def async_stream(subscriber, load_projects):
+    """``stream()`` for an AsyncSubscriber; ``load_projects`` is a coroutine function"""
+    try:
+        yield READY
+        while True:
+            if not await subscriber.wait(broker.heartbeat):
+                if subscriber.evicted:
+                    yield RESET
+                    return
+                yield KEEPALIVE
+                continue
+            if subscriber.stale:
+                subscriber.stale = False
+                broker.update(subscriber, await load_projects())
+            messages = subscriber.take()
+            if messages:
+                yield b''.join(message(data) for data in messages)
+            if subscriber.evicted:
+                yield RESET
+                return
+    finally:
+        broker.unsubscribe(subscriber)
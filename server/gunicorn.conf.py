@@ -0,0 +1,170 @@
+"""
+Production gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+
+Pick a worker profile with GUNICORN_WORKER_CLASS:
+
+- ``gthread`` (default): a few processes, each serving requests on a thread
+  pool. Blocking DB calls and bcrypt (which runs in its own process pool)
+  no longer hold up every other request.
+- ``sync``: one request per process, more processes.
+- ``gevent``: cooperative greenlets for many concurrent slow clients. Needs
+  the optional gevent package, and psycogreen when the database is
+  PostgreSQL so psycopg2 yields to other greenlets while waiting on a query.
+- ``uvicorn``: the ASGI entry point (``gunicorn -c gunicorn.conf.py
+  asgi:app``), one process per CPU. Read-heavy routes run on the event loop
+  with async SQLAlchemy, the rest on GUNICORN_THREADS threads; see asgi.py.
+  Needs uvicorn-worker, and asyncpg when the database is PostgreSQL.
+
+Sizes come from the CPUs available to the process, and can be overridden with
+WEB_CONCURRENCY (workers), GUNICORN_THREADS and GUNICORN_WORKER_CONNECTIONS.
+Each worker's connection pool is sized to its concurrency unless DB_POOL_SIZE
+is set. ``GET /events`` streams hold a thread or greenlet each, so they may
+take at most half of a worker's (none with sync workers) unless
+EVENTS_MAX_SUBSCRIBERS is set; uvicorn workers keep them on the event loop.
+The response cache defaults to the per-process lru backend with one worker.
+With more it defaults to redis when CACHE_REDIS_URL is set and is off
+otherwise; lru is refused. Workers share /metrics counters through
+PROMETHEUS_MULTIPROC_DIR, which defaults to a directory per master process
+and is emptied at startup.
+"""
+
+import os
+import shutil
+import tempfile
+
+PROFILES = ('gthread', 'sync', 'gevent', 'uvicorn')
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _installed(module):
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+cpus = _cpu_count()
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in PROFILES:
+    raise RuntimeError(f'GUNICORN_WORKER_CLASS must be one of: {", ".join(PROFILES)}')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5555')}"
+timeout = _env_int('GUNICORN_TIMEOUT', 60)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Recycle workers now and then so slow leaks can't grow without bound
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+
+# Heartbeat files on tmpfs, so a slow disk can't make workers look hung
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+if worker_class == 'sync':
+    workers = _env_int('WEB_CONCURRENCY', cpus * 2 + 1)
+    concurrency = 1
+    max_streams = 0
+elif worker_class == 'gthread':
+    workers = _env_int('WEB_CONCURRENCY', cpus + 1)
+    threads = _env_int('GUNICORN_THREADS', 4)
+    concurrency = threads
+    max_streams = threads // 2
+elif worker_class == 'uvicorn':
+    if not _installed('uvicorn_worker'):
+        raise RuntimeError('GUNICORN_WORKER_CLASS=uvicorn needs the uvicorn-worker package (pip install uvicorn-worker)')
+    if os.environ.get('DATABASE_URL', '').startswith('postgres') and not _installed('asyncpg'):
+        raise RuntimeError('uvicorn workers with PostgreSQL need asyncpg (pip install asyncpg)')
+    worker_class = 'uvicorn_worker.UvicornWorker'
+    workers = _env_int('WEB_CONCURRENCY', cpus)
+    flask_threads = _env_int('GUNICORN_THREADS', 4)
+    os.environ.setdefault('ASGI_FLASK_THREADS', str(flask_threads))
+    # Flask threads use the sync pool; the async routes get a pool this size too
+    concurrency = flask_threads
+    max_streams = None
+else:
+    if not _installed('gevent'):
+        raise RuntimeError('GUNICORN_WORKER_CLASS=gevent needs the gevent package (pip install gevent)')
+    if os.environ.get('DATABASE_URL', '').startswith('postgres') and not _installed('psycogreen'):
+        raise RuntimeError('gevent workers with PostgreSQL need psycogreen (pip install psycogreen)')
+    workers = _env_int('WEB_CONCURRENCY', cpus + 1)
+    worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 100)
+    # Greenlets wait on the pool instead of opening a connection each
+    concurrency = min(worker_connections, 20)
+    max_streams = worker_connections // 2
+
+# One DB connection per request a worker can serve at once
+os.environ.setdefault('DB_POOL_SIZE', str(concurrency))
+# Leave room for ordinary requests next to open /events streams
+if max_streams is not None:
+    os.environ.setdefault('EVENTS_MAX_SUBSCRIBERS', str(max_streams))
+
+# The lru response cache is per process: a write invalidates it only in the
+# worker that served it, and the others would serve stale lists and 304s
+if workers > 1:
+    os.environ.setdefault('CACHE_BACKEND', 'redis' if os.environ.get('CACHE_REDIS_URL') else 'none')
+    if os.environ['CACHE_BACKEND'] == 'lru':
+        raise RuntimeError('CACHE_BACKEND=lru serves stale responses with more than one worker; '
+                           'use redis, none or WEB_CONCURRENCY=1')
+else:
+    os.environ.setdefault('CACHE_BACKEND', 'lru')
+
+# Where workers leave their /metrics counters for each other (see metrics.py)
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), f'planwise-metrics-{os.getpid()}'))
+
+# Import the app once in the master so workers fork with it loaded. gevent
+# must monkey-patch before the app creates its locks, so it loads per worker.
+preload_app = os.environ.get(
+    'GUNICORN_PRELOAD', 'false' if worker_class == 'gevent' else 'true'
+).lower() in ('1', 'true', 'yes')
+
+
+def on_starting(server):
+    """Start from empty metrics rather than a previous run's counters"""
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def on_exit(server):
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+
+
+def child_exit(server, worker):
+    """Merge an exited worker's request counts into the exited workers' file, drop its gauges"""
+    from metrics import request_metrics
+    request_metrics.multiproc_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    request_metrics.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Give each worker its own connection pool instead of the master's"""
+    if not server.cfg.preload_app:
+        return
+    from models import db
+    application = server.app.wsgi()
+    # asgi:app wraps the Flask app; its async engine is created after the fork
+    application = getattr(application, 'flask_app', application)
+    with application.app_context():
+        # close=False: leave the master's sockets alone, just drop the references
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """Make psycopg2 cooperative once gevent has patched the worker"""
+    if worker_class == 'gevent' and os.environ.get('DATABASE_URL', '').startswith('postgres'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,116 @@
+"""
+Tokens that carry the user, and the check that they are still current.
+
+An access token embeds the user as ``/auth/me`` shows them (the ``detail``
+shape) in a ``user`` claim, with the row's ``version`` in ``uv``. Any
+change to the user through ``PATCH /users/<id>`` bumps the version. While
+the two match, ``current_user()`` answers from the token.
+
+``user_versions`` remembers each user's current version for
+``USER_CACHE_TTL`` seconds, so that check usually costs no query at all.
+Every process has its own copy. Edits and deletes update the copy of the
+process that served them. The other processes see them within the TTL, and
+until then they may serve the previous claims. ``USER_CACHE_TTL=0``
+looks the version up on every request (one primary-key read).
+
+Tokens issued before a change, and tokens without the claims, still work:
+the user is then read from the database. Refresh tokens (``POST
+/auth/refresh``) issue a new access token with current claims, without
+the password, so the access token can stay short-lived.
+"""
+
+import threading
+
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt
+from sqlalchemy import select
+
+from cache import LRUBackend
+from models import db, User
+from permissions import current_user_id
+from serializers import serialize
+
+# Not in the cache (a deleted user is cached as None)
+UNKNOWN = object()
+
+
+class UserVersions:
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 30
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', 30)
+        self.backend = LRUBackend(app.config.get('USER_CACHE_MAX_ENTRIES', 10000)) if self.ttl > 0 else None
+
+    def get(self, user_id):
+        """The user's cached version, None if deleted, or UNKNOWN"""
+        value = self.backend.get(user_id) if self.backend else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return UNKNOWN
+            self.hits += 1
+        return value[0]
+
+    def put(self, user_id, version):
+        if self.backend is not None:
+            # Wrapped, since the backend treats a None value as a miss
+            self.backend.set(user_id, (version,), (), self.ttl)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': self.backend.size() if self.backend else 0,
+            }
+
+
+user_versions = UserVersions()
+
+
+def user_claims(user):
+    return {'user': serialize(user), 'uv': user.version}
+
+
+def access_token(user):
+    user_versions.put(user.id, user.version)
+    return create_access_token(identity=str(user.id), additional_claims=user_claims(user))
+
+
+def refresh_token(user):
+    return create_refresh_token(identity=str(user.id))
+
+
+def version_query(user_id):
+    return select(User.version).where(User.id == user_id)
+
+
+def claimed_user(claims, version):
+    """The user from the token's claims if ``version`` is still theirs, else None"""
+    if version is None or 'user' not in claims or claims.get('uv') != version:
+        return None
+    return claims['user']
+
+
+def current_user():
+    """The caller in the ``detail`` shape, from the token while it is current; None once deleted"""
+    user_id = current_user_id()
+    version = user_versions.get(user_id)
+    if version is UNKNOWN:
+        version = db.session.scalar(version_query(user_id))
+        user_versions.put(user_id, version)
+    user = claimed_user(get_jwt(), version)
+    if user is None and version is not None:
+        # Changed since the token was issued
+        found = db.session.get(User, user_id)
+        user = serialize(found) if found else None
+    return user
@@ -1,22 +1,45 @@
 #!/usr/bin/env python3
 """
 Database initialization script for production deployment.
-This script sets up the database tables without starting the Flask development server.
+This script upgrades the database schema to the latest Alembic migration
+without starting the Flask development server. Run it once per deploy,
+before the web workers start; the app itself never creates tables.
 """
 
-import os
-from app import app, db
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
+from app import create_app, db
+
+def legacy_revision(inspector):
+    """The migration an unversioned database matches.
+
+    Databases created by the old import-time db.create_all() have no
+    alembic_version table; their schema shows how far the models had got.
+    """
+    if 'updated_at' in {column['name'] for column in inspector.get_columns('project_collaborators')}:
+        return 'd9f3b6c15a08'
+    task_indexes = {index['name'] for index in inspector.get_indexes('tasks')}
+    if 'ix_tasks_project_id' in task_indexes:
+        return 'c41a8f6e2b57'
+    if 'ix_tasks_user_id_created_at_id' in task_indexes:
+        return 'b7d2e4a91c3f'
+    if 'password_hash' in {column['name'] for column in inspector.get_columns('users')}:
+        return 'e55f4ad7d449'
+    return '6437ca4377c0'
 
 def init_database():
-    """Initialize the database tables."""
+    """Apply any pending migrations."""
+    app = create_app()
     with app.app_context():
         try:
-            # Create all database tables
-            db.create_all()
-            print("✅ Database tables created successfully")
+            inspector = inspect(db.engine)
+            if inspector.has_table('users') and not inspector.has_table('alembic_version'):
+                stamp(revision=legacy_revision(inspector))
+            upgrade()
+            print("✅ Database schema is up to date")
             return True
         except Exception as e:
-            print(f"❌ Database initialization error: {e}")
+            print(f"❌ Database migration error: {e}")
             return False
 
 if __name__ == '__main__':
@@ -25,4 +48,4 @@ if __name__ == '__main__':
         print("🚀 Database initialization complete - ready for production server")
     else:
         print("💥 Database initialization failed")
-        exit(1)
\ No newline at end of file
+        exit(1)
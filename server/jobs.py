@@ -0,0 +1,403 @@
+"""
+Background jobs: work that would hold a request for too long.
+
+A route enqueues a job (a row in ``jobs``, see ``models.Job``) and answers
+``202 Accepted`` with the job and a ``Location: /jobs/<id>`` to poll.
+``GET /jobs/<id>`` shows the job's status, progress and result to the
+user who started it. Deleting a user is a job: with 100k tasks it takes
+minutes, and it commits ``JOB_BATCH_SIZE`` rows at a time. Locks stay
+short, and a retry carries on where the last attempt stopped.
+
+Jobs run in priority order (higher first), then oldest first. A failed
+attempt is retried after ``JOB_RETRY_DELAY`` seconds, doubled for each
+attempt, up to ``JOB_MAX_ATTEMPTS`` attempts. A job's worker renews its
+lease at each checkpoint. A job whose lease lapses for
+``JOB_LEASE_SECONDS`` (its worker died) is picked up again, by the next
+claim or as soon as ``GET /jobs/<id>`` reads it. Enqueueing
+with a ``key`` is idempotent: while a job with that key exists, the same
+job comes back. A failed one is queued again.
+
+Who runs them, chosen by ``JOBS_EXECUTOR``:
+
+- ``thread`` (default): a thread in the web process that enqueued the job.
+  It runs until the queue is empty. Any number of processes can do this
+  safely: jobs are claimed with a conditional update, and with ``SKIP
+  LOCKED`` on PostgreSQL.
+- ``worker``: only worker processes run jobs (``flask --app app
+  run-jobs``, the ``worker`` entry in the Procfile), which keeps the work
+  off the web servers altogether.
+- ``inline``: within the request, before answering. For hosts that allow
+  no background work (serverless).
+
+``flask --app app prune-jobs`` deletes finished jobs older than
+``JOB_RETENTION_DAYS``.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app, jsonify
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+import events
+import identity
+from cache import response_cache
+from models import db, Job, User, Task, Project, ProjectCollaborator
+
+log = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+EXECUTORS = ('thread', 'worker', 'inline')
+
+# Job kind -> function(context) returning the job's result
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register a function as the handler for jobs of ``kind``"""
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+class LeaseLost(Exception):
+    """Another worker has taken the job over"""
+
+
+class Context:
+    """What a handler gets: the payload, and checkpoints that commit its work"""
+
+    def __init__(self, job, worker_id, batch_size):
+        self.job_id = job.id
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.payload = json.loads(job.payload)
+        # Counts carried over from earlier attempts
+        self.progress = json.loads(job.progress) if job.progress else {}
+
+    def checkpoint(self, **counts):
+        """Add ``counts`` to the progress and commit it with the work so far; renews the lease"""
+        for name, count in counts.items():
+            self.progress[name] = self.progress.get(name, 0) + count
+        renewed = db.session.execute(
+            update(Job).where(Job.id == self.job_id, Job.locked_by == self.worker_id)
+            .values(progress=json.dumps(self.progress), locked_at=datetime.utcnow())
+        ).rowcount
+        if not renewed:
+            raise LeaseLost(f'Job {self.job_id} was taken over by another worker')
+        db.session.commit()
+
+    def delete_in_batches(self, name, model, criterion):
+        """Delete the rows of ``model`` matching ``criterion``, one committed batch at a time"""
+        while True:
+            batch = select(model.id).where(criterion).limit(self.batch_size)
+            count = db.session.execute(delete(model).where(model.id.in_(batch)),
+                                       execution_options={'synchronize_session': False}).rowcount
+            self.checkpoint(**{name: count})
+            if count < self.batch_size:
+                return
+
+
+class JobQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = 'thread'
+        self.poll_interval = 1.0
+        self.lease = 300
+        self.max_attempts = 5
+        self.retry_delay = 10
+        self.batch_size = 5000
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self._recovered_at = 0
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.executor = app.config.get('JOBS_EXECUTOR', 'thread')
+        if self.executor not in EXECUTORS:
+            raise ValueError(f'Unknown JOBS_EXECUTOR {self.executor!r}; choose one of: {", ".join(EXECUTORS)}')
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 1.0)
+        self.lease = app.config.get('JOB_LEASE_SECONDS', 300)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.retry_delay = app.config.get('JOB_RETRY_DELAY', 10)
+        self.batch_size = app.config.get('JOB_BATCH_SIZE', 5000)
+
+    def enqueue(self, kind, payload, key=None, priority=0, created_by=None):
+        """Queue a job, or return the queued or running one holding ``key``"""
+        if kind not in HANDLERS:
+            raise ValueError(f'No handler for jobs of kind {kind!r}')
+        fields = {'kind': kind, 'payload': json.dumps(payload), 'priority': priority,
+                  'max_attempts': self.max_attempts, 'created_by': created_by}
+        job = self._existing(key, fields) if key else None
+        if job is None:
+            job = Job(key=key, status=QUEUED, **fields)
+            db.session.add(job)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # Enqueued meanwhile by another request with the same key
+                db.session.rollback()
+                job = self._existing(key, fields)
+        if self.executor == 'inline':
+            self.run_next(_worker_id(), job_id=job.id)
+            db.session.refresh(job)
+        elif self.executor == 'thread':
+            self._wake()
+        return job
+
+    def _existing(self, key, fields):
+        job = db.session.scalar(select(Job).where(Job.key == key))
+        if job is not None and job.status in (SUCCEEDED, FAILED):
+            # A finished job is never handed back: it becomes a new run, for whoever asked now
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.status, job.attempts, job.run_at = QUEUED, 0, datetime.utcnow()
+            job.started_at = job.finished_at = job.progress = job.result = job.error = None
+            db.session.commit()
+        return job
+
+    def claim(self, worker_id, job_id=None):
+        """Take the next job that is due (or job ``job_id``) for ``worker_id``; None if there is none"""
+        now = datetime.utcnow()
+        if time.monotonic() - self._recovered_at > min(self.lease, 60):
+            self._recover(now)
+        query = select(Job.id).where(Job.status == QUEUED)
+        if job_id is None:
+            query = query.where(Job.run_at <= now).order_by(Job.priority.desc(), Job.id)
+        else:
+            query = query.where(Job.id == job_id)
+        candidate = db.session.scalar(query.limit(1).with_for_update(skip_locked=True))
+        claimed = candidate is not None and db.session.execute(
+            update(Job).where(Job.id == candidate, Job.status == QUEUED)
+            .values(status=RUNNING, locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1,
+                    started_at=func.coalesce(Job.started_at, now))
+        ).rowcount == 1
+        db.session.commit()
+        return db.session.get(Job, candidate) if claimed else None
+
+    def _recover(self, now):
+        """Jobs whose worker stopped renewing the lease: queue them again, or fail them for good"""
+        self._recovered_at = time.monotonic()
+        expired = (Job.status == RUNNING) & (Job.locked_at < now - timedelta(seconds=self.lease))
+        db.session.execute(update(Job).where(expired, Job.attempts >= Job.max_attempts)
+                           .values(status=FAILED, error='Lease expired', finished_at=now, locked_by=None))
+        db.session.execute(update(Job).where(expired).values(status=QUEUED, locked_by=None))
+
+    def resume(self, job):
+        """Take ``job`` back if its worker is gone, and see that this process runs it if it waits.
+
+        A thread executor's job dies with its web process (a recycled or
+        redeployed worker, a frozen serverless instance), and nothing else
+        may claim a job before the next enqueue. Reading the job is reason
+        enough to take it back and get it going again.
+        """
+        now = datetime.utcnow()
+        if job.status == RUNNING and job.locked_at and job.locked_at < now - timedelta(seconds=self.lease):
+            self._recover(now)
+            db.session.commit()
+            db.session.refresh(job)
+        if job.status == QUEUED and job.run_at <= now:
+            if self.executor == 'inline':
+                self.run_next(_worker_id(), job_id=job.id)
+                db.session.refresh(job)
+            elif self.executor == 'thread':
+                self._wake()
+        return job
+
+    def run_next(self, worker_id, job_id=None):
+        """Claim and run one job; False when none was due"""
+        job = self.claim(worker_id, job_id)
+        if job is None:
+            return False
+        job_id, kind, attempts, max_attempts = job.id, job.kind, job.attempts, job.max_attempts
+        started = time.perf_counter()
+        try:
+            if kind not in HANDLERS:
+                raise LookupError(f'No handler for jobs of kind {kind!r}')
+            result = HANDLERS[kind](Context(job, worker_id, self.batch_size))
+        except LeaseLost as e:
+            db.session.rollback()
+            log.warning('%s', e)
+            return True
+        except Exception as e:
+            db.session.rollback()
+            log.exception('Job %s (%s) failed, attempt %s of %s', job_id, kind, attempts, max_attempts)
+            self._failed(job_id, worker_id, attempts, max_attempts, f'{type(e).__name__}: {e}')
+            return True
+        db.session.execute(update(Job).where(Job.id == job_id, Job.locked_by == worker_id).values(
+            status=SUCCEEDED, result=json.dumps(result), error=None, finished_at=datetime.utcnow(),
+            locked_by=None))
+        db.session.commit()
+        with self._lock:
+            self.succeeded += 1
+        log.info('Job %s (%s) succeeded in %.1fs', job_id, kind, time.perf_counter() - started)
+        return True
+
+    def _failed(self, job_id, worker_id, attempts, max_attempts, error):
+        now = datetime.utcnow()
+        if attempts >= max_attempts:
+            values = {'status': FAILED, 'finished_at': now}
+        else:
+            delay = min(self.retry_delay * 2 ** (attempts - 1), 3600)
+            values = {'status': QUEUED, 'run_at': now + timedelta(seconds=delay)}
+        db.session.execute(update(Job).where(Job.id == job_id, Job.locked_by == worker_id)
+                           .values(error=error, locked_by=None, **values))
+        db.session.commit()
+        with self._lock:
+            if attempts >= max_attempts:
+                self.failed += 1
+            else:
+                self.retried += 1
+
+    def work(self, worker_id=None, burst=False):
+        """Run jobs as they come due; with ``burst``, return how many ran once nothing is due"""
+        worker_id = worker_id or _worker_id()
+        ran = 0
+        while True:
+            try:
+                if self.run_next(worker_id):
+                    ran += 1
+                    continue
+            except Exception:
+                db.session.rollback()
+                log.exception('Could not claim a job')
+            if burst:
+                return ran
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _wake(self):
+        """Start this process's job thread, or wake it up"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run_thread, name='jobs', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run_thread(self):
+        with self.app.app_context():
+            worker_id = _worker_id()
+            while True:
+                self.work(worker_id, burst=True)
+                # Stay while retries are waiting for their turn
+                if not db.session.scalar(select(func.count()).select_from(Job).where(Job.status == QUEUED)):
+                    db.session.close()
+                    return
+                db.session.close()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def stats(self):
+        counts = dict(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+        with self._lock:
+            return {
+                'executor': self.executor,
+                'jobs': {status: counts.get(status, 0) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)},
+                # Run by this process
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                'retried': self.retried,
+            }
+
+
+def _worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+job_queue = JobQueue()
+
+
+def describe(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'progress': json.loads(job.progress) if job.progress else {},
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def accepted(job):
+    """202 for a job the client can follow at its Location"""
+    response = jsonify({'job': describe(job)})
+    response.headers['Location'] = f'/jobs/{job.id}'
+    return response, 202
+
+
+@handler('delete-user')
+def delete_user(context):
+    """Delete a user with their tasks, projects (and the tasks in them) and collaborations"""
+    user_id = context.payload['user_id']
+    owned = select(Project.id).where(Project.owner_id == user_id)
+    owned_ids = set(db.session.scalars(owned))
+    collaborations = db.session.execute(select(ProjectCollaborator.id, ProjectCollaborator.project_id)
+                                        .where(ProjectCollaborator.user_id == user_id)).all()
+    # Children first, so foreign keys hold after every batch
+    context.delete_in_batches('tasks', Task, Task.user_id == user_id)
+    context.delete_in_batches('tasks', Task, Task.project_id.in_(owned))
+    context.delete_in_batches('collaborators', ProjectCollaborator, ProjectCollaborator.user_id == user_id)
+    context.delete_in_batches('collaborators', ProjectCollaborator, ProjectCollaborator.project_id.in_(owned))
+    context.delete_in_batches('projects', Project, Project.owner_id == user_id)
+    deleted = db.session.execute(delete(User).where(User.id == user_id)).rowcount
+    context.checkpoint(users=deleted)
+
+    identity.user_versions.put(user_id, None)
+    # Cascades reached projects, tasks and collaborators of many users
+    response_cache.clear()
+    for project_id in owned_ids:
+        events.broker.publish('project', 'deleted', project_id, (project_id,))
+    for collaborator_id, project_id in collaborations:
+        if project_id not in owned_ids:
+            events.broker.publish('collaborator', 'deleted', collaborator_id, (project_id,), (user_id,),
+                                  project_id=project_id, user_id=user_id)
+    return context.progress
+
+
+@click.command('run-jobs')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+@with_appcontext
+def run_jobs_command(burst):
+    """Run background jobs (see jobs.py)."""
+    worker_id = _worker_id()
+    click.echo(f'Worker {worker_id} running jobs')
+    try:
+        ran = job_queue.work(worker_id, burst=burst)
+    except KeyboardInterrupt:
+        # A job cut short keeps its committed batches; its lease runs out and it is retried
+        return
+    click.echo(f'Ran {ran} jobs')
+
+
+@click.command('prune-jobs')
+@with_appcontext
+def prune_jobs_command():
+    """Delete finished jobs older than JOB_RETENTION_DAYS."""
+    days = current_app.config['JOB_RETENTION_DAYS']
+    result = db.session.execute(delete(Job).where(Job.status.in_((SUCCEEDED, FAILED)),
+                                                  Job.finished_at < datetime.utcnow() - timedelta(days=days)))
+    db.session.commit()
+    click.echo(f'Deleted {result.rowcount} jobs finished more than {days} days ago')
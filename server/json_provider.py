@@ -0,0 +1,137 @@
+"""
+Flask JSON provider backed by the fastest encoder available.
+
+``JSON_BACKEND`` picks the encoder: ``orjson`` or ``msgspec`` when installed,
+``stdlib`` otherwise, or ``auto`` (the default) for the first one found in
+that order. Both are optional dependencies. All three give the same output:
+datetimes and dates as ISO 8601, Decimal and UUID as strings, and keys sorted
+when ``sort_keys`` is set (Flask's default, kept so payloads don't reorder).
+
+``JSON_COMPACT`` controls whether responses are compact or indented.
+"""
+
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, time
+
+from flask.json.provider import DefaultJSONProvider
+
+from profiling import span
+
+BACKENDS = ('orjson', 'msgspec', 'stdlib')
+
+
+def _default(o):
+    """Types the encoders don't handle on their own"""
+    if isinstance(o, (date, time)):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+def _stdlib_encoder(compact, sort_keys):
+    encoder = json.JSONEncoder(
+        default=_default, sort_keys=sort_keys, ensure_ascii=False,
+        **({'separators': (',', ':')} if compact else {'indent': 2}),
+    )
+    return lambda obj: encoder.encode(obj).encode('utf-8')
+
+
+def _orjson_encoder(compact, sort_keys):
+    import orjson
+
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if not compact:
+        option |= orjson.OPT_INDENT_2
+    return lambda obj: orjson.dumps(obj, default=_default, option=option)
+
+
+def _msgspec_encoder(compact, sort_keys):
+    import msgspec
+
+    encode = msgspec.json.Encoder(enc_hook=_default, order='sorted' if sort_keys else None).encode
+    if compact:
+        return encode
+    return lambda obj: msgspec.json.format(encode(obj), indent=2)
+
+
+_ENCODERS = {
+    'orjson': _orjson_encoder,
+    'msgspec': _msgspec_encoder,
+    'stdlib': _stdlib_encoder,
+}
+
+
+def _installed(backend):
+    if backend == 'stdlib':
+        return True
+    try:
+        __import__(backend)
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_backend(name='auto'):
+    """The backend to use for ``JSON_BACKEND``; raises ValueError if it can't be used"""
+    if name == 'auto':
+        return next(backend for backend in BACKENDS if _installed(backend))
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown JSON_BACKEND {name!r}; choose auto or one of: {", ".join(BACKENDS)}')
+    if not _installed(name):
+        raise ValueError(f'JSON_BACKEND={name} but {name} is not installed')
+    return name
+
+
+class JSONProvider(DefaultJSONProvider):
+    def __init__(self, app, backend='auto', compact=True):
+        super().__init__(app)
+        self.backend = resolve_backend(backend)
+        self.compact = compact
+        self._encoders = {}
+
+    def encoder(self, compact=None):
+        """A function from object to UTF-8 JSON bytes; ``compact`` defaults to the provider's setting"""
+        if compact is None:
+            # Same rule as Flask: None means compact unless the app is in debug mode
+            compact = self.compact if self.compact is not None else not self._app.debug
+        key = (compact, self.sort_keys)
+        if key not in self._encoders:
+            self._encoders[key] = _ENCODERS[self.backend](compact, self.sort_keys)
+        return self._encoders[key]
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for specific json.dumps options get the standard library
+            kwargs.setdefault('default', _default)
+            kwargs.setdefault('ensure_ascii', False)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return self.encoder()(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if self.backend == 'orjson' and not kwargs:
+            import orjson
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with span('serialize'):
+            body = self.encoder()(obj) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    """Install the provider with the app's JSON_BACKEND and JSON_COMPACT settings"""
+    app.json = JSONProvider(app, app.config.get('JSON_BACKEND', 'auto'), app.config.get('JSON_COMPACT', True))
+    return app.json
@@ -0,0 +1,351 @@
+"""
+Request metrics in the Prometheus text format, served at /metrics.
+
+Exported series:
+
+- ``planwise_http_requests_total{method,route,status}``
+- ``planwise_http_request_duration_seconds{method,route}`` (histogram)
+- ``planwise_http_requests_in_flight``
+- ``planwise_db_pool_*``: connection pool gauges and checkout counters
+- ``planwise_response_cache_*``: hits, misses, evictions, entries and hit ratio
+
+Routes are labelled by their URL rule (``/tasks/<int:id>``), so the number
+of series stays bounded. Each thread (or greenlet) records into its own
+counters without locking, and a scrape adds them up. When a thread ends,
+its counts are folded into one total for the process, so short-lived
+threads don't pile up.
+
+With several gunicorn workers, set ``PROMETHEUS_MULTIPROC_DIR`` (the
+gunicorn config does this). A background thread in every worker then writes
+a snapshot of its counters to that directory every ``METRICS_FLUSH_INTERVAL``
+seconds while it serves requests, and a scrape merges all snapshots, so
+any worker can answer for the whole server. Other workers' numbers can be
+up to one flush interval old. An exited worker's counters are merged into
+one file for all exited workers and its own file removed; its gauges are
+dropped.
+
+/metrics and the JSON stats under /metrics/ need ``Authorization: Bearer
+<METRICS_TOKEN>``; without a token they only answer clients on this host.
+"""
+
+import bisect
+import fcntl
+import hmac
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, jsonify, request
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+POOL_GAUGES = ('size', 'idle', 'in_use', 'overflow')
+POOL_COUNTERS = ('checkouts', 'waits', 'timeouts', 'invalidations')
+CACHE_COUNTERS = ('hits', 'misses', 'evictions', 'invalidations')
+
+LOOPBACK = ('127.0.0.1', '::1')
+
+# Counters of exited workers, merged (see mark_process_dead)
+DEAD_WORKERS_FILE = 'metrics-dead.json'
+
+
+class _ThreadCounters:
+    __slots__ = ('requests', 'durations', 'started', 'finished')
+
+    def __init__(self):
+        self.requests = {}   # (method, route, status) -> count
+        self.durations = {}  # (method, route) -> [count, sum, bucket counts...]
+        self.started = 0
+        self.finished = 0
+
+    def add(self, other):
+        for key, count in dict(other.requests).items():
+            self.requests[key] = self.requests.get(key, 0) + count
+        for key, histogram in dict(other.durations).items():
+            total = self.durations.setdefault(key, [0, 0.0] + [0] * len(BUCKETS))
+            for i, value in enumerate(list(histogram)):
+                total[i] += value
+        self.started += other.started
+        self.finished += other.finished
+
+
+class _ThreadOwner:
+    """Lives in a thread's local storage; its finalizer retires the thread's counters"""
+    __slots__ = ('__weakref__',)
+
+
+class RequestMetrics:
+    def __init__(self, app=None):
+        self.multiproc_dir = ''
+        self.flush_interval = 1.0
+        self.collectors = []
+        self._local = threading.local()
+        self._threads = set()
+        self._retired = _ThreadCounters()  # threads that have ended
+        # Reentrant: a finalizer may run while this thread holds it
+        self._lock = threading.RLock()
+        self._app = None
+        self._dirty = False
+        self._flusher_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, collectors=()):
+        """Record every request; ``collectors`` return extra ``(gauges, counters)`` dicts on scrape"""
+        self.multiproc_dir = app.config.get('METRICS_MULTIPROC_DIR', '')
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 1.0)
+        self.collectors = list(collectors)
+        self._app = app
+        if self.multiproc_dir:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _counters(self):
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = _ThreadCounters()
+            self._local.owner = owner = _ThreadOwner()
+            with self._lock:
+                self._threads.add(counters)
+            weakref.finalize(owner, self._retire, counters)
+        return counters
+
+    def _retire(self, counters):
+        """The thread owning ``counters`` has ended: keep its counts, drop its entry"""
+        with self._lock:
+            self._threads.discard(counters)
+            self._retired.add(counters)
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        self._counters().started += 1
+
+    def _after_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        seconds = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        counters = self._counters()
+        key = (request.method, route, str(response.status_code))
+        counters.requests[key] = counters.requests.get(key, 0) + 1
+        histogram = counters.durations.get(key[:2])
+        if histogram is None:
+            histogram = counters.durations[key[:2]] = [0, 0.0] + [0] * len(BUCKETS)
+        histogram[0] += 1
+        histogram[1] += seconds
+        index = bisect.bisect_left(BUCKETS, seconds)
+        if index < len(BUCKETS):
+            histogram[2 + index] += 1
+        return response
+
+    def _teardown_request(self, exc):
+        self._counters().finished += 1
+        if self.multiproc_dir:
+            self._dirty = True
+            if self._flusher_pid != os.getpid():
+                self._start_flusher()
+
+    def _start_flusher(self):
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                with self._app.app_context():
+                    self.flush()
+
+    def snapshot(self):
+        """This process's counters summed over its threads, plus the collectors' values"""
+        total = _ThreadCounters()
+        with self._lock:
+            # dict() copies atomically, while the owning thread may be adding keys
+            for counters in [self._retired, *self._threads]:
+                total.add(counters)
+        gauges, counters = {'http_requests_in_flight': total.started - total.finished}, {}
+        for collector in self.collectors:
+            extra_gauges, extra_counters = collector()
+            gauges.update(extra_gauges)
+            counters.update(extra_counters)
+        return {
+            'pid': os.getpid(),
+            'requests': [list(key) + [count] for key, count in total.requests.items()],
+            'durations': [list(key) + histogram for key, histogram in total.durations.items()],
+            'gauges': gauges,
+            'counters': counters,
+        }
+
+    def _path(self, pid):
+        return os.path.join(self.multiproc_dir, f'metrics-{pid}.json')
+
+    def _write(self, path, snapshot):
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(f'{path}.tmp', path)
+
+    @contextmanager
+    def _directory_lock(self, operation):
+        """Scrapes share it; merging an exited worker's file takes it alone"""
+        with open(os.path.join(self.multiproc_dir, '.lock'), 'a') as f:
+            fcntl.flock(f, operation)
+            yield
+
+    def flush(self):
+        """Write this process's snapshot for the other workers' scrapes"""
+        self._dirty = False
+        self._write(self._path(os.getpid()), self.snapshot())
+
+    def mark_process_dead(self, pid):
+        """Merge an exited worker's counters into DEAD_WORKERS_FILE and remove its file; drop its gauges"""
+        path = self._path(pid)
+        dead_path = os.path.join(self.multiproc_dir, DEAD_WORKERS_FILE)
+        with self._directory_lock(fcntl.LOCK_EX):
+            snapshot = _read(path)
+            if snapshot is None:
+                return
+            dead = _read(dead_path)
+            requests, durations, _, counters = _merge([snapshot] + ([dead] if dead else []))
+            self._write(dead_path, {
+                'pid': None,
+                'requests': [list(key) + [count] for key, count in requests.items()],
+                'durations': [list(key) + histogram for key, histogram in durations.items()],
+                'gauges': {},
+                'counters': counters,
+            })
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _snapshots(self):
+        if not self.multiproc_dir:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        with self._directory_lock(fcntl.LOCK_SH):
+            for name in os.listdir(self.multiproc_dir):
+                if name.endswith('.json'):
+                    # None while being replaced or half written; next scrape gets it
+                    snapshot = _read(os.path.join(self.multiproc_dir, name))
+                    if snapshot is not None:
+                        snapshots.append(snapshot)
+        return snapshots
+
+    def render(self):
+        """All metrics, merged over processes, in the Prometheus text format"""
+        requests, durations, gauges, counters = _merge(self._snapshots())
+
+        lines = [
+            '# HELP planwise_http_requests_total Requests served, by route and status.',
+            '# TYPE planwise_http_requests_total counter',
+        ]
+        for (method, route, status), count in sorted(requests.items()):
+            lines.append(f'planwise_http_requests_total{{method="{method}",route="{_escape(route)}",'
+                         f'status="{status}"}} {count}')
+        lines += [
+            '# HELP planwise_http_request_duration_seconds Time to produce a response, by route.',
+            '# TYPE planwise_http_request_duration_seconds histogram',
+        ]
+        for (method, route), (count, seconds, *buckets) in sorted(durations.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'planwise_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'planwise_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'planwise_http_request_duration_seconds_sum{{{labels}}} {seconds:.6f}')
+            lines.append(f'planwise_http_request_duration_seconds_count{{{labels}}} {count}')
+
+        for name, value in sorted(gauges.items()):
+            lines.append(f'# TYPE planwise_{name} gauge')
+            lines.append(f'planwise_{name} {_number(value)}')
+        for name, value in sorted(counters.items()):
+            lines.append(f'# TYPE planwise_{name}_total counter')
+            lines.append(f'planwise_{name}_total {_number(value)}')
+        hits, misses = counters.get('response_cache_hits', 0), counters.get('response_cache_misses', 0)
+        lines.append('# TYPE planwise_response_cache_hit_ratio gauge')
+        lines.append(f'planwise_response_cache_hit_ratio {hits / (hits + misses) if hits + misses else 0.0:.4f}')
+        return '\n'.join(lines) + '\n'
+
+
+def scrape_access(view):
+    """Guard a metrics route: the METRICS_TOKEN bearer token, or a loopback client without one"""
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        token = current_app.config.get('METRICS_TOKEN', '')
+        if token:
+            sent = request.headers.get('Authorization', '').encode('utf-8')
+            allowed = hmac.compare_digest(sent, f'Bearer {token}'.encode('utf-8'))
+        else:
+            allowed = request.remote_addr in LOOPBACK
+        if not allowed:
+            return jsonify({'error': 'Access denied'}), 403
+        return view(*args, **kwargs)
+    return guarded
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snapshots):
+    """``(requests, durations, gauges, counters)`` summed over snapshots"""
+    requests, durations, gauges, counters = {}, {}, {}, {}
+    for snapshot in snapshots:
+        for *key, count in snapshot['requests']:
+            requests[tuple(key)] = requests.get(tuple(key), 0) + count
+        for method, route, *histogram in snapshot['durations']:
+            total = durations.setdefault((method, route), [0, 0.0] + [0] * len(BUCKETS))
+            for i, value in enumerate(histogram):
+                total[i] += value
+        for values, merged in ((snapshot['gauges'], gauges), (snapshot['counters'], counters)):
+            for name, value in values.items():
+                merged[name] = merged.get(name, 0) + value
+    return requests, durations, gauges, counters
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return int(value) if float(value).is_integer() else round(value, 6)
+
+
+def pool_collector(engine_getter):
+    """Connection pool gauges and counters from ``database.stats``"""
+    import database
+
+    def collect():
+        stats = database.stats(engine_getter())
+        return ({f'db_pool_{name}': stats[name] for name in POOL_GAUGES if name in stats},
+                {f'db_pool_{name}': stats[name] for name in POOL_COUNTERS})
+    return collect
+
+
+def cache_collector(cache):
+    """Response cache counters and the number of entries"""
+    def collect():
+        stats = cache.stats()
+        return ({'response_cache_entries': stats.get('entries', 0)},
+                {f'response_cache_{name}': stats.get(name, 0) for name in CACHE_COUNTERS})
+    return collect
+
+
+request_metrics = RequestMetrics()
@@ -87,14 +87,40 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=get_metadata(),
-            **conf_args
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        # The app enforces SQLite's foreign keys on every connection (see
+        # database.py). Batch mode alters a table by copying and dropping it,
+        # which would cascade into the rows referring to it, so migrations run
+        # with enforcement off. SQLite ignores the pragma inside a transaction.
+        sqlite = connection.dialect.name == 'sqlite'
+        if sqlite:
+            connection.exec_driver_sql('PRAGMA foreign_keys = OFF')
+            connection.commit()
+        # The app's connections carry DB_STATEMENT_TIMEOUT_MS, meant for
+        # requests. Index builds and backfills on large tables take longer,
+        # and a migration cancelled halfway would fail the deploy.
+        postgresql = connection.dialect.name == 'postgresql'
+        if postgresql:
+            connection.exec_driver_sql('SET statement_timeout = 0')
+            connection.commit()
+        try:
+            context.configure(
+                connection=connection,
+                target_metadata=get_metadata(),
+                **conf_args
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
+        finally:
+            if sqlite:
+                connection.rollback()
+                connection.exec_driver_sql('PRAGMA foreign_keys = ON')
+                connection.commit()
+            if postgresql:
+                # Back to the timeout the connection started with
+                connection.rollback()
+                connection.exec_driver_sql('RESET statement_timeout')
+                connection.commit()
 
 if context.is_offline_mode():
     run_migrations_offline()
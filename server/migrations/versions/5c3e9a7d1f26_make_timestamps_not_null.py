@@ -0,0 +1,66 @@
+"""Make created_at and updated_at NOT NULL
+
+Revision ID: 5c3e9a7d1f26
+Revises: e2b7a5c04f18
+Create Date: 2026-10-17 21:06:48.352917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5c3e9a7d1f26'
+down_revision = 'e2b7a5c04f18'
+branch_labels = None
+depends_on = None
+
+TABLES = ('users', 'projects', 'tasks', 'project_collaborators')
+COLUMNS = ('created_at', 'updated_at')
+
+# The current UTC time, as the ORM's datetime.utcnow() defaults store it
+NOW = {'postgresql': "(now() AT TIME ZONE 'utc')", 'sqlite': 'CURRENT_TIMESTAMP'}
+
+
+def set_nullable(nullable):
+    if op.get_bind().dialect.name != 'sqlite':
+        for table in TABLES:
+            for column in COLUMNS:
+                op.alter_column(table, column, existing_type=sa.DateTime(), nullable=nullable)
+        return
+
+    # SQLite changes a column by copying the table, which drops its triggers
+    # and partial index predicates, and won't rename the copy while triggers
+    # elsewhere name the missing table. Set every trigger and the tables'
+    # indexes aside and restore them as they were (as e2b7a5c04f18 does).
+    bind = op.get_bind()
+    tables = ', '.join(f"'{table}'" for table in TABLES)
+    saved = bind.execute(sa.text(
+        f"SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL "
+        f"AND (type = 'trigger' OR (type = 'index' AND tbl_name IN ({tables})))"
+    )).all()
+    for type_, name, _ in saved:
+        if type_ == 'trigger':
+            op.execute(f'DROP TRIGGER {name}')
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always') as batch_op:
+            for column in COLUMNS:
+                batch_op.alter_column(column, existing_type=sa.DateTime(), nullable=nullable)
+    for type_, name, sql in saved:
+        if type_ == 'index':
+            op.execute(f'DROP INDEX IF EXISTS {name}')
+        op.execute(sql)
+
+
+def upgrade():
+    # Keyset pagination compares (created_at, id) and (updated_at, id) tuples,
+    # which skip a row with a NULL timestamp. Date such rows by their other
+    # timestamp, or now when they have neither.
+    now = NOW.get(op.get_bind().dialect.name, 'CURRENT_TIMESTAMP')
+    for table in TABLES:
+        op.execute(f'UPDATE {table} SET created_at = coalesce(updated_at, {now}) WHERE created_at IS NULL')
+        op.execute(f'UPDATE {table} SET updated_at = created_at WHERE updated_at IS NULL')
+    set_nullable(False)
+
+
+def downgrade():
+    set_nullable(True)
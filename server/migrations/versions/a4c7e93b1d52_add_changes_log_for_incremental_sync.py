@@ -0,0 +1,152 @@
+"""Add changes log for incremental sync
+
+Revision ID: a4c7e93b1d52
+Revises: f3b8d2a61c47
+Create Date: 2026-10-17 18:05:44.126390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e93b1d52'
+down_revision = 'f3b8d2a61c47'
+branch_labels = None
+depends_on = None
+
+# Copy of models.CHANGE_LOG_* and change_log_triggers() as of this revision
+CHANGE_LOG_CLOCKS = {
+    'postgresql': {'position': 'pg_current_xact_id()::text::bigint', 'now': "(now() AT TIME ZONE 'utc')"},
+    'sqlite': {'position': '0', 'now': 'CURRENT_TIMESTAMP'},
+}
+
+
+def _log_change(kind, deleted, source, *conditions):
+    """INSERT of a ``kind`` change for each (user_id, record_id) row of ``source``"""
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return (f"INSERT INTO changes (user_id, kind, record_id, deleted, position, changed_at) "
+            f"SELECT user_id, '{kind}', record_id, {'TRUE' if deleted else 'FALSE'}, {{position}}, {{now}} "
+            f"FROM ({source}) AS changed{where}")
+
+
+def _project_audience(project_id, record_id):
+    """The owner and collaborators of a project, paired with ``record_id``"""
+    return (f"SELECT owner_id AS user_id, {record_id} AS record_id FROM projects WHERE id = {project_id} "
+            f"UNION SELECT user_id, {record_id} FROM project_collaborators WHERE project_id = {project_id}")
+
+
+def _collaborator_added(row, *conditions):
+    """Tell the project's audience; when ``conditions`` hold, catch the collaborator up as well"""
+    return [
+        _log_change('collaborator', False, _project_audience(f'{row}.project_id', f'{row}.id')),
+        # The new collaborator now sees the project and everyone on it
+        _log_change('project', False, f"SELECT {row}.user_id AS user_id, {row}.project_id AS record_id",
+                    *conditions),
+        _log_change('collaborator', False, f"SELECT {row}.user_id AS user_id, id AS record_id "
+                                           f"FROM project_collaborators WHERE project_id = {row}.project_id",
+                    *conditions),
+    ]
+
+
+def _collaborator_removed(row, *conditions):
+    # Unless they own the project, the removed collaborator no longer sees it
+    lost_access = (f"NOT EXISTS (SELECT 1 FROM projects WHERE id = {row}.project_id "
+                   f"AND owner_id = {row}.user_id)")
+    return [
+        _log_change('collaborator', True, f"{_project_audience(f'{row}.project_id', f'{row}.id')} "
+                                          f"UNION SELECT {row}.user_id, {row}.id", *conditions),
+        _log_change('project', True, f"SELECT {row}.user_id AS user_id, {row}.project_id AS record_id",
+                    lost_access, *conditions),
+        _log_change('collaborator', True, f"SELECT {row}.user_id AS user_id, id AS record_id "
+                                          f"FROM project_collaborators WHERE project_id = {row}.project_id",
+                    lost_access, *conditions),
+    ]
+
+
+# A collaborator record moved to another user or project
+_COLLABORATOR_MOVED = '(OLD.user_id <> NEW.user_id OR OLD.project_id <> NEW.project_id)'
+
+# {(table, event): statements}
+CHANGE_LOG_STATEMENTS = {
+    ('tasks', 'insert'): [
+        _log_change('task', False, 'SELECT NEW.user_id AS user_id, NEW.id AS record_id'),
+    ],
+    ('tasks', 'update'): [
+        # Reassigned: gone for the previous assignee
+        _log_change('task', True, 'SELECT OLD.user_id AS user_id, OLD.id AS record_id',
+                    'OLD.user_id <> NEW.user_id'),
+        _log_change('task', False, 'SELECT NEW.user_id AS user_id, NEW.id AS record_id'),
+    ],
+    ('tasks', 'delete'): [
+        _log_change('task', True, 'SELECT OLD.user_id AS user_id, OLD.id AS record_id'),
+    ],
+    ('projects', 'insert'): [
+        _log_change('project', False, _project_audience('NEW.id', 'NEW.id')),
+    ],
+    ('projects', 'update'): [
+        _log_change('project', True, 'SELECT OLD.owner_id AS user_id, OLD.id AS record_id',
+                    'OLD.owner_id <> NEW.owner_id',
+                    'NOT EXISTS (SELECT 1 FROM project_collaborators '
+                    'WHERE project_id = OLD.id AND user_id = OLD.owner_id)'),
+        _log_change('project', False, _project_audience('NEW.id', 'NEW.id')),
+    ],
+    ('projects', 'delete'): [
+        _log_change('project', True, 'SELECT OLD.owner_id AS user_id, OLD.id AS record_id '
+                                     'UNION SELECT user_id, OLD.id FROM project_collaborators '
+                                     'WHERE project_id = OLD.id'),
+    ],
+    ('project_collaborators', 'insert'): _collaborator_added('NEW'),
+    ('project_collaborators', 'update'): (
+        _collaborator_removed('OLD', _COLLABORATOR_MOVED) + _collaborator_added('NEW', _COLLABORATOR_MOVED)
+    ),
+    ('project_collaborators', 'delete'): _collaborator_removed('OLD'),
+}
+
+
+def change_log_triggers(dialect):
+    """``(table, CREATE statement)`` pairs for the change log triggers on ``dialect``"""
+    statements = []
+    for (table, event_name), body in CHANGE_LOG_STATEMENTS.items():
+        name = f'changes_{table}_{event_name}'
+        body = ''.join(f'    {statement.format(**CHANGE_LOG_CLOCKS[dialect])};\n' for statement in body)
+        if dialect == 'postgresql':
+            statements.append((table, f'CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$\n'
+                                      f'BEGIN\n{body}    RETURN NULL;\nEND\n$$ LANGUAGE plpgsql'))
+            statements.append((table, f'CREATE TRIGGER {name} AFTER {event_name.upper()} ON {table} '
+                                      f'FOR EACH ROW EXECUTE FUNCTION {name}()'))
+        else:
+            statements.append((table, f'CREATE TRIGGER {name} AFTER {event_name.upper()} ON {table} '
+                                      f'BEGIN\n{body}END'))
+    return statements
+
+
+def upgrade():
+    op.create_table('changes',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('record_id', sa.Integer(), nullable=False),
+    sa.Column('deleted', sa.Boolean(), nullable=False),
+    sa.Column('position', sa.BigInteger(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_changes_user_id_position_id', 'changes', ['user_id', 'position', 'id'], unique=False)
+    op.create_index('ix_changes_changed_at', 'changes', ['changed_at'], unique=False)
+    # No backfill: clients take their first token after this, then load everything
+    for _, statement in change_log_triggers(op.get_bind().dialect.name):
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table, event_name in CHANGE_LOG_STATEMENTS:
+        name = f'changes_{table}_{event_name}'
+        if dialect == 'postgresql':
+            op.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+            op.execute(f'DROP FUNCTION IF EXISTS {name}()')
+        else:
+            op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_index('ix_changes_changed_at', table_name='changes')
+    op.drop_index('ix_changes_user_id_position_id', table_name='changes')
+    op.drop_table('changes')
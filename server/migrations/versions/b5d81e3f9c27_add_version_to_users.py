@@ -0,0 +1,25 @@
+"""Add version to users
+
+Revision ID: b5d81e3f9c27
+Revises: a4c7e93b1d52
+Create Date: 2026-10-17 15:40:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b5d81e3f9c27'
+down_revision = 'a4c7e93b1d52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('version')
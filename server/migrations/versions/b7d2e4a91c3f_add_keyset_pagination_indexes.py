@@ -0,0 +1,28 @@
+"""Add keyset pagination indexes
+
+Revision ID: b7d2e4a91c3f
+Revises: e55f4ad7d449
+Create Date: 2026-10-17 09:12:03.418220
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e4a91c3f'
+down_revision = 'e55f4ad7d449'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+    op.create_index('ix_projects_owner_id_created_at_id', 'projects', ['owner_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_tasks_user_id_created_at_id', 'tasks', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_project_collaborators_created_at_id', 'project_collaborators', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_project_collaborators_created_at_id', table_name='project_collaborators')
+    op.drop_index('ix_tasks_user_id_created_at_id', table_name='tasks')
+    op.drop_index('ix_projects_owner_id_created_at_id', table_name='projects')
+    op.drop_index('ix_users_created_at_id', table_name='users')
@@ -0,0 +1,37 @@
+"""Add foreign key and filter indexes
+
+Revision ID: c41a8f6e2b57
+Revises: b7d2e4a91c3f
+Create Date: 2026-10-17 10:04:51.207316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c41a8f6e2b57'
+down_revision = 'b7d2e4a91c3f'
+branch_labels = None
+depends_on = None
+
+# Must match models.OPEN_TASK_PREDICATE
+OPEN_TASK_PREDICATE = "status <> 'completed'"
+
+
+def upgrade():
+    op.create_index('ix_tasks_user_id_status', 'tasks', ['user_id', 'status'], unique=False)
+    op.create_index('ix_tasks_user_id_due_date', 'tasks', ['user_id', 'due_date'], unique=False)
+    op.create_index('ix_tasks_project_id', 'tasks', ['project_id'], unique=False)
+    op.create_index('ix_tasks_open_user_id_due_date', 'tasks', ['user_id', 'due_date'], unique=False,
+                    postgresql_where=sa.text(OPEN_TASK_PREDICATE),
+                    sqlite_where=sa.text(OPEN_TASK_PREDICATE))
+    op.create_index('ix_project_collaborators_project_id_user_id', 'project_collaborators',
+                    ['project_id', 'user_id'], unique=False, postgresql_include=['role'])
+
+
+def downgrade():
+    op.drop_index('ix_project_collaborators_project_id_user_id', table_name='project_collaborators')
+    op.drop_index('ix_tasks_open_user_id_due_date', table_name='tasks')
+    op.drop_index('ix_tasks_project_id', table_name='tasks')
+    op.drop_index('ix_tasks_user_id_due_date', table_name='tasks')
+    op.drop_index('ix_tasks_user_id_status', table_name='tasks')
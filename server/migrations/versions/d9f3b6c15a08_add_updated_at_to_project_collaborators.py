@@ -0,0 +1,27 @@
+"""Add updated_at to project collaborators
+
+Revision ID: d9f3b6c15a08
+Revises: c41a8f6e2b57
+Create Date: 2026-10-17 11:37:22.640915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'd9f3b6c15a08'
+down_revision = 'c41a8f6e2b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('project_collaborators', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    # Existing rows were last changed, as far as we know, when created
+    op.execute('UPDATE project_collaborators SET updated_at = created_at')
+
+
+def downgrade():
+    with op.batch_alter_table('project_collaborators', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,71 @@
+"""Delete tasks, projects and collaborators with their parent by ON DELETE CASCADE
+
+Revision ID: e2b7a5c04f18
+Revises: c6e2f4a8d913
+Create Date: 2026-10-17 18:42:13.604217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7a5c04f18'
+down_revision = 'c6e2f4a8d913'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table)
+FOREIGN_KEYS = (
+    ('projects', 'owner_id', 'users'),
+    ('tasks', 'user_id', 'users'),
+    ('tasks', 'project_id', 'projects'),
+    ('project_collaborators', 'user_id', 'users'),
+    ('project_collaborators', 'project_id', 'projects'),
+)
+TABLES = ('projects', 'tasks', 'project_collaborators')
+
+# The initial migration left the foreign keys unnamed. PostgreSQL named them
+# like this; on SQLite batch mode needs the same names to find them.
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+
+def replace_foreign_keys(ondelete):
+    if op.get_bind().dialect.name != 'sqlite':
+        for table, column, referred in FOREIGN_KEYS:
+            name = f'{table}_{column}_fkey'
+            op.drop_constraint(name, table, type_='foreignkey')
+            op.create_foreign_key(name, table, referred, [column], ['id'], ondelete=ondelete)
+        return
+
+    # SQLite alters a foreign key by copying the table, which drops its
+    # triggers, and won't rename the copy while triggers elsewhere name the
+    # missing table. Batch mode doesn't keep partial index predicates either.
+    # Set every trigger and the tables' indexes aside and restore them as they were.
+    bind = op.get_bind()
+    tables = ', '.join(f"'{table}'" for table in TABLES)
+    saved = bind.execute(sa.text(
+        f"SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL "
+        f"AND (type = 'trigger' OR (type = 'index' AND tbl_name IN ({tables})))"
+    )).all()
+    for type_, name, _ in saved:
+        if type_ == 'trigger':
+            op.execute(f'DROP TRIGGER {name}')
+    for table in TABLES:
+        with op.batch_alter_table(table, recreate='always', naming_convention=NAMING_CONVENTION) as batch_op:
+            for fk_table, column, referred in FOREIGN_KEYS:
+                if fk_table == table:
+                    name = f'{table}_{column}_fkey'
+                    batch_op.drop_constraint(name, type_='foreignkey')
+                    batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+    for type_, name, sql in saved:
+        if type_ == 'index':
+            op.execute(f'DROP INDEX IF EXISTS {name}')
+        op.execute(sql)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
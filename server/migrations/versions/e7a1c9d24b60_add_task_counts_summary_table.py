@@ -0,0 +1,144 @@
+"""Add task_counts summary table maintained by triggers
+
+Revision ID: e7a1c9d24b60
+Revises: d9f3b6c15a08
+Create Date: 2026-10-17 14:12:08.310527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e7a1c9d24b60'
+down_revision = 'd9f3b6c15a08'
+branch_labels = None
+depends_on = None
+
+# Must match models.OPEN_TASK_PREDICATE
+OPEN_TASK_PREDICATE = "status <> 'completed'"
+
+# Copies of models.TASK_COUNT_TRIGGERS_POSTGRESQL / _SQLITE as of this revision
+TRIGGERS_POSTGRESQL = (
+    """
+    CREATE OR REPLACE FUNCTION task_counts_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+            SELECT user_id, coalesce(project_id, 0), coalesce(status, ''), coalesce(priority, ''), count(*)
+            FROM new_rows GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+            ON CONFLICT (user_id, project_id, status, priority)
+            DO UPDATE SET task_count = task_counts.task_count + EXCLUDED.task_count;
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE task_counts c SET task_count = c.task_count - d.n
+            FROM (SELECT user_id, coalesce(project_id, 0) AS project_id, coalesce(status, '') AS status,
+                         coalesce(priority, '') AS priority, count(*) AS n
+                  FROM old_rows GROUP BY 1, 2, 3, 4) d
+            WHERE c.user_id = d.user_id AND c.project_id = d.project_id
+              AND c.status = d.status AND c.priority = d.priority;
+        ELSE
+            UPDATE task_counts c SET task_count = c.task_count - d.n
+            FROM (SELECT o.user_id, coalesce(o.project_id, 0) AS project_id, coalesce(o.status, '') AS status,
+                         coalesce(o.priority, '') AS priority, count(*) AS n
+                  FROM old_rows o JOIN new_rows n ON n.id = o.id
+                  WHERE (o.user_id, o.project_id, o.status, o.priority)
+                        IS DISTINCT FROM (n.user_id, n.project_id, n.status, n.priority)
+                  GROUP BY 1, 2, 3, 4) d
+            WHERE c.user_id = d.user_id AND c.project_id = d.project_id
+              AND c.status = d.status AND c.priority = d.priority;
+            INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+            SELECT n.user_id, coalesce(n.project_id, 0), coalesce(n.status, ''), coalesce(n.priority, ''), count(*)
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.project_id, o.status, o.priority)
+                  IS DISTINCT FROM (n.user_id, n.project_id, n.status, n.priority)
+            GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+            ON CONFLICT (user_id, project_id, status, priority)
+            DO UPDATE SET task_count = task_counts.task_count + EXCLUDED.task_count;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tasks_count_insert AFTER INSERT ON tasks
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION task_counts_apply()
+    """,
+    """
+    CREATE TRIGGER tasks_count_delete AFTER DELETE ON tasks
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION task_counts_apply()
+    """,
+    """
+    CREATE TRIGGER tasks_count_update AFTER UPDATE ON tasks
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION task_counts_apply()
+    """,
+)
+
+TRIGGERS_SQLITE = (
+    """
+    CREATE TRIGGER tasks_count_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+        VALUES (NEW.user_id, coalesce(NEW.project_id, 0), coalesce(NEW.status, ''), coalesce(NEW.priority, ''), 1)
+        ON CONFLICT (user_id, project_id, status, priority) DO UPDATE SET task_count = task_count + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER tasks_count_delete AFTER DELETE ON tasks BEGIN
+        UPDATE task_counts SET task_count = task_count - 1
+        WHERE user_id = OLD.user_id AND project_id = coalesce(OLD.project_id, 0)
+          AND status = coalesce(OLD.status, '') AND priority = coalesce(OLD.priority, '');
+    END
+    """,
+    """
+    CREATE TRIGGER tasks_count_update AFTER UPDATE OF user_id, project_id, status, priority ON tasks
+    WHEN OLD.user_id IS NOT NEW.user_id OR OLD.project_id IS NOT NEW.project_id
+      OR OLD.status IS NOT NEW.status OR OLD.priority IS NOT NEW.priority
+    BEGIN
+        UPDATE task_counts SET task_count = task_count - 1
+        WHERE user_id = OLD.user_id AND project_id = coalesce(OLD.project_id, 0)
+          AND status = coalesce(OLD.status, '') AND priority = coalesce(OLD.priority, '');
+        INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+        VALUES (NEW.user_id, coalesce(NEW.project_id, 0), coalesce(NEW.status, ''), coalesce(NEW.priority, ''), 1)
+        ON CONFLICT (user_id, project_id, status, priority) DO UPDATE SET task_count = task_count + 1;
+    END
+    """,
+)
+
+BACKFILL = """
+    INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+    SELECT user_id, coalesce(project_id, 0), coalesce(status, ''), coalesce(priority, ''), count(*)
+    FROM tasks GROUP BY 1, 2, 3, 4
+"""
+
+
+def upgrade():
+    op.create_table('task_counts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('priority', sa.String(length=10), nullable=False),
+    sa.Column('task_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'project_id', 'status', 'priority')
+    )
+    op.create_index('ix_task_counts_project_id', 'task_counts', ['project_id'], unique=False)
+    op.create_index('ix_tasks_open_project_id_due_date', 'tasks', ['project_id', 'due_date'], unique=False,
+                    postgresql_where=sa.text(OPEN_TASK_PREDICATE),
+                    sqlite_where=sa.text(OPEN_TASK_PREDICATE))
+
+    # Triggers first: on PostgreSQL creating them locks out writes to tasks
+    # until this transaction commits, so the backfill misses nothing
+    dialect = op.get_bind().dialect.name
+    for statement in TRIGGERS_POSTGRESQL if dialect == 'postgresql' else TRIGGERS_SQLITE:
+        op.execute(statement)
+    op.execute(BACKFILL)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for name in ('tasks_count_insert', 'tasks_count_delete', 'tasks_count_update'):
+            op.execute(f'DROP TRIGGER IF EXISTS {name} ON tasks')
+        op.execute('DROP FUNCTION IF EXISTS task_counts_apply()')
+    else:
+        for name in ('tasks_count_insert', 'tasks_count_delete', 'tasks_count_update'):
+            op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.drop_index('ix_tasks_open_project_id_due_date', table_name='tasks')
+    op.drop_index('ix_task_counts_project_id', table_name='task_counts')
+    op.drop_table('task_counts')
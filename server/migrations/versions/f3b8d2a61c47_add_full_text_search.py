@@ -0,0 +1,122 @@
+"""Add full-text search over tasks and projects
+
+Revision ID: f3b8d2a61c47
+Revises: e7a1c9d24b60
+Create Date: 2026-10-17 16:40:21.904117
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d2a61c47'
+down_revision = 'e7a1c9d24b60'
+branch_labels = None
+depends_on = None
+
+TABLES = ('tasks', 'projects')
+
+# Copies of models.SEARCH_DDL_POSTGRESQL / _SQLITE as of this revision
+SEARCH_DDL_POSTGRESQL = {
+    table: (
+        f"""
+        ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'B')
+        ) STORED
+        """,
+        f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)",
+    )
+    for table in TABLES
+}
+
+TASK_SEARCH_SCOPE = "'u' || {row}.user_id || coalesce(' p' || {row}.project_id, '')"
+SEARCH_DDL_SQLITE = {
+    'tasks': (
+        """
+        CREATE VIRTUAL TABLE tasks_fts USING fts5(
+            title, description, scope, content='', tokenize='porter unicode61', prefix='3 4 5'
+        )
+        """,
+        f"""
+        CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, description, scope)
+            VALUES (NEW.id, NEW.title, NEW.description, {TASK_SEARCH_SCOPE.format(row='NEW')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description, scope)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description, {TASK_SEARCH_SCOPE.format(row='OLD')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, description, user_id, project_id ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description, scope)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description, {TASK_SEARCH_SCOPE.format(row='OLD')});
+            INSERT INTO tasks_fts (rowid, title, description, scope)
+            VALUES (NEW.id, NEW.title, NEW.description, {TASK_SEARCH_SCOPE.format(row='NEW')});
+        END
+        """,
+    ),
+    'projects': (
+        """
+        CREATE VIRTUAL TABLE projects_fts USING fts5(
+            title, description, content='projects', content_rowid='id', tokenize='porter unicode61', prefix='3 4 5'
+        )
+        """,
+        """
+        CREATE TRIGGER projects_fts_insert AFTER INSERT ON projects BEGIN
+            INSERT INTO projects_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END
+        """,
+        """
+        CREATE TRIGGER projects_fts_delete AFTER DELETE ON projects BEGIN
+            INSERT INTO projects_fts (projects_fts, rowid, title, description)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description);
+        END
+        """,
+        """
+        CREATE TRIGGER projects_fts_update AFTER UPDATE OF title, description ON projects BEGIN
+            INSERT INTO projects_fts (projects_fts, rowid, title, description)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description);
+            INSERT INTO projects_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END
+        """,
+    ),
+}
+
+# Fill the indexes from the rows already there
+BACKFILL_SQLITE = {
+    'tasks': f"""
+        INSERT INTO tasks_fts (rowid, title, description, scope)
+        SELECT id, title, description, {TASK_SEARCH_SCOPE.format(row='tasks')} FROM tasks
+    """,
+    'projects': "INSERT INTO projects_fts (projects_fts) VALUES ('rebuild')",
+}
+
+
+def upgrade():
+    # PostgreSQL fills the generated column for existing rows as part of the
+    # ALTER TABLE, which rewrites the table; on large tables run this in a
+    # maintenance window
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'postgresql':
+            for statement in SEARCH_DDL_POSTGRESQL[table]:
+                op.execute(statement)
+        else:
+            for statement in SEARCH_DDL_SQLITE[table]:
+                op.execute(statement)
+            op.execute(BACKFILL_SQLITE[table])
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == 'postgresql':
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_search_vector')
+            op.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+        else:
+            for name in ('insert', 'delete', 'update'):
+                op.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{name}')
+            op.execute(f'DROP TABLE IF EXISTS {table}_fts')
@@ -1,12 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
 from sqlalchemy_serializer import SerializerMixin
-from flask_bcrypt import Bcrypt
+from passwords import hasher
 from datetime import datetime
 
-bcrypt = Bcrypt()
-
 db = SQLAlchemy()
 
+# Predicate of the partial index on open tasks. Queries must use the same
+# literal (not a bound parameter) for the planner to match the index.
+OPEN_TASK_PREDICATE = "status <> 'completed'"
+
 class User(db.Model, SerializerMixin):
     __tablename__ = 'users'
     
@@ -14,24 +17,36 @@ class User(db.Model, SerializerMixin):
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every edit; access tokens carry the version their claims were made from
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    # Relationships. Children go with their parent by ON DELETE CASCADE (or the
+    # set-based deletes in app.py and jobs.py), never loaded just to be deleted.
+    tasks = db.relationship('Task', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    owned_projects = db.relationship('Project', backref='owner', lazy=True, cascade='all, delete-orphan',
+                                     passive_deletes=True)
+    project_collaborations = db.relationship('ProjectCollaborator', backref='user', lazy=True,
+                                             cascade='all, delete-orphan', passive_deletes=True)
     
-    # Relationships
-    tasks = db.relationship('Task', backref='user', lazy=True, cascade='all, delete-orphan')
-    owned_projects = db.relationship('Project', backref='owner', lazy=True, cascade='all, delete-orphan')
-    project_collaborations = db.relationship('ProjectCollaborator', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Keyset pagination order
+    __table_args__ = (db.Index('ix_users_created_at_id', 'created_at', 'id'),)
     
     # Serialization rules
     serialize_rules = ('-password_hash', '-tasks.user', '-owned_projects.owner', '-project_collaborations.user', '-tasks.project.owner', '-owned_projects.tasks.user')
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = hasher.hash(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return hasher.check(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True when the stored hash was made with a different work factor"""
+        return hasher.needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -42,13 +57,17 @@ class Project(db.Model, SerializerMixin):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
-    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships, deleted with the project by the database (see User)
+    tasks = db.relationship('Task', backref='project', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    collaborators = db.relationship('ProjectCollaborator', backref='project', lazy=True,
+                                    cascade='all, delete-orphan', passive_deletes=True)
     
-    # Relationships
-    tasks = db.relationship('Task', backref='project', lazy=True, cascade='all, delete-orphan')
-    collaborators = db.relationship('ProjectCollaborator', backref='project', lazy=True, cascade='all, delete-orphan')
+    # Keyset pagination order within an owner's projects
+    __table_args__ = (db.Index('ix_projects_owner_id_created_at_id', 'owner_id', 'created_at', 'id'),)
     
     # Serialization rules
     serialize_rules = ('-owner.owned_projects', '-tasks.project', '-collaborators.project', '-owner.tasks', '-tasks.user.owned_projects')
@@ -65,10 +84,25 @@ class Task(db.Model, SerializerMixin):
     status = db.Column(db.String(20), default='pending')  # pending, in_progress, completed
     priority = db.Column(db.String(10), default='medium')  # low, medium, high
     due_date = db.Column(db.DateTime)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Keyset pagination order within a user's tasks, the /tasks filters,
+    # the project foreign key and a partial index of open tasks by due date
+    __table_args__ = (
+        db.Index('ix_tasks_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_tasks_user_id_status', 'user_id', 'status'),
+        db.Index('ix_tasks_user_id_due_date', 'user_id', 'due_date'),
+        db.Index('ix_tasks_project_id', 'project_id'),
+        db.Index('ix_tasks_open_user_id_due_date', 'user_id', 'due_date',
+                 postgresql_where=db.text(OPEN_TASK_PREDICATE),
+                 sqlite_where=db.text(OPEN_TASK_PREDICATE)),
+        db.Index('ix_tasks_open_project_id_due_date', 'project_id', 'due_date',
+                 postgresql_where=db.text(OPEN_TASK_PREDICATE),
+                 sqlite_where=db.text(OPEN_TASK_PREDICATE)),
+    )
     
     # Serialization rules
     serialize_rules = ('-user.tasks', '-project.tasks', '-user.owned_projects', '-project.owner.tasks')
@@ -80,20 +114,405 @@ class ProjectCollaborator(db.Model, SerializerMixin):
     __tablename__ = 'project_collaborators'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id', ondelete='CASCADE'), nullable=False)
     role = db.Column(db.String(20), default='member')  # owner, member, viewer
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Unique constraint to prevent duplicate collaborations
-    __table_args__ = (db.UniqueConstraint('user_id', 'project_id', name='unique_user_project'),)
+    # Unique constraint to prevent duplicate collaborations; indexes for keyset
+    # pagination and for lookups by project (covering the role on Postgres)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'project_id', name='unique_user_project'),
+        db.Index('ix_project_collaborators_created_at_id', 'created_at', 'id'),
+        db.Index('ix_project_collaborators_project_id_user_id', 'project_id', 'user_id',
+                 postgresql_include=['role']),
+    )
     
     # Serialization rules
     serialize_rules = ('-user.project_collaborations', '-project.collaborators', '-user.tasks', '-project.tasks', '-user.owned_projects', '-project.owner')
     
     def __repr__(self):
         return f'<ProjectCollaborator {self.user.username} - {self.project.title} ({self.role})>'
+
+class TaskCount(db.Model):
+    """Number of tasks per assignee, project, status and priority.
+
+    Kept current by triggers on ``tasks`` (below), so dashboard statistics
+    read a few summary rows instead of scanning every task. ``project_id`` 0
+    stands for "no project" and empty strings for a missing status or
+    priority, so every group has a usable primary key.
+    """
+    __tablename__ = 'task_counts'
+    
+    user_id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    priority = db.Column(db.String(10), primary_key=True)
+    task_count = db.Column(db.Integer, nullable=False, default=0)
     
-    @property
-    def updated_at(self):
-        return self.created_at
\ No newline at end of file
+    __table_args__ = (db.Index('ix_task_counts_project_id', 'project_id'),)
+
+# Trigger DDL for task_counts; the migration that adds the table carries a copy.
+# PostgreSQL uses statement-level triggers with transition tables, so a bulk
+# insert, update or delete adjusts each group once per statement.
+TASK_COUNT_TRIGGERS_POSTGRESQL = (
+    """
+    CREATE OR REPLACE FUNCTION task_counts_apply() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+            SELECT user_id, coalesce(project_id, 0), coalesce(status, ''), coalesce(priority, ''), count(*)
+            FROM new_rows GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+            ON CONFLICT (user_id, project_id, status, priority)
+            DO UPDATE SET task_count = task_counts.task_count + EXCLUDED.task_count;
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE task_counts c SET task_count = c.task_count - d.n
+            FROM (SELECT user_id, coalesce(project_id, 0) AS project_id, coalesce(status, '') AS status,
+                         coalesce(priority, '') AS priority, count(*) AS n
+                  FROM old_rows GROUP BY 1, 2, 3, 4) d
+            WHERE c.user_id = d.user_id AND c.project_id = d.project_id
+              AND c.status = d.status AND c.priority = d.priority;
+        ELSE
+            UPDATE task_counts c SET task_count = c.task_count - d.n
+            FROM (SELECT o.user_id, coalesce(o.project_id, 0) AS project_id, coalesce(o.status, '') AS status,
+                         coalesce(o.priority, '') AS priority, count(*) AS n
+                  FROM old_rows o JOIN new_rows n ON n.id = o.id
+                  WHERE (o.user_id, o.project_id, o.status, o.priority)
+                        IS DISTINCT FROM (n.user_id, n.project_id, n.status, n.priority)
+                  GROUP BY 1, 2, 3, 4) d
+            WHERE c.user_id = d.user_id AND c.project_id = d.project_id
+              AND c.status = d.status AND c.priority = d.priority;
+            INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+            SELECT n.user_id, coalesce(n.project_id, 0), coalesce(n.status, ''), coalesce(n.priority, ''), count(*)
+            FROM new_rows n JOIN old_rows o ON o.id = n.id
+            WHERE (o.user_id, o.project_id, o.status, o.priority)
+                  IS DISTINCT FROM (n.user_id, n.project_id, n.status, n.priority)
+            GROUP BY 1, 2, 3, 4 ORDER BY 1, 2, 3, 4
+            ON CONFLICT (user_id, project_id, status, priority)
+            DO UPDATE SET task_count = task_counts.task_count + EXCLUDED.task_count;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tasks_count_insert AFTER INSERT ON tasks
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION task_counts_apply()
+    """,
+    """
+    CREATE TRIGGER tasks_count_delete AFTER DELETE ON tasks
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION task_counts_apply()
+    """,
+    """
+    CREATE TRIGGER tasks_count_update AFTER UPDATE ON tasks
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION task_counts_apply()
+    """,
+)
+
+# SQLite has row-level triggers only
+_SQLITE_COUNT_UP = """
+        INSERT INTO task_counts (user_id, project_id, status, priority, task_count)
+        VALUES (NEW.user_id, coalesce(NEW.project_id, 0), coalesce(NEW.status, ''), coalesce(NEW.priority, ''), 1)
+        ON CONFLICT (user_id, project_id, status, priority) DO UPDATE SET task_count = task_count + 1;"""
+_SQLITE_COUNT_DOWN = """
+        UPDATE task_counts SET task_count = task_count - 1
+        WHERE user_id = OLD.user_id AND project_id = coalesce(OLD.project_id, 0)
+          AND status = coalesce(OLD.status, '') AND priority = coalesce(OLD.priority, '');"""
+TASK_COUNT_TRIGGERS_SQLITE = (
+    f"CREATE TRIGGER tasks_count_insert AFTER INSERT ON tasks BEGIN{_SQLITE_COUNT_UP}\n    END",
+    f"CREATE TRIGGER tasks_count_delete AFTER DELETE ON tasks BEGIN{_SQLITE_COUNT_DOWN}\n    END",
+    "CREATE TRIGGER tasks_count_update AFTER UPDATE OF user_id, project_id, status, priority ON tasks\n"
+    "    WHEN OLD.user_id IS NOT NEW.user_id OR OLD.project_id IS NOT NEW.project_id\n"
+    "      OR OLD.status IS NOT NEW.status OR OLD.priority IS NOT NEW.priority\n"
+    f"    BEGIN{_SQLITE_COUNT_DOWN}{_SQLITE_COUNT_UP}\n    END",
+)
+
+# create_all() (benchmarks) installs the triggers with the tasks table
+for _statement in TASK_COUNT_TRIGGERS_POSTGRESQL:
+    event.listen(Task.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+for _statement in TASK_COUNT_TRIGGERS_SQLITE:
+    event.listen(Task.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+# Full-text search (see search.py). These objects live outside the ORM
+# metadata because they differ per database; the migration that adds them
+# carries a copy of the DDL.
+# PostgreSQL: a generated, weighted tsvector column per table with a GIN index
+SEARCH_TEXT_CONFIG = 'english'
+SEARCH_DDL_POSTGRESQL = {
+    table: (
+        f"""
+        ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('{SEARCH_TEXT_CONFIG}', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_TEXT_CONFIG}', coalesce(description, '')), 'B')
+        ) STORED
+        """,
+        f"CREATE INDEX ix_{table}_search_vector ON {table} USING gin (search_vector)",
+    )
+    for table in ('tasks', 'projects')
+}
+
+# SQLite: an FTS5 table per table, kept in sync by triggers. The tasks one
+# also indexes who can see each task as tokens in a ``scope`` column
+# (``u<assignee id>``, ``p<project id>``), so a search narrows to the user's
+# tasks inside the index instead of ranking every match and filtering after.
+# The scope isn't a column of tasks, so tasks_fts can't read its content
+# from there: it is contentless, and deletes repeat the indexed values.
+TASK_SEARCH_SCOPE = "'u' || {row}.user_id || coalesce(' p' || {row}.project_id, '')"
+SEARCH_DDL_SQLITE = {
+    'tasks': (
+        """
+        CREATE VIRTUAL TABLE tasks_fts USING fts5(
+            title, description, scope, content='', tokenize='porter unicode61', prefix='3 4 5'
+        )
+        """,
+        f"""
+        CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, description, scope)
+            VALUES (NEW.id, NEW.title, NEW.description, {TASK_SEARCH_SCOPE.format(row='NEW')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description, scope)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description, {TASK_SEARCH_SCOPE.format(row='OLD')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, description, user_id, project_id ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, description, scope)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description, {TASK_SEARCH_SCOPE.format(row='OLD')});
+            INSERT INTO tasks_fts (rowid, title, description, scope)
+            VALUES (NEW.id, NEW.title, NEW.description, {TASK_SEARCH_SCOPE.format(row='NEW')});
+        END
+        """,
+    ),
+    'projects': (
+        """
+        CREATE VIRTUAL TABLE projects_fts USING fts5(
+            title, description, content='projects', content_rowid='id', tokenize='porter unicode61', prefix='3 4 5'
+        )
+        """,
+        """
+        CREATE TRIGGER projects_fts_insert AFTER INSERT ON projects BEGIN
+            INSERT INTO projects_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END
+        """,
+        """
+        CREATE TRIGGER projects_fts_delete AFTER DELETE ON projects BEGIN
+            INSERT INTO projects_fts (projects_fts, rowid, title, description)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description);
+        END
+        """,
+        """
+        CREATE TRIGGER projects_fts_update AFTER UPDATE OF title, description ON projects BEGIN
+            INSERT INTO projects_fts (projects_fts, rowid, title, description)
+            VALUES ('delete', OLD.id, OLD.title, OLD.description);
+            INSERT INTO projects_fts (rowid, title, description) VALUES (NEW.id, NEW.title, NEW.description);
+        END
+        """,
+    ),
+}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Keep Alembic autogenerate from dropping the search objects it can't see in the models"""
+    if type_ == 'column' and name == 'search_vector':
+        return False
+    if type_ == 'index' and name and name.endswith('_search_vector'):
+        return False
+    if type_ == 'table' and reflected and compare_to is None and '_fts' in name:
+        return False
+    return True
+
+
+for _model in (Task, Project):
+    _table = _model.__table__
+    for _statement in SEARCH_DDL_POSTGRESQL[_table.name]:
+        event.listen(_table, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+    for _statement in SEARCH_DDL_SQLITE[_table.name]:
+        event.listen(_table, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+    # The FTS table isn't in the metadata, so drop_all() wouldn't remove it
+    event.listen(_table, 'after_drop', DDL(f'DROP TABLE IF EXISTS {_table.name}_fts').execute_if(dialect='sqlite'))
+
+class Change(db.Model):
+    """A task, project or collaborator record created, updated or deleted, for one user.
+
+    Written by triggers (below), so bulk statements and cascades are logged
+    too, and read by GET /sync (see sync.py). There is a row for every user
+    who should hear about the change: the assignee of a task, the owner and
+    collaborators of a project and of its collaborator records. Gaining or
+    losing access to a project also logs the project and its collaborators
+    for the user concerned. ``position`` orders rows by the transaction that
+    wrote them on PostgreSQL; SQLite commits one writer at a time, so there
+    it stays 0 and ``id`` gives the order.
+    """
+    __tablename__ = 'changes'
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # task, project, collaborator
+    record_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False)
+    position = db.Column(db.BigInteger, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # A user's changes in order, and pruning by age
+    __table_args__ = (
+        db.Index('ix_changes_user_id_position_id', 'user_id', 'position', 'id'),
+        db.Index('ix_changes_changed_at', 'changed_at'),
+    )
+
+    def __repr__(self):
+        return f'<Change {self.kind} {self.record_id} for user {self.user_id}>'
+
+class Job(db.Model):
+    """Deferred work, run by a worker outside the request (see jobs.py).
+
+    ``status`` goes queued -> running -> succeeded or failed; a failed
+    attempt goes back to queued, not before ``run_at``. A running job's
+    worker renews ``locked_at`` as it goes, and a job whose lease has run
+    out is taken up again. ``key`` makes enqueueing idempotent while the job
+    is queued or running; a finished job is reset when its key comes back.
+    """
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    key = db.Column(db.String(200), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    priority = db.Column(db.Integer, nullable=False, default=0)  # Higher runs first
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    progress = db.Column(db.Text)  # JSON, saved as the job goes
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer)  # Not a foreign key: a job may delete its user
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # Claiming the next job, and pruning finished ones by age
+    __table_args__ = (
+        db.Index('ix_jobs_status_priority_id', 'status', 'priority', 'id'),
+        db.Index('ix_jobs_finished_at', 'finished_at'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} ({self.status})>'
+
+# Change log triggers. The statements are shared by both databases, which
+# run them per row; only the position and clock differ.
+CHANGE_LOG_CLOCKS = {
+    'postgresql': {'position': 'pg_current_xact_id()::text::bigint', 'now': "(now() AT TIME ZONE 'utc')"},
+    'sqlite': {'position': '0', 'now': 'CURRENT_TIMESTAMP'},
+}
+
+
+def _log_change(kind, deleted, source, *conditions):
+    """INSERT of a ``kind`` change for each (user_id, record_id) row of ``source``"""
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return (f"INSERT INTO changes (user_id, kind, record_id, deleted, position, changed_at) "
+            f"SELECT user_id, '{kind}', record_id, {'TRUE' if deleted else 'FALSE'}, {{position}}, {{now}} "
+            f"FROM ({source}) AS changed{where}")
+
+
+def _project_audience(project_id, record_id):
+    """The owner and collaborators of a project, paired with ``record_id``"""
+    return (f"SELECT owner_id AS user_id, {record_id} AS record_id FROM projects WHERE id = {project_id} "
+            f"UNION SELECT user_id, {record_id} FROM project_collaborators WHERE project_id = {project_id}")
+
+
+def _collaborator_added(row, *conditions):
+    """Tell the project's audience; when ``conditions`` hold, catch the collaborator up as well"""
+    return [
+        _log_change('collaborator', False, _project_audience(f'{row}.project_id', f'{row}.id')),
+        # The new collaborator now sees the project and everyone on it
+        _log_change('project', False, f"SELECT {row}.user_id AS user_id, {row}.project_id AS record_id",
+                    *conditions),
+        _log_change('collaborator', False, f"SELECT {row}.user_id AS user_id, id AS record_id "
+                                           f"FROM project_collaborators WHERE project_id = {row}.project_id",
+                    *conditions),
+    ]
+
+
+def _collaborator_removed(row, *conditions):
+    # Unless they own the project, the removed collaborator no longer sees it
+    lost_access = (f"NOT EXISTS (SELECT 1 FROM projects WHERE id = {row}.project_id "
+                   f"AND owner_id = {row}.user_id)")
+    return [
+        _log_change('collaborator', True, f"{_project_audience(f'{row}.project_id', f'{row}.id')} "
+                                          f"UNION SELECT {row}.user_id, {row}.id", *conditions),
+        _log_change('project', True, f"SELECT {row}.user_id AS user_id, {row}.project_id AS record_id",
+                    lost_access, *conditions),
+        _log_change('collaborator', True, f"SELECT {row}.user_id AS user_id, id AS record_id "
+                                          f"FROM project_collaborators WHERE project_id = {row}.project_id",
+                    lost_access, *conditions),
+    ]
+
+
+# A collaborator record moved to another user or project
+_COLLABORATOR_MOVED = '(OLD.user_id <> NEW.user_id OR OLD.project_id <> NEW.project_id)'
+
+# {(table, event): statements}
+CHANGE_LOG_STATEMENTS = {
+    ('tasks', 'insert'): [
+        _log_change('task', False, 'SELECT NEW.user_id AS user_id, NEW.id AS record_id'),
+    ],
+    ('tasks', 'update'): [
+        # Reassigned: gone for the previous assignee
+        _log_change('task', True, 'SELECT OLD.user_id AS user_id, OLD.id AS record_id',
+                    'OLD.user_id <> NEW.user_id'),
+        _log_change('task', False, 'SELECT NEW.user_id AS user_id, NEW.id AS record_id'),
+    ],
+    ('tasks', 'delete'): [
+        _log_change('task', True, 'SELECT OLD.user_id AS user_id, OLD.id AS record_id'),
+    ],
+    ('projects', 'insert'): [
+        _log_change('project', False, _project_audience('NEW.id', 'NEW.id')),
+    ],
+    ('projects', 'update'): [
+        _log_change('project', True, 'SELECT OLD.owner_id AS user_id, OLD.id AS record_id',
+                    'OLD.owner_id <> NEW.owner_id',
+                    'NOT EXISTS (SELECT 1 FROM project_collaborators '
+                    'WHERE project_id = OLD.id AND user_id = OLD.owner_id)'),
+        _log_change('project', False, _project_audience('NEW.id', 'NEW.id')),
+    ],
+    ('projects', 'delete'): [
+        _log_change('project', True, 'SELECT OLD.owner_id AS user_id, OLD.id AS record_id '
+                                     'UNION SELECT user_id, OLD.id FROM project_collaborators '
+                                     'WHERE project_id = OLD.id'),
+    ],
+    ('project_collaborators', 'insert'): _collaborator_added('NEW'),
+    ('project_collaborators', 'update'): (
+        _collaborator_removed('OLD', _COLLABORATOR_MOVED) + _collaborator_added('NEW', _COLLABORATOR_MOVED)
+    ),
+    ('project_collaborators', 'delete'): _collaborator_removed('OLD'),
+}
+
+
+def change_log_triggers(dialect):
+    """``(table, CREATE statement)`` pairs for the change log triggers on ``dialect``"""
+    statements = []
+    for (table, event_name), body in CHANGE_LOG_STATEMENTS.items():
+        name = f'changes_{table}_{event_name}'
+        body = ''.join(f'    {statement.format(**CHANGE_LOG_CLOCKS[dialect])};\n' for statement in body)
+        if dialect == 'postgresql':
+            statements.append((table, f'CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$\n'
+                                      f'BEGIN\n{body}    RETURN NULL;\nEND\n$$ LANGUAGE plpgsql'))
+            statements.append((table, f'CREATE TRIGGER {name} AFTER {event_name.upper()} ON {table} '
+                                      f'FOR EACH ROW EXECUTE FUNCTION {name}()'))
+        else:
+            statements.append((table, f'CREATE TRIGGER {name} AFTER {event_name.upper()} ON {table} '
+                                      f'BEGIN\n{body}END'))
+    return statements
+
+
+for _dialect in CHANGE_LOG_CLOCKS:
+    for _table_name, _statement in change_log_triggers(_dialect):
+        _table = db.metadata.tables[_table_name]
+        event.listen(_table, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
@@ -0,0 +1,117 @@
+"""
+Keyset (cursor) pagination for collection routes.
+
+Pages are ordered by a sort column plus ``id`` as a tie-breaker, and the next
+page starts strictly after the last row of the previous one. Cost per page is
+constant however deep the client pages, as long as an index covers the
+ordering. Sort columns are NOT NULL, since the tuple comparison would skip a
+row with a NULL sort value. Cursors are opaque to clients: base64url-encoded
+JSON carrying the sort key and the last row's position.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import DateTime, tuple_
+
+from models import User, Task, Project, ProjectCollaborator
+
+DEFAULT_SORT = 'created_at'
+
+# Columns clients may sort by; prefix with '-' for descending order
+SORTABLE = {
+    User: ('created_at', 'updated_at', 'username', 'id'),
+    Project: ('created_at', 'updated_at', 'title', 'id'),
+    Task: ('created_at', 'updated_at', 'title', 'id'),
+    ProjectCollaborator: ('created_at', 'id'),
+}
+
+
+class InvalidQueryParameter(ValueError):
+    """A malformed sort, limit, cursor or filter parameter"""
+
+
+def page_size(args):
+    default = current_app.config['PAGE_SIZE_DEFAULT']
+    maximum = current_app.config['PAGE_SIZE_MAX']
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        raise InvalidQueryParameter('limit must be an integer')
+    if limit < 1:
+        raise InvalidQueryParameter('limit must be positive')
+    return min(limit, maximum)
+
+
+def parse_sort(model, args):
+    sort = args.get('sort', DEFAULT_SORT)
+    key = sort[1:] if sort.startswith('-') else sort
+    if key not in SORTABLE[model]:
+        allowed = ', '.join(SORTABLE[model])
+        raise InvalidQueryParameter(f'Cannot sort by {key!r}; choose one of: {allowed}')
+    return sort, key, sort.startswith('-')
+
+
+def encode_cursor(sort, value, id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, value, id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor, model, sort, key):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort:
+            raise InvalidQueryParameter('Cursor was issued for a different sort order')
+        if value is not None and isinstance(getattr(model, key).type, DateTime):
+            value = datetime.fromisoformat(value)
+        return value, int(id)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidQueryParameter('Invalid cursor')
+
+
+def order(query, model, args):
+    """Apply sort and cursor from the request args, without a limit.
+
+    Returns ``(query, sort, key)``.
+    """
+    sort, key, descending = parse_sort(model, args)
+    column = getattr(model, key)
+    position = (model.id,) if key == 'id' else (column, model.id)
+
+    cursor = args.get('cursor')
+    if cursor:
+        value, last_id = decode_cursor(cursor, model, sort, key)
+        after = (last_id,) if key == 'id' else (value, last_id)
+        if descending:
+            query = query.filter(tuple_(*position) < tuple_(*after))
+        else:
+            query = query.filter(tuple_(*position) > tuple_(*after))
+
+    ordering = [c.desc() if descending else c.asc() for c in position]
+    return query.order_by(None).order_by(*ordering), sort, key
+
+
+def paginate(query, model, args):
+    """Apply sort, cursor and limit from the request args.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    limit = page_size(args)
+    query, sort, key = order(query, model, args)
+    return split_page(query.limit(limit + 1).all(), limit, sort, key)
+
+
+def split_page(rows, limit, sort, key):
+    """Cut ``limit + 1`` fetched rows down to a page; returns ``(rows, next_cursor)``"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, key), last.id)
+    return rows, next_cursor
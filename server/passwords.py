@@ -0,0 +1,211 @@
+"""
+Password hashing off the request thread.
+
+bcrypt is deliberately slow, so hashing and verification run on a small
+process pool instead of the worker serving the request. The number of
+outstanding jobs is bounded: once ``PASSWORD_HASH_MAX_PENDING`` jobs are
+running or queued, new ones are rejected with ``HasherBusy`` rather than
+piling up behind a login storm. A job that doesn't finish within
+``PASSWORD_HASH_TIMEOUT`` raises ``HasherBusy`` too, and keeps its slot
+until it does finish.
+
+Configuration (see ``Config``):
+
+- ``BCRYPT_LOG_ROUNDS``: work factor for new hashes. Existing hashes with a
+  different cost are upgraded on the next successful login.
+- ``PASSWORD_HASH_WORKERS``: pool size; 0 hashes inline on the calling thread.
+  Where no process pool can start (serverless runtimes often lack the
+  semaphores it needs) the hasher logs it once and hashes inline instead.
+- ``PASSWORD_HASH_MAX_PENDING``: cap on running plus queued jobs.
+- ``PASSWORD_HASH_TIMEOUT``: seconds to wait for a result.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+log = logging.getLogger(__name__)
+
+
+class HasherBusy(Exception):
+    """Too many password hashing jobs are already pending"""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+
+def hash_rounds(password_hash):
+    """Work factor of a bcrypt hash ('$2b$12$...' -> 12), or None if unparseable"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 0
+        self.max_pending = 32
+        self.timeout = 10
+        self._executor = None
+        self._executor_pid = None
+        self._pool_unavailable = False
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_seconds = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(
+            rounds=app.config.get('BCRYPT_LOG_ROUNDS', 12),
+            workers=app.config.get('PASSWORD_HASH_WORKERS', 0),
+            max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 32),
+            timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10),
+        )
+
+    def configure(self, rounds=None, workers=None, max_pending=None, timeout=None):
+        """Change settings; a running pool is shut down and recreated on next use"""
+        with self._lock:
+            if rounds is not None:
+                self.rounds = rounds
+            if timeout is not None:
+                self.timeout = timeout
+            if max_pending is not None and max_pending != self.max_pending:
+                self.max_pending = max_pending
+                self._slots = threading.BoundedSemaphore(max_pending)
+            if workers is not None and workers != self.workers:
+                self.workers = workers
+                self._shutdown_executor()
+                self._pool_unavailable = False
+
+    def hash(self, password):
+        return self._run(_hash, password.encode('utf-8'), self.rounds)
+
+    def check(self, password_hash, password):
+        return self._run(_check, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            completed = self._completed
+            return {
+                'workers': self.workers,
+                'pool_unavailable': self._pool_unavailable,
+                'rounds': self.rounds,
+                'max_pending': self.max_pending,
+                'pending': self._pending,
+                'queued': max(0, self._pending - max(self.workers, 1)),
+                'completed': completed,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'avg_wait_ms': round(self._wait_seconds / completed * 1000, 3) if completed else 0.0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown_executor()
+
+    def _run(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HasherBusy('Password hashing is at capacity, try again shortly')
+        with self._lock:
+            self._pending += 1
+        release = True
+        try:
+            future = self._submit(fn, *args) if self.workers > 0 else None
+            if future is None:
+                result = fn(*args)
+                waited = 0.0
+            else:
+                enqueued = time.monotonic()
+                try:
+                    started, result = future.result(timeout=self.timeout)
+                except FutureTimeout:
+                    with self._lock:
+                        self._timed_out += 1
+                    if not future.cancel():
+                        # Still running: hold its slot until it's done, so the cap holds
+                        release = False
+                        future.add_done_callback(lambda _: self._release(slots))
+                    raise HasherBusy('Password hashing timed out, try again shortly')
+                waited = max(0.0, started - enqueued)
+            with self._lock:
+                self._completed += 1
+                self._wait_seconds += waited
+            return result
+        finally:
+            if release:
+                self._release(slots)
+
+    def _release(self, slots):
+        with self._lock:
+            self._pending -= 1
+        slots.release()
+
+    def _submit(self, fn, *args):
+        """Run ``fn`` on the pool; None when there is no pool and it should run inline"""
+        executor = self._get_executor()
+        if executor is None:
+            return None
+        try:
+            # Worker processes start here, on first use
+            return executor.submit(_timed, fn, *args)
+        except (OSError, BrokenProcessPool) as e:
+            self._pool_failed(e)
+            return None
+
+    def _get_executor(self):
+        # A pool inherited across fork() has no live workers; build a fresh one
+        with self._lock:
+            if self._pool_unavailable:
+                return None
+            if self._executor is None or self._executor_pid != os.getpid():
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                except (OSError, ImportError, NotImplementedError) as e:
+                    self._pool_unavailable = True
+                    log.warning('No process pool for password hashing (%s); hashing inline', e)
+                    return None
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _pool_failed(self, error):
+        with self._lock:
+            self._shutdown_executor()
+            self._pool_unavailable = True
+        log.warning('Password hashing pool failed to start (%s); hashing inline', error)
+
+    def _shutdown_executor(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._executor_pid = None
+
+
+def _timed(fn, *args):
+    # CLOCK_MONOTONIC is system-wide, so the parent can compare the start time
+    return time.monotonic(), fn(*args)
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,228 @@
+"""
+Access control for every API resource.
+
+``role_for()`` resolves the caller's role on one resource with a single
+indexed query, and caches the answer on ``flask.g`` for the rest of the
+request. ``authorize()`` turns that role into allow/deny for an action.
+``visible()`` gives the same rules as a SQL criterion, for filtering list
+queries without checking rows one at a time.
+
+Roles and what they allow:
+
+- ``owner``: read, write, delete, manage (add or remove collaborators)
+- ``member``: read, write
+- ``viewer``: read
+
+A project's owner, and collaborators with role ``owner``, are project
+owners. Other collaborators take their collaborator role. Tasks belong only
+to their assignee. Any user may view any user; only the user themselves may
+edit or delete their account. Collaborator records follow their project:
+project owners manage them, and every other collaborator may view them.
+
+A PATCH may only set the fields in ``WRITABLE_FIELDS``. Those in
+``MANAGE_FIELDS`` hand the resource to another owner or project, and take
+``manage`` rather than ``write``: a member can't make themselves owner.
+"""
+
+from flask import g, abort
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import and_, func, or_, select, true
+from sqlalchemy.orm import aliased
+
+from models import db, User, Task, Project, ProjectCollaborator
+
+READ = 'read'
+WRITE = 'write'
+DELETE = 'delete'
+MANAGE = 'manage'
+
+OWNER = 'owner'
+MEMBER = 'member'
+VIEWER = 'viewer'
+
+ROLE_ACTIONS = {
+    OWNER: frozenset((READ, WRITE, DELETE, MANAGE)),
+    MEMBER: frozenset((READ, WRITE)),
+    VIEWER: frozenset((READ,)),
+}
+
+# Action implied by the HTTP method of a single-resource route
+METHOD_ACTIONS = {'GET': READ, 'PATCH': WRITE, 'DELETE': DELETE}
+
+# Collaborator roles on a project that grant each action
+PROJECT_ROLES_FOR = {
+    action: tuple(role for role, actions in ROLE_ACTIONS.items() if action in actions)
+    for action in (READ, WRITE, DELETE, MANAGE)
+}
+
+# Marks a resource that does not exist, as opposed to one with no access
+NOT_FOUND = object()
+
+# Fields a PATCH of each model may set
+WRITABLE_FIELDS = {
+    User: ('username', 'email'),
+    Project: ('title', 'description', 'owner_id'),
+    Task: ('title', 'description', 'status', 'priority', 'due_date', 'project_id'),
+    ProjectCollaborator: ('role', 'user_id', 'project_id'),
+}
+
+# Of those, the fields that move the resource, which need MANAGE on it
+MANAGE_FIELDS = {
+    Project: ('owner_id',),
+    Task: ('project_id',),
+}
+
+
+class AccessDenied(Exception):
+    """The current user may not perform this action on the resource"""
+
+
+class UnwritableField(ValueError):
+    """A PATCH body that isn't an object, or sets a field clients may not change"""
+
+
+def current_user_id():
+    return int(get_jwt_identity())
+
+
+def allows(role, action):
+    return role in ROLE_ACTIONS and action in ROLE_ACTIONS[role]
+
+
+def role_for(model, id, user_id=None):
+    """The user's role on one resource: a role name, None, or NOT_FOUND"""
+    if user_id is None:
+        user_id = current_user_id()
+    cache = g.setdefault('_permission_cache', {})
+    key = (model, id, user_id)
+    if key not in cache:
+        cache[key] = _RESOLVERS[model](id, user_id)
+    return cache[key]
+
+
+def authorize(action, model, id, user_id=None):
+    """Abort with 404 if the resource is missing; raise AccessDenied if the action is not allowed"""
+    role = role_for(model, id, user_id)
+    if role is NOT_FOUND:
+        abort(404)
+    if not allows(role, action):
+        raise AccessDenied(f'{action} denied on {model.__name__} {id}')
+    return role
+
+
+def authorize_changes(model, id, data):
+    """Check a PATCH body: raise UnwritableField for fields it may not set, and
+    AccessDenied unless the user may manage the resource when it moves it"""
+    if not isinstance(data, dict):
+        raise UnwritableField('Request body must be a JSON object')
+    unwritable = sorted(set(data) - set(WRITABLE_FIELDS[model]))
+    if unwritable:
+        raise UnwritableField(f'Cannot change field(s): {", ".join(unwritable)}')
+    if any(field in data for field in MANAGE_FIELDS.get(model, ())):
+        authorize(MANAGE, model, id)
+
+
+def forget(model=None, id=None):
+    """Drop cached roles, e.g. after changing collaborators mid-request"""
+    cache = g.get('_permission_cache')
+    if not cache:
+        return
+    if model is None:
+        cache.clear()
+        return
+    for key in [key for key in cache if key[0] is model and (id is None or key[1] == id)]:
+        del cache[key]
+
+
+def visible(model, action=READ, user_id=None):
+    """SQL criterion matching the rows of ``model`` the user may perform ``action`` on"""
+    if user_id is None:
+        user_id = current_user_id()
+    if model is Project:
+        return _project_criterion(Project.id, Project.owner_id, action, user_id)
+    if model is Task:
+        return Task.user_id == user_id
+    if model is ProjectCollaborator:
+        # Project owners manage collaborators; everyone on the project may view them
+        project_action = READ if action == READ else MANAGE
+        projects = select(Project.id).where(visible(Project, project_action, user_id))
+        return ProjectCollaborator.project_id.in_(projects)
+    if model is User:
+        return true() if action == READ else User.id == user_id
+    raise ValueError(f'No access rules for {model.__name__}')
+
+
+def _collaborator_role():
+    # role is nullable; a collaborator without one is a member (the column default)
+    return func.coalesce(ProjectCollaborator.role, MEMBER)
+
+
+def _project_criterion(project_id, owner_id, action, user_id):
+    roles = PROJECT_ROLES_FOR[action]
+    # An uncorrelated IN rather than EXISTS, so both sides of the OR can use
+    # an index instead of checking every project
+    collaborating = select(ProjectCollaborator.project_id).where(
+        ProjectCollaborator.user_id == user_id,
+        _collaborator_role().in_(roles),
+    )
+    return or_(owner_id == user_id, project_id.in_(collaborating))
+
+
+def _project_role(owner_id, collaborator_id, collaborator_role, user_id):
+    if owner_id == user_id:
+        return OWNER
+    if collaborator_id is None:
+        return None
+    return collaborator_role or MEMBER
+
+
+def _resolve_project(project_id, user_id):
+    row = db.session.execute(
+        select(Project.owner_id, ProjectCollaborator.id, ProjectCollaborator.role)
+        .outerjoin(ProjectCollaborator, and_(ProjectCollaborator.project_id == Project.id,
+                                             ProjectCollaborator.user_id == user_id))
+        .where(Project.id == project_id)
+    ).first()
+    if row is None:
+        return NOT_FOUND
+    return _project_role(*row, user_id)
+
+
+def _resolve_task(task_id, user_id):
+    assignee_id = db.session.execute(select(Task.user_id).where(Task.id == task_id)).scalar()
+    if assignee_id is None:
+        return NOT_FOUND
+    return OWNER if assignee_id == user_id else None
+
+
+def _resolve_collaborator(collaborator_id, user_id):
+    mine = aliased(ProjectCollaborator)
+    row = db.session.execute(
+        select(Project.owner_id, mine.id, mine.role)
+        .select_from(ProjectCollaborator)
+        .join(Project, Project.id == ProjectCollaborator.project_id)
+        .outerjoin(mine, and_(mine.project_id == ProjectCollaborator.project_id,
+                              mine.user_id == user_id))
+        .where(ProjectCollaborator.id == collaborator_id)
+    ).first()
+    if row is None:
+        return NOT_FOUND
+    project_role = _project_role(*row, user_id)
+    if project_role is None:
+        return None
+    return OWNER if project_role == OWNER else VIEWER
+
+
+def _resolve_user(target_id, user_id):
+    if target_id == user_id:
+        return OWNER
+    found = db.session.execute(select(User.id).where(User.id == target_id)).scalar()
+    return VIEWER if found is not None else NOT_FOUND
+
+
+_RESOLVERS = {
+    Project: _resolve_project,
+    Task: _resolve_task,
+    ProjectCollaborator: _resolve_collaborator,
+    User: _resolve_user,
+}
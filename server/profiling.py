@@ -0,0 +1,292 @@
+"""
+Per-request timing and profiling.
+
+A profiled request records its wall time, the number of SQL statements and
+the time spent in them, serialization time (building response dicts and
+encoding JSON) and JWT decode time. These go out in a ``Server-Timing``
+header (shown by browser dev tools) and as one JSON log line on the
+``planwise.profiling`` logger.
+
+Configuration (see ``Config``):
+
+- ``PROFILING_ENABLED``: profile every request.
+- ``PROFILING_TOKEN``: profile a single request that sends
+  ``X-Profile: <token>``. Without a token the header is only honoured in
+  development.
+- ``PROFILING_SAMPLE_RATE``: fraction of profiled requests that also run
+  under a profiler (0 disables sampling). For each route the slowest
+  ``PROFILING_KEEP_SLOWEST`` of those are kept as dumps in ``PROFILING_DIR``:
+  ``.prof`` files for ``cProfile`` (open with ``pstats`` or snakeviz) or
+  ``.html`` for ``pyinstrument`` (optional dependency), chosen by
+  ``PROFILING_PROFILER``.
+
+Streamed responses are measured up to the point the body starts; the SQL
+and encoding done while streaming fall outside the header.
+"""
+
+import cProfile
+import functools
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+PROFILERS = ('cprofile', 'pyinstrument')
+HEADER = 'X-Profile'
+
+logger = logging.getLogger('planwise.profiling')
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.spans = {'serialize': 0.0, 'jwt': 0.0}
+        self.depth = 0
+        self.profiler = None
+
+    def timings(self):
+        """Milliseconds per phase, for the header and the log line"""
+        return {
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_seconds * 1000, 3),
+            'serialize_ms': round(self.spans['serialize'] * 1000, 3),
+            'jwt_ms': round(self.spans['jwt'] * 1000, 3),
+        }
+
+
+def current():
+    """The profile of the request being served, or None when it isn't profiled"""
+    if not has_request_context():
+        return None
+    return g.get('_profile')
+
+
+@contextmanager
+def span(name):
+    """Add the time spent in the block to ``name``; nested spans count once"""
+    profile = current()
+    if profile is None:
+        yield
+        return
+    profile.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.depth -= 1
+        if profile.depth == 0:
+            profile.spans[name] += time.perf_counter() - start
+
+
+def timed(name):
+    """Decorator form of ``span``"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current() is not None:
+        conn.info.setdefault('_profile_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current()
+    starts = conn.info.get('_profile_start')
+    if profile is None or not starts:
+        return
+    profile.sql_count += 1
+    profile.sql_seconds += time.perf_counter() - starts.pop()
+
+
+class SlowestProfiles:
+    """The slowest sampled profiles per route, written to disk as they arrive"""
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+        self._routes = {}  # route -> heap of (seconds, path)
+        self._lock = threading.Lock()
+
+    def offer(self, route, seconds, profiler, kind):
+        """Keep the profile if it is among the slowest for ``route``; returns its path or None"""
+        with self._lock:
+            heap = self._routes.setdefault(route, [])
+            if len(heap) >= self.keep and seconds <= heap[0][0]:
+                return None
+            path = os.path.join(self.directory, f'{_slug(route)}-{int(seconds * 1000)}ms-{time.time_ns()}')
+            path += '.prof' if kind == 'cprofile' else '.html'
+            evicted = heapq.heappushpop(heap, (seconds, path)) if len(heap) >= self.keep else None
+            if evicted is None:
+                heapq.heappush(heap, (seconds, path))
+        os.makedirs(self.directory, exist_ok=True)
+        if kind == 'cprofile':
+            profiler.dump_stats(path)
+        else:
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+        if evicted:
+            try:
+                os.remove(evicted[1])
+            except OSError:
+                pass
+        return path
+
+    def stats(self):
+        with self._lock:
+            return {
+                route: [{'ms': round(seconds * 1000, 3), 'file': os.path.basename(path)}
+                        for seconds, path in sorted(heap, reverse=True)]
+                for route, heap in self._routes.items()
+            }
+
+
+def _slug(route):
+    return ''.join(c if c.isalnum() else '_' for c in route).strip('_') or 'root'
+
+
+def _start_profiler(kind):
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active on this thread
+            return None
+        return profiler
+    from pyinstrument import Profiler
+    profiler = Profiler(async_mode='disabled')
+    profiler.start()
+    return profiler
+
+
+def _stop_profiler(profiler, kind):
+    if kind == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.enabled = False
+        self.token = ''
+        self.debug = False
+        self.sample_rate = 0.0
+        self.kind = 'cprofile'
+        self.slowest = None
+        self.profiled = 0
+        self.sampled = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PROFILING_ENABLED', False)
+        self.token = app.config.get('PROFILING_TOKEN', '')
+        self.debug = app.debug
+        self.sample_rate = app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+        self.kind = app.config.get('PROFILING_PROFILER', 'cprofile')
+        if self.kind not in PROFILERS:
+            raise ValueError(f'Unknown PROFILING_PROFILER {self.kind!r}; choose one of: {", ".join(PROFILERS)}')
+        if self.kind == 'pyinstrument' and self.sample_rate:
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                raise ValueError('PROFILING_PROFILER=pyinstrument but pyinstrument is not installed')
+        self.slowest = SlowestProfiles(app.config.get('PROFILING_DIR', 'profiles'),
+                                       app.config.get('PROFILING_KEEP_SLOWEST', 5))
+        self._time_jwt_decode(app)
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _time_jwt_decode(self, app):
+        manager = app.extensions.get('flask-jwt-extended')
+        if manager is None or hasattr(manager._decode_jwt_from_config, '__wrapped__'):
+            return
+        # The one place flask-jwt-extended verifies a token; it has no hook around it
+        manager._decode_jwt_from_config = timed('jwt')(manager._decode_jwt_from_config)
+
+    def wanted(self):
+        """Whether the current request should be profiled"""
+        if self.enabled:
+            return True
+        value = request.headers.get(HEADER)
+        if not value:
+            return False
+        return value == self.token if self.token else self.debug
+
+    def _before_request(self):
+        if not self.wanted():
+            return
+        profile = g._profile = RequestProfile()
+        if self.sample_rate and random.random() < self.sample_rate:
+            profile.profiler = _start_profiler(self.kind)
+
+    def _after_request(self, response):
+        profile = current()
+        if profile is None:
+            return response
+        if profile.profiler:
+            _stop_profiler(profile.profiler, self.kind)
+        timings = profile.timings()
+        route = f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+
+        dump = None
+        if profile.profiler:
+            dump = self.slowest.offer(route, timings['total_ms'] / 1000, profile.profiler, self.kind)
+        with self._lock:
+            self.profiled += 1
+            self.sampled += profile.profiler is not None
+
+        response.headers['Server-Timing'] = ', '.join((
+            f'total;dur={timings["total_ms"]}',
+            f'db;dur={timings["sql_ms"]};desc="{timings["sql_count"]} statements"',
+            f'serialize;dur={timings["serialize_ms"]}',
+            f'jwt;dur={timings["jwt_ms"]}',
+        ))
+        logger.info(json.dumps({
+            'route': route,
+            'path': request.full_path.rstrip('?'),
+            'status': response.status_code,
+            **timings,
+            'profile': dump and os.path.basename(dump),
+        }))
+        return response
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'header': bool(self.token) or self.debug,
+            'profiler': self.kind,
+            'sample_rate': self.sample_rate,
+            'profiled': self.profiled,
+            'sampled': self.sampled,
+            'slowest': self.slowest.stats() if self.slowest else {},
+        }
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,164 @@
+"""
+Full-text search over task and project titles and descriptions.
+
+PostgreSQL matches against the generated ``search_vector`` columns through
+their GIN indexes and ranks with ``ts_rank_cd``. SQLite uses the FTS5 tables
+``tasks_fts`` and ``projects_fts`` and ranks with ``bm25``. Both are created
+by the migrations; see ``models.SEARCH_DDL_*``. Titles weigh more than
+descriptions in both. On SQLite the tasks index also holds who can read
+each task, so a common word costs what the user's own matches cost rather
+than every match in the table.
+
+The query string is reduced to its words (at most ``MAX_TERMS``), which
+must all match; the last one also matches as a prefix (from ``MIN_PREFIX``
+letters), so results show up while typing. Results follow the same access
+rules as the rest of the API: projects the user can read, and tasks
+assigned to them or in a project they can read. They come back ranked, and
+pages continue with an opaque cursor like the collection routes.
+"""
+
+import base64
+import binascii
+import json
+import re
+
+from sqlalchemy import (and_, bindparam, func, literal, literal_column, or_, select, table, column,
+                        tuple_, union_all)
+
+from models import db, Task, Project, SEARCH_TEXT_CONFIG
+from pagination import InvalidQueryParameter
+from permissions import visible
+from serializers import loader_options, serialize
+
+MAX_TERMS = 8
+# Shorter last words only match whole words; a one or two letter prefix
+# matches too much to rank usefully. SQLite keeps prefix indexes for 3 to 5.
+MIN_PREFIX = 3
+TYPES = {'task': Task, 'project': Project}
+
+# FTS5 bm25 column weights: title, description, and the scope of tasks, which
+# only filters
+SQLITE_WEIGHTS = (10.0, 5.0, 0.0)
+
+
+def terms(q):
+    """Words to search for; raises InvalidQueryParameter when there are none"""
+    words = re.findall(r'[^\W_]+', (q or '').lower())[:MAX_TERMS]
+    if not words:
+        raise InvalidQueryParameter('q must contain at least one word to search for')
+    return words
+
+
+def parse_types(value):
+    if not value:
+        return tuple(TYPES)
+    types = tuple(dict.fromkeys(value.split(',')))
+    unknown = [name for name in types if name not in TYPES]
+    if unknown:
+        raise InvalidQueryParameter(f'Unknown type {unknown[0]!r}; choose from: {", ".join(TYPES)}')
+    return types
+
+
+def _match_postgresql(model, words):
+    """(criterion, rank) against the model's tsvector column"""
+    expression = ' & '.join(words[:-1] + [words[-1] + (':*' if len(words[-1]) >= MIN_PREFIX else '')])
+    query = func.to_tsquery(literal(SEARCH_TEXT_CONFIG), bindparam(None, expression))
+    vector = literal_column(f'{model.__tablename__}.search_vector')
+    return vector.op('@@')(query), func.ts_rank_cd(vector, query)
+
+
+def _match_sqlite(model, words, scope=None):
+    """(criterion, rank, fts table) against the model's FTS5 table; higher rank is better"""
+    fts = table(f'{model.__tablename__}_fts', column('rowid'))
+    # Words are letters and digits only, so quoting each one is enough
+    phrases = ' '.join(f'"{word}"' for word in words) + ('*' if len(words[-1]) >= MIN_PREFIX else '')
+    expression = literal('{title description} : (' + phrases + ')')
+    if scope is not None:
+        expression = expression.concat(' AND scope : (').concat(scope).concat(')')
+    name = literal_column(fts.name)
+    return name.op('MATCH')(expression), -func.bm25(name, *SQLITE_WEIGHTS), fts
+
+
+def _task_scope(user_id):
+    """Scope tokens of the tasks the user can read, built in SQL: ``u<user> OR p<project> ...``"""
+    projects = (select(literal(' OR p').concat(func.group_concat(Project.id, ' OR p')))
+                .where(visible(Project, user_id=user_id))
+                .scalar_subquery())
+    return literal(f'u{int(user_id)}').concat(func.coalesce(projects, ''))
+
+
+def _readable(model, user_id):
+    if model is Task:
+        # Tasks show up in the projects they belong to, as well as to their assignee
+        readable_projects = select(Project.id).where(visible(Project, user_id=user_id))
+        return or_(Task.user_id == user_id, Task.project_id.in_(readable_projects))
+    return visible(model, user_id=user_id)
+
+
+def _candidates(name, model, words, user_id, dialect):
+    if dialect == 'postgresql':
+        match, rank = _match_postgresql(model, words)
+        query = select(literal(name).label('type'), model.id.label('id'), rank.label('rank'))
+    elif dialect == 'sqlite' and model is Task:
+        # The index knows who can read each task, so the tasks table isn't needed
+        match, rank, fts = _match_sqlite(model, words, _task_scope(user_id))
+        return select(literal(name).label('type'), fts.c.rowid.label('id'), rank.label('rank')).where(match)
+    elif dialect == 'sqlite':
+        match, rank, fts = _match_sqlite(model, words)
+        query = (select(literal(name).label('type'), model.id.label('id'), rank.label('rank'))
+                 .join(fts, fts.c.rowid == model.id))
+    else:
+        raise NotImplementedError(f'Full-text search is not available on {dialect}')
+    return query.where(match, _readable(model, user_id))
+
+
+def encode_cursor(rank, type, id):
+    payload = json.dumps(['search', rank, type, id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        kind, rank, type, id = json.loads(base64.urlsafe_b64decode(padded))
+        if kind != 'search' or type not in TYPES:
+            raise ValueError(kind)
+        return float(rank), type, int(id)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidQueryParameter('Invalid cursor')
+
+
+def search(q, user_id, limit, types=None, cursor=None):
+    """One page of ``(type, rank, instance)`` results, best first, and the next page's cursor"""
+    words = terms(q)
+    dialect = db.session.get_bind().dialect.name
+    candidates = [_candidates(name, TYPES[name], words, user_id, dialect) for name in types or TYPES]
+    results = (union_all(*candidates) if len(candidates) > 1 else candidates[0]).subquery('results')
+
+    query = select(results.c.type, results.c.id, results.c.rank)
+    if cursor:
+        rank, type, id = decode_cursor(cursor)
+        query = query.where(or_(results.c.rank < rank,
+                                and_(results.c.rank == rank,
+                                     tuple_(results.c.type, results.c.id) > tuple_(type, id))))
+    rows = db.session.execute(
+        query.order_by(results.c.rank.desc(), results.c.type, results.c.id).limit(limit + 1)
+    ).all()
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.rank, last.type, last.id)
+    rows = rows[:limit]
+
+    # One query per type for the rows themselves
+    loaded = {}
+    for name, model in TYPES.items():
+        ids = [id for type, id, _ in rows if type == name]
+        if ids:
+            instances = model.query.options(*loader_options(model, 'summary')).filter(model.id.in_(ids))
+            loaded.update(((name, instance.id), instance) for instance in instances)
+    return [(type, rank, loaded[type, id]) for type, id, rank in rows if (type, id) in loaded], next_cursor
+
+
+def result(type, rank, instance):
+    return {'type': type, 'rank': round(float(rank), 6), type: serialize(instance, 'summary')}
@@ -1,12 +1,66 @@
+"""
+Seed the database.
+
+    python seed.py                      # a handful of demo users, projects and tasks
+    python seed.py --users 100000 --projects 20000 --tasks 5000000
+
+With sizes, generates a synthetic dataset with batched bulk inserts (COPY on
+PostgreSQL with psycopg2) instead of one ORM object at a time. Either way the
+schema is rebuilt from the migrations first.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import time
+import bcrypt
+from flask_migrate import upgrade
 from app import app
 from models import db, User, Task, Project, ProjectCollaborator
 from datetime import datetime, timedelta
 
+STATUSES = ('pending', 'in_progress', 'completed')
+PRIORITIES = ('low', 'medium', 'high')
+
+# Vocabulary for synthetic titles and descriptions, so text search has terms
+# of varied frequency to find. Co-prime lengths spread the combinations.
+VERBS = ('review', 'draft', 'update', 'fix', 'migrate', 'design', 'test', 'deploy', 'document',
+         'refactor', 'plan', 'audit', 'schedule', 'prepare', 'publish', 'analyze', 'optimize',
+         'archive', 'translate', 'approve', 'estimate', 'negotiate', 'onboard', 'benchmark',
+         'investigate', 'configure', 'upgrade', 'monitor', 'summarize', 'present', 'validate')
+NOUNS = ('invoice', 'dashboard', 'newsletter', 'contract', 'roadmap', 'budget', 'release', 'website',
+         'database', 'report', 'workshop', 'campaign', 'prototype', 'survey', 'backlog', 'checklist',
+         'proposal', 'interview', 'inventory', 'payroll', 'sprint', 'landing page', 'api', 'mockup',
+         'onboarding guide', 'press kit', 'style guide', 'test plan', 'integration', 'server',
+         'firewall', 'license', 'vendor list', 'webinar', 'podcast', 'brochure', 'timeline',
+         'wireframe', 'spreadsheet', 'policy', 'handbook', 'milestone', 'audit log', 'pipeline',
+         'forecast', 'retrospective', 'keynote')
+ADJECTIVES = ('quarterly', 'urgent', 'internal', 'customer', 'annual', 'weekly', 'draft', 'legacy',
+              'mobile', 'regional', 'shared', 'public', 'private', 'critical', 'optional', 'new',
+              'monthly', 'external', 'pending', 'final', 'secure', 'global', 'local', 'beta',
+              'premium', 'seasonal', 'experimental', 'archived', 'priority')
+AREAS = ('marketing', 'finance', 'engineering', 'sales', 'support', 'design', 'legal', 'operations',
+         'research', 'product', 'security', 'hr', 'data', 'infrastructure', 'partnerships',
+         'education', 'compliance', 'logistics', 'procurement', 'analytics', 'content', 'quality',
+         'facilities')
+
+# Every synthetic user's password. It is hashed once per seeding, at the
+# lowest bcrypt cost; a login upgrades the hash to the configured cost.
+SYNTHETIC_PASSWORD = 'synthetic-password'
+SYNTHETIC_PASSWORD_ROUNDS = 4
+
+def reset_schema():
+    """Drop everything and rebuild the schema from the migrations"""
+    db.drop_all()
+    db.session.execute(db.text('DROP TABLE IF EXISTS alembic_version'))
+    db.session.commit()
+    upgrade()
+
 def seed_data():
     with app.app_context():
-        # Clear existing data
-        db.drop_all()
-        db.create_all()
+        # Clear existing data and rebuild the schema from the migrations
+        reset_schema()
         
         # Create users
         user1 = User(username='steve', email='steve@example.com')
@@ -159,5 +213,119 @@ def seed_data():
         print(f"Created {len([collab1, collab2, collab3, collab4, collab5, collab6, collab7, collab8])} project collaborations")
         print(f"Created {len(tasks)} tasks")
 
+def synthetic_users(count, now):
+    password_hash = bcrypt.hashpw(SYNTHETIC_PASSWORD.encode('utf-8'),
+                                  bcrypt.gensalt(SYNTHETIC_PASSWORD_ROUNDS)).decode('utf-8')
+    for i in range(1, count + 1):
+        yield {'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+               'password_hash': password_hash, 'created_at': now, 'updated_at': now}
+
+def synthetic_projects(count, users, now):
+    for i in range(1, count + 1):
+        yield {'id': i, 'title': f'Project {i}: {AREAS[i % len(AREAS)]} {NOUNS[i % len(NOUNS)]}',
+               'description': f'{ADJECTIVES[i % len(ADJECTIVES)]} {NOUNS[(i * 3) % len(NOUNS)]} '
+                              f'work for the {AREAS[(i * 5) % len(AREAS)]} team',
+               'owner_id': (i % users) + 1, 'created_at': now, 'updated_at': now}
+
+def synthetic_collaborators(projects, users, per_project, now):
+    """Up to ``per_project`` members per project: the users right after its owner"""
+    for project_id in range(1, projects + 1):
+        owner_id = (project_id % users) + 1
+        for offset in range(1, per_project + 1):
+            user_id = ((owner_id - 1 + offset) % users) + 1
+            if user_id != owner_id:
+                yield {'user_id': user_id, 'project_id': project_id, 'role': 'member',
+                       'created_at': now, 'updated_at': now}
+
+def synthetic_tasks(count, users, projects, now):
+    for i in range(1, count + 1):
+        yield {'id': i, 'title': f'Task {i}: {VERBS[i % len(VERBS)]} {NOUNS[(i // 3) % len(NOUNS)]}',
+               'description': f'{ADJECTIVES[i % len(ADJECTIVES)]} {NOUNS[(i * 7) % len(NOUNS)]} '
+                              f'for the {AREAS[(i // 5) % len(AREAS)]} team',
+               'status': STATUSES[i % 3], 'priority': PRIORITIES[i % 3],
+               'due_date': now + timedelta(days=i % 30) if i % 4 else None,
+               'user_id': (i % users) + 1, 'project_id': (i % projects) + 1 if i % 5 and projects else None,
+               'created_at': now, 'updated_at': now}
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def _copy(table, batch):
+    """COPY one batch through the session's psycopg2 connection"""
+    columns = list(batch[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        # Unquoted empty fields are NULL in CSV COPY; no synthetic text is empty
+        writer.writerow(['' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY {table.name} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+def bulk_insert(table, rows, batch_size=10000):
+    """Insert generated rows in batches; returns the number inserted"""
+    use_copy = db.engine.dialect.driver == 'psycopg2'
+    count = 0
+    for batch in _batches(rows, batch_size):
+        if use_copy:
+            _copy(table, batch)
+        else:
+            db.session.execute(table.insert(), batch)
+        count += len(batch)
+    return count
+
+def insert_synthetic(users=10, projects=20, tasks=10000, collaborators_per_project=3, batch_size=10000,
+                     verbose=False):
+    """Insert a synthetic dataset into an empty schema, in the current app context.
+
+    Ownership is a pure function of the ids, so benchmarks can rely on it:
+    project ``p`` belongs to user ``p % users + 1`` and task ``t`` is
+    assigned to user ``t % users + 1``. User ``i`` logs in as ``user<i>``
+    with ``SYNTHETIC_PASSWORD``.
+    """
+    now = datetime.utcnow()
+    steps = (
+        (User.__table__, synthetic_users(users, now)),
+        (Project.__table__, synthetic_projects(projects, users, now)),
+        (ProjectCollaborator.__table__, synthetic_collaborators(projects, users, collaborators_per_project, now)),
+        (Task.__table__, synthetic_tasks(tasks, users, projects, now)),
+    )
+    for table, rows in steps:
+        start = time.perf_counter()
+        count = bulk_insert(table, rows, batch_size)
+        if verbose:
+            print(f"Inserted {count} {table.name} in {time.perf_counter() - start:.1f}s")
+    if db.engine.dialect.name == 'postgresql':
+        # Rows came with explicit ids; move the sequences past them
+        for table in (User.__table__, Project.__table__, ProjectCollaborator.__table__, Task.__table__):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table.name}), false)"
+            ))
+    db.session.commit()
+
+def seed_synthetic(users, projects, tasks, collaborators_per_project=3, batch_size=10000):
+    with app.app_context():
+        reset_schema()
+        start = time.perf_counter()
+        insert_synthetic(users, projects, tasks, collaborators_per_project, batch_size, verbose=True)
+        print(f"Database seeded in {time.perf_counter() - start:.1f}s")
+
 if __name__ == '__main__':
-    seed_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Seed the database with demo or synthetic data')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--projects', type=int)
+    parser.add_argument('--tasks', type=int)
+    parser.add_argument('--collaborators', type=int, default=3, help='collaborators per project')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args()
+    if args.users is None and args.projects is None and args.tasks is None:
+        seed_data()
+    else:
+        seed_synthetic(args.users or 10, args.projects or 0, args.tasks or 0,
+                       args.collaborators, args.batch_size)
\ No newline at end of file
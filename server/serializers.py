@@ -0,0 +1,199 @@
+"""
+Precompiled response serializers.
+
+Each model has a small set of named response shapes. A shape lists the
+columns it emits and, for nested objects, ``(relationship, shape)`` pairs.
+Shapes are compiled once into plain functions and cached, so serializing a
+row is a tuple fetch plus a dict build instead of a walk over
+``serialize_rules``.
+
+Serializers never trigger lazy loads: a relationship is only emitted when it
+is already present on the instance. Use ``loader_options()`` to get the
+eager-loading options that populate everything a shape needs.
+"""
+
+from operator import attrgetter
+
+from sqlalchemy import Date, DateTime
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.attributes import instance_state
+
+from models import User, Task, Project, ProjectCollaborator
+from profiling import timed
+
+# Same formats SerializerMixin.to_dict() uses, so clients see no change
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DATE_FORMAT = '%Y-%m-%d'
+
+# Nested shapes may go at most this many relationships deep
+MAX_DEPTH = 3
+
+USER_FIELDS = ('id', 'username', 'email', 'created_at', 'updated_at')
+PROJECT_FIELDS = ('id', 'title', 'description', 'owner_id', 'created_at', 'updated_at')
+TASK_FIELDS = ('id', 'title', 'description', 'status', 'priority', 'due_date',
+               'user_id', 'project_id', 'created_at', 'updated_at')
+COLLABORATOR_FIELDS = ('id', 'user_id', 'project_id', 'role', 'created_at', 'updated_at')
+
+SHAPES = {
+    User: {
+        'summary': ('id', 'username'),
+        'detail': USER_FIELDS,
+        'with-relations': USER_FIELDS + (
+            ('owned_projects', 'summary'),
+            ('project_collaborations', 'summary'),
+        ),
+    },
+    Project: {
+        'summary': ('id', 'title', 'owner_id'),
+        'detail': PROJECT_FIELDS,
+        'with-relations': PROJECT_FIELDS + (
+            ('owner', 'detail'),
+            ('tasks', 'detail'),
+            ('collaborators', 'member'),
+        ),
+    },
+    Task: {
+        'summary': ('id', 'title', 'status', 'priority', 'due_date', 'project_id'),
+        'detail': TASK_FIELDS,
+        'with-relations': TASK_FIELDS + (
+            ('user', 'detail'),
+            ('project', 'detail'),
+        ),
+    },
+    ProjectCollaborator: {
+        'summary': ('id', 'user_id', 'project_id', 'role'),
+        'detail': COLLABORATOR_FIELDS,
+        # Collaborator as listed under its project: the project is the parent
+        'member': COLLABORATOR_FIELDS + (
+            ('user', 'detail'),
+        ),
+        'with-relations': COLLABORATOR_FIELDS + (
+            ('user', 'detail'),
+            ('project', 'detail'),
+        ),
+    },
+}
+
+
+class Serializer:
+    """A compiled serializer for one model and shape"""
+
+    def __init__(self, model, shape, columns, relations):
+        self.model = model
+        self.shape = shape
+        self.columns = columns
+        self.relations = relations
+        self._serialize = _compile(model, columns, relations)
+
+    def __call__(self, obj):
+        return self._serialize(obj)
+
+    def many(self, objs):
+        serialize = self._serialize
+        return [serialize(obj) for obj in objs]
+
+    def loader_options(self):
+        """Eager-loading options that populate every relationship this shape emits"""
+        options = []
+        for name, child, uselist in self.relations:
+            attr = getattr(self.model, name)
+            loader = selectinload(attr) if uselist else joinedload(attr)
+            child_options = child.loader_options()
+            if child_options:
+                loader = loader.options(*child_options)
+            options.append(loader)
+        return options
+
+    def __repr__(self):
+        return f'<Serializer {self.model.__name__}:{self.shape}>'
+
+
+_compiled = {}
+
+
+def get_serializer(model, shape='detail'):
+    """Return the cached serializer for a model and shape, compiling it on first use"""
+    key = (model, shape)
+    serializer = _compiled.get(key)
+    if serializer is None:
+        serializer = _build(model, shape, 0)
+        _compiled[key] = serializer
+    return serializer
+
+
+@timed('serialize')
+def serialize(obj, shape='detail'):
+    """Serialize a single model instance"""
+    return get_serializer(type(obj), shape)(obj)
+
+
+@timed('serialize')
+def serialize_many(model, objs, shape='detail'):
+    """Serialize an iterable of instances of one model"""
+    return get_serializer(model, shape).many(objs)
+
+
+def loader_options(model, shape='detail'):
+    return get_serializer(model, shape).loader_options()
+
+
+def _build(model, shape, depth):
+    if depth > MAX_DEPTH:
+        raise ValueError(f'Serializer shape {model.__name__}:{shape} nests deeper than {MAX_DEPTH}')
+    try:
+        fields = SHAPES[model][shape]
+    except KeyError:
+        raise ValueError(f'Unknown serializer shape {model.__name__}:{shape}')
+
+    columns = []
+    relations = []
+    mapper_relationships = model.__mapper__.relationships
+    for field in fields:
+        if isinstance(field, tuple):
+            name, child_shape = field
+            prop = mapper_relationships[name]
+            child = _compiled.get((prop.mapper.class_, child_shape))
+            if child is None:
+                child = _build(prop.mapper.class_, child_shape, depth + 1)
+            relations.append((name, child, prop.uselist))
+        else:
+            columns.append(field)
+    return Serializer(model, shape, tuple(columns), tuple(relations))
+
+
+def _compile(model, columns, relations):
+    table_columns = model.__table__.columns
+    converters = []
+    for name in columns:
+        column_type = table_columns[name].type
+        if isinstance(column_type, DateTime):
+            converters.append((name, DATETIME_FORMAT))
+        elif isinstance(column_type, Date):
+            converters.append((name, DATE_FORMAT))
+
+    # attrgetter returns a bare value for a single attribute, a tuple otherwise
+    if len(columns) == 1:
+        single = attrgetter(columns[0])
+        getter = lambda obj: (single(obj),)
+    else:
+        getter = attrgetter(*columns)
+
+    def serialize(obj):
+        data = dict(zip(columns, getter(obj)))
+        for name, fmt in converters:
+            value = data[name]
+            if value is not None:
+                data[name] = value.strftime(fmt)
+        if relations:
+            loaded = instance_state(obj).dict
+            for name, child, uselist in relations:
+                if name not in loaded:
+                    continue
+                value = loaded[name]
+                if uselist:
+                    data[name] = child.many(value)
+                else:
+                    data[name] = child(value) if value is not None else None
+        return data
+
+    return serialize
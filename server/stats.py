@@ -0,0 +1,167 @@
+"""
+Dashboard statistics computed in SQL.
+
+``user_stats()`` summarises the caller's tasks and the progress of every
+project they can see. ``project_stats()`` does the same for one project and
+adds the workload of each member. Each view costs two aggregate queries,
+however many tasks there are.
+
+Counts come from ``STATS_SOURCE``:
+
+- ``summary`` (default): the ``task_counts`` rows that triggers on ``tasks``
+  keep current (see ``models.TaskCount``). Cost grows with the number of
+  (assignee, project, status, priority) groups, not with tasks.
+- ``tasks``: ``GROUP BY`` over the tasks table itself.
+
+Overdue counts depend on the clock, so they always come from ``tasks``, via
+the partial indexes on open tasks by due date. Their cost grows with the
+number of open tasks that have a due date, not with all tasks.
+"""
+
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, case, func, literal, literal_column, select, union
+
+from models import db, User, Task, Project, ProjectCollaborator, TaskCount
+from permissions import visible
+
+STATUSES = ('pending', 'in_progress', 'completed')
+PRIORITIES = ('low', 'medium', 'high')
+COMPLETED = 'completed'
+
+SOURCES = ('summary', 'tasks')
+
+
+def counts_source():
+    """Rows of (user_id, project_id, status, priority, task_count), from the summary or from tasks"""
+    source = current_app.config.get('STATS_SOURCE', 'summary')
+    if source not in SOURCES:
+        raise ValueError(f'Unknown STATS_SOURCE {source!r}; choose one of: {", ".join(SOURCES)}')
+    if source == 'summary':
+        return TaskCount.__table__.alias('counts')
+    return select(
+        Task.user_id,
+        func.coalesce(Task.project_id, 0).label('project_id'),
+        func.coalesce(Task.status, '').label('status'),
+        func.coalesce(Task.priority, '').label('priority'),
+        literal(1).label('task_count'),
+    ).subquery('counts')
+
+
+def _overdue(*criteria):
+    """Scalar subquery counting open tasks past their due date"""
+    return (select(func.count())
+            .select_from(Task)
+            .where(Task.status != literal_column("'completed'"),  # inline to match the partial index
+                   Task.due_date < datetime.utcnow(), *criteria)
+            .scalar_subquery())
+
+
+def _summary(rows):
+    """Totals by status and priority from (status, priority, count, overdue) rows; all zero without rows"""
+    by_status = dict.fromkeys(STATUSES, 0)
+    by_priority = dict.fromkeys(PRIORITIES, 0)
+    overdue = 0
+    for status, priority, count, row_overdue in rows:
+        count = int(count or 0)
+        by_status[status or 'none'] = by_status.get(status or 'none', 0) + count
+        by_priority[priority or 'none'] = by_priority.get(priority or 'none', 0) + count
+        # The same scalar subquery on every row: one total, not a per-group count to add up
+        overdue = max(overdue, int(row_overdue or 0))
+    total = sum(by_status.values())
+    return {
+        'total': total,
+        'by_status': by_status,
+        'by_priority': by_priority,
+        'overdue': overdue,
+        'completion_pct': _percent(by_status[COMPLETED], total),
+    }
+
+
+def _percent(part, total):
+    return round(part * 100 / total, 1) if total else 0.0
+
+
+def _grouped_counts(counts, *criteria):
+    """Task counts by status and priority over the matching groups"""
+    return (select(counts.c.status, counts.c.priority, func.sum(counts.c.task_count))
+            .where(*criteria)
+            .group_by(counts.c.status, counts.c.priority)
+            .having(func.sum(counts.c.task_count) > 0))
+
+
+def user_stats(user_id, project_limit):
+    """The user's own tasks, and progress of up to ``project_limit`` projects they can see"""
+    counts = counts_source()
+    overdue = _overdue(Task.user_id == user_id)
+    rows = db.session.execute(
+        _grouped_counts(counts, counts.c.user_id == user_id).add_columns(overdue)
+    ).all()
+
+    completed = func.sum(case((counts.c.status == COMPLETED, counts.c.task_count), else_=0))
+    projects = db.session.execute(
+        select(Project.id, Project.title,
+               func.coalesce(func.sum(counts.c.task_count), 0),
+               func.coalesce(completed, 0),
+               _overdue(Task.project_id == Project.id))
+        .outerjoin(counts, counts.c.project_id == Project.id)
+        .where(visible(Project, user_id=user_id))
+        .group_by(Project.id, Project.title)
+        .order_by(Project.id)
+        .limit(project_limit + 1)
+    ).all()
+    return {
+        'tasks': _summary(rows),
+        'projects': [_progress(*row) for row in projects[:project_limit]],
+        'more_projects': len(projects) > project_limit,
+    }
+
+
+def project_stats(project_id):
+    """One project's tasks, and the workload of its owner, collaborators and assignees"""
+    counts = counts_source()
+    rows = db.session.execute(
+        _grouped_counts(counts, counts.c.project_id == project_id)
+        .add_columns(_overdue(Task.project_id == project_id))
+    ).all()
+
+    # Members with no tasks still show up, and so do assignees who left the project
+    members = union(
+        select(Project.owner_id.label('user_id')).where(Project.id == project_id),
+        select(ProjectCollaborator.user_id).where(ProjectCollaborator.project_id == project_id),
+        select(counts.c.user_id).where(counts.c.project_id == project_id, counts.c.task_count > 0),
+    ).subquery('members')
+    completed = func.sum(case((counts.c.status == COMPLETED, counts.c.task_count), else_=0))
+    workload = db.session.execute(
+        select(User.id, User.username,
+               func.coalesce(func.sum(counts.c.task_count), 0),
+               func.coalesce(completed, 0),
+               _overdue(Task.project_id == project_id, Task.user_id == User.id))
+        .select_from(members)
+        .join(User, User.id == members.c.user_id)
+        .outerjoin(counts, and_(counts.c.user_id == User.id, counts.c.project_id == project_id))
+        .group_by(User.id, User.username)
+        .order_by(User.id)
+    ).all()
+    return {
+        'project_id': project_id,
+        'tasks': _summary(rows),
+        'workload': [
+            {'user_id': id, 'username': username, 'total': int(total), 'open': int(total) - int(done),
+             'completed': int(done), 'overdue': int(overdue)}
+            for id, username, total, done, overdue in workload
+        ],
+    }
+
+
+def _progress(id, title, total, completed, overdue):
+    total, completed = int(total), int(completed)
+    return {
+        'id': id,
+        'title': title,
+        'total': total,
+        'completed': completed,
+        'overdue': int(overdue),
+        'completion_pct': _percent(completed, total),
+    }
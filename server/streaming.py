@@ -0,0 +1,72 @@
+"""
+Streamed collection responses.
+
+A client that asks for ``Accept: application/x-ndjson``, or passes
+``stream=true``, gets the whole collection in one response instead of a
+page. Rows come off a server-side cursor (``yield_per``) and are written out
+in batches as they are serialized, so memory stays flat however many rows
+match:
+
+- ``application/x-ndjson``: one compact JSON object per line
+- ``stream=true``: a compact JSON array, written incrementally
+
+Filters, ``sort`` and ``cursor`` apply as for pages; ``limit`` does not.
+"""
+
+from flask import request, current_app, stream_with_context
+
+from pagination import order
+from serializers import get_serializer
+
+NDJSON = 'application/x-ndjson'
+
+
+def wants_ndjson():
+    return request.accept_mimetypes.best_match(('application/json', NDJSON)) == NDJSON
+
+
+def requested():
+    """Whether the request asks for a streamed collection"""
+    return request.args.get('stream') == 'true' or wants_ndjson()
+
+
+def stream_response(model, query, shape):
+    """Stream every row ``query`` matches, in the requested order and format"""
+    query, _, _ = order(query, model, request.args)
+    batch_size = current_app.config['STREAM_BATCH_SIZE']
+    rows = query.yield_per(batch_size)
+    serialize = get_serializer(model, shape)
+    encode = current_app.json.encoder(compact=True)
+    if wants_ndjson():
+        body = _ndjson(rows, serialize, encode, batch_size)
+        mimetype = NDJSON
+    else:
+        body = _json_array(rows, serialize, encode, batch_size)
+        mimetype = 'application/json'
+    return current_app.response_class(stream_with_context(body), mimetype=mimetype)
+
+
+def _batches(rows, serialize, encode, batch_size):
+    """Encoded rows, ``batch_size`` at a time"""
+    batch = []
+    for row in rows:
+        batch.append(encode(serialize(row)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ndjson(rows, serialize, encode, batch_size):
+    for batch in _batches(rows, serialize, encode, batch_size):
+        yield b'\n'.join(batch) + b'\n'
+
+
+def _json_array(rows, serialize, encode, batch_size):
+    yield b'['
+    separator = b''
+    for batch in _batches(rows, serialize, encode, batch_size):
+        yield separator + b','.join(batch)
+        separator = b','
+    yield b']'
@@ -0,0 +1,145 @@
+"""
+Incremental sync: the tasks, projects and collaborator records that changed
+since a token.
+
+Changes come from the ``changes`` log that triggers keep (see
+``models.Change``), one row per user who should hear about each change, so a
+poll reads the caller's own rows after the token through an index: its cost
+follows what changed, not how much data there is.
+
+A client starts with ``GET /sync`` (no ``since``) to get a token, loads the
+collections as usual, then polls ``GET /sync?since=<token>`` with each
+response's token. A record that changed several times shows up once, as it
+is now; deleted records, and records the caller can no longer see, are
+listed under ``deleted``. When ``more`` is true, poll again straight away.
+Records may repeat across responses, so apply them idempotently. Tokens
+older than ``SYNC_RETENTION_DAYS`` get 410 Gone: load everything again.
+
+Visibility follows the collection routes: tasks assigned to the caller,
+projects they can read and the collaborators of those projects.
+"""
+
+import base64
+import binascii
+import json
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import BigInteger, Text, cast, delete, func, select, tuple_
+
+from models import db, Change, Task, Project, ProjectCollaborator
+from pagination import InvalidQueryParameter
+from permissions import visible
+from serializers import loader_options, serialize
+
+# Change kind -> (model, key in the response)
+KINDS = {
+    'task': (Task, 'tasks'),
+    'project': (Project, 'projects'),
+    'collaborator': (ProjectCollaborator, 'collaborators'),
+}
+
+
+class TokenExpired(Exception):
+    """The changes after a sync token may have been pruned"""
+
+
+def encode_token(position, id):
+    payload = json.dumps(['sync', position, id, int(time.time())], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).rstrip(b'=').decode('ascii')
+
+
+def decode_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        kind, position, id, issued = json.loads(base64.urlsafe_b64decode(padded))
+        if kind != 'sync':
+            raise ValueError(kind)
+        position, id, issued = int(position), int(id), int(issued)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidQueryParameter('Invalid sync token')
+    if issued < time.time() - current_app.config['SYNC_RETENTION_DAYS'] * 86400:
+        raise TokenExpired('Sync token expired; load everything again and start from a new token')
+    return position, id
+
+
+def _horizon():
+    """On PostgreSQL, the oldest transaction still running, or None.
+
+    Changes are ordered by the transaction that wrote them, and a change
+    from a transaction that hasn't committed yet is invisible. Stopping
+    before the oldest running transaction means a later poll can't find an
+    older change the token has already gone past.
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return None
+    return cast(cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), Text), BigInteger)
+
+
+def head():
+    """A token for changes from now on"""
+    horizon = _horizon()
+    if horizon is not None:
+        return encode_token(db.session.scalar(select(horizon)), 0)
+    return encode_token(0, db.session.scalar(select(func.coalesce(func.max(Change.id), 0))))
+
+
+def changes_since(token, user_id, limit):
+    """The records that changed for the user after ``token``, up to ``limit`` changes"""
+    position, after = decode_token(token)
+    query = (select(Change.position, Change.id, Change.kind, Change.record_id, Change.deleted)
+             .where(Change.user_id == user_id))
+    horizon = _horizon()
+    if horizon is not None:
+        query = query.where(tuple_(Change.position, Change.id) > tuple_(position, after),
+                            Change.position < horizon)
+    else:
+        # Position is always 0 here; comparing it for equality lets the index
+        # seek on id as well
+        query = query.where(Change.position == position, Change.id > after)
+    rows = db.session.execute(query.order_by(Change.position, Change.id).limit(limit + 1)).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        position, after = rows[-1].position, rows[-1].id
+
+    # The last change of each record decides; the record itself is read as it is now
+    latest = {}
+    for row in rows:
+        latest[row.kind, row.record_id] = row.deleted
+    result = {key: [] for _, key in KINDS.values()}
+    deleted = {key: [] for _, key in KINDS.values()}
+    for kind, (model, key) in KINDS.items():
+        ids = [id for (change_kind, id), gone in latest.items() if change_kind == kind and not gone]
+        found = set()
+        if ids:
+            instances = (model.query.options(*loader_options(model))
+                         .filter(model.id.in_(ids), visible(model, user_id=user_id))
+                         .order_by(model.id))
+            for instance in instances:
+                found.add(instance.id)
+                result[key].append(serialize(instance))
+        # Deleted, or no longer visible to the user
+        deleted[key] = sorted(id for (change_kind, id) in latest
+                              if change_kind == kind and id not in found)
+    return dict(result, deleted=deleted, token=encode_token(position, after), more=more)
+
+
+def prune(before):
+    """Delete changes logged before ``before``; returns how many"""
+    result = db.session.execute(delete(Change).where(Change.changed_at < before))
+    db.session.commit()
+    return result.rowcount
+
+
+@click.command('prune-changes')
+@with_appcontext
+def prune_changes_command():
+    """Delete sync changes older than SYNC_RETENTION_DAYS, which no valid token needs."""
+    days = current_app.config['SYNC_RETENTION_DAYS']
+    # A day's margin: on PostgreSQL a change is stamped when its transaction began
+    count = prune(datetime.utcnow() - timedelta(days=days + 1))
+    click.echo(f'Deleted {count} changes older than {days} days')